@@ -0,0 +1,65 @@
+"""
+Benchmark: editing one bar of a BarPattern vs re-rendering the whole beat.
+
+For 16, 64 and 256 bar beats measures regenerating one bar plus
+re-serialization with the incremental bar model, against a full
+generate_hiphop_beat render into memory.
+
+    python benchmarks/bench_bar_edit.py
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator.bar_pattern import BarPattern
+from fl_midi_generator.midi_generator import generate_hiphop_beat
+
+DURATIONS = [16, 64, 256]
+
+
+def median_ms(run, repeats):
+    times = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        run(i)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeats", type=int, default=200, help="edits per measurement")
+    args = parser.parse_args(argv)
+
+    print(f"{'bars':>5} {'regenerate ms':>14} {'mutate ms':>10} {'full render ms':>15} {'speedup':>8}")
+    for duration in DURATIONS:
+        pattern = BarPattern.hiphop(duration, tempo=90, seed=1)
+        pattern.to_bytes()
+        edited = duration // 2
+
+        def regenerate(i):
+            pattern.regenerate_bar(edited, random.Random(i))
+            pattern.to_bytes()
+
+        def mutate(i):
+            # Убираем хай-хэт в такте и возвращаем его обратно
+            notes = pattern.bar(edited)
+            pattern.set_bar(edited, [note for note in notes if note[0] != 2])
+            pattern.set_bar(edited, notes)
+            pattern.to_bytes()
+
+        regenerate_ms = median_ms(regenerate, args.repeats)
+        mutate_ms = median_ms(mutate, args.repeats)
+        full_ms = median_ms(lambda i: generate_hiphop_beat(None, duration, 90, seed=i), args.repeats)
+        print(f"{duration:>5} {regenerate_ms:>14.3f} {mutate_ms:>10.3f} {full_ms:>15.3f} "
+              f"{full_ms / regenerate_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
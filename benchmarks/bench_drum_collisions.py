@@ -0,0 +1,120 @@
+"""
+Benchmark: bitmask drum collision resolver vs a per-hit dict grid.
+
+Dense patterns: eight percussion voices on a 32nd-note grid, collisions
+resolved by priority, a hihat roll on beat 4 of every bar and a snare fill
+in the last beat. The dict approach walks every hit and checks a
+drum_grid dict (step -> voice); the bitmask approach does a few bitwise
+operations per voice and bar (drum_masks). Both give the same hits.
+
+    python benchmarks/bench_drum_collisions.py --bars 16
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from fl_midi_generator.drum_masks import (
+    MASK_STEPS_PER_BAR, beat_mask, every_step_mask, hat_roll, hits_to_masks, insert_fill, masks_to_hits,
+    resolve_collisions,
+)
+
+VOICES = ("kick", "snare", "clap", "rim", "open_hat", "hihat", "shaker", "ghost")
+PRIORITY = ("snare", "clap", "rim", "open_hat", "hihat", "shaker", "ghost")
+OVERLAP = ("kick",)
+DENSITY = 0.45
+
+
+def dict_pipeline(hits, bars):
+    # Подход с drum_grid: словарь шаг -> голос, проверка на каждый удар
+    steps = MASK_STEPS_PER_BAR
+    rank = {voice: i for i, voice in enumerate(PRIORITY)}
+    drum_grid = {}
+    result = {voice: set() for voice in VOICES}
+
+    def place(voice, step):
+        if voice in OVERLAP:
+            result[voice].add(step)
+            return
+        owner = drum_grid.get(step)
+        if owner is None or rank[voice] < rank[owner]:
+            if owner is not None:
+                result[owner].discard(step)
+            drum_grid[step] = voice
+            result[voice].add(step)
+
+    for voice in VOICES:
+        for step in hits[voice]:
+            place(voice, step)
+    # Ролл хай-хэта: каждая 32-я на четвертой доле каждого такта
+    for bar in range(bars):
+        for step in range(bar * steps + 3 * steps // 4, (bar + 1) * steps):
+            place("hihat", step)
+    # Брейк: последняя доля последнего такта - только малый барабан
+    fill_start = bars * steps - steps // 4
+    for voice in VOICES:
+        for step in [step for step in result[voice] if step >= fill_start]:
+            result[voice].discard(step)
+            drum_grid.pop(step, None)
+    for step in range(fill_start, bars * steps, 2):
+        place("snare", step)
+    return {voice: sorted(result[voice]) for voice in VOICES}
+
+
+def mask_pipeline(masks, bars):
+    rules = {"priority": PRIORITY, "overlap_allowed": OVERLAP}
+    masks = resolve_collisions(masks, **rules)
+    masks = hat_roll(masks, beat_mask(3), **rules)
+    region = np.zeros(bars, dtype=np.uint64)
+    region[-1] = beat_mask(3)
+    fill = every_step_mask(MASK_STEPS_PER_BAR, 2)  # малый на каждой шестнадцатой
+    return insert_fill(masks, {"snare": fill}, region, **rules)
+
+
+def timed(run, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    return (time.perf_counter() - started) / repeats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bars", type=int, default=16, help="bars per pattern")
+    parser.add_argument("-n", "--repeats", type=int, default=200, help="patterns per measurement")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    steps = args.bars * MASK_STEPS_PER_BAR
+    hit_arrays = {voice: rng.random(steps) < DENSITY for voice in VOICES}
+    hit_lists = {voice: [int(step) for step in np.flatnonzero(hits)] for voice, hits in hit_arrays.items()}
+    masks = {voice: hits_to_masks(hits, MASK_STEPS_PER_BAR) for voice, hits in hit_arrays.items()}
+
+    expected = dict_pipeline(hit_lists, args.bars)
+    got = mask_pipeline(masks, args.bars)
+    for voice in VOICES:
+        assert list(np.flatnonzero(masks_to_hits(got[voice], MASK_STEPS_PER_BAR))) == expected[voice], voice
+
+    hits = sum(len(steps) for steps in hit_lists.values())
+    dict_seconds = timed(lambda: dict_pipeline(hit_lists, args.bars), args.repeats)
+    mask_seconds = timed(lambda: mask_pipeline(masks, args.bars), args.repeats)
+
+    batch = 10000
+    batch_masks = {voice: hits_to_masks(rng.random((batch, steps)) < DENSITY, MASK_STEPS_PER_BAR)
+                   for voice in VOICES}
+    batch_seconds = timed(lambda: mask_pipeline(batch_masks, args.bars), 5) / batch
+
+    print(f"{len(VOICES)} voices, {args.bars} bars of 32nds, {hits} hits per pattern")
+    print(f"{'approach':>18} {'us/pattern':>11} {'speedup':>8}")
+    print(f"{'dict drum_grid':>18} {dict_seconds * 1e6:>11.1f} {1:>7.1f}x")
+    print(f"{'bitmask':>18} {mask_seconds * 1e6:>11.1f} {dict_seconds / mask_seconds:>7.1f}x")
+    print(f"{'bitmask, batch':>18} {batch_seconds * 1e6:>11.2f} {dict_seconds / batch_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Benchmark: vectorized drum pattern generation.
+
+Measures how many four-bar drum patterns per second the step-matrix engine
+produces when generating whole batches at once, on one core.
+
+    python benchmarks/bench_drum_patterns.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import generate_drum_matrix, generate_drum_patterns
+
+BATCH_SIZES = [1, 100, 1000, 10000, 100000]
+BARS = 4
+
+
+def main():
+    rng = np.random.default_rng(1)
+    print(f"{'batch':>8} {'ms':>10} {'patterns/s':>12}")
+    for count in BATCH_SIZES:
+        repeat = max(1, 20000 // count)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            generate_drum_patterns(count, BARS, rng=rng)
+        elapsed = (time.perf_counter() - started) / repeat
+        print(f"{count:>8} {elapsed * 1000:>10.2f} {count / elapsed:>12,.0f}")
+
+    # Одиночные паттерны (как в generate_hiphop_beat)
+    started = time.perf_counter()
+    for _ in range(2000):
+        generate_drum_matrix(BARS, rng=rng)
+    elapsed = (time.perf_counter() - started) / 2000
+    print(f"single pattern: {elapsed * 1e6:.1f} us ({1 / elapsed:,.0f} patterns/s)")
+
+
+if __name__ == "__main__":
+    main()
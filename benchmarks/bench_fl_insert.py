@@ -0,0 +1,87 @@
+"""
+Benchmark: time the FL Studio pattern builder blocks the scripting thread.
+
+Runs fl_studio_midi_generator against the headless flpianoroll mock and
+compares the original note-by-note builder (dice rolled between addNote
+calls) with the precomputed note array and with a background PatternPool.
+--delay-us makes every addNote call cost that much, as a model of FL.
+
+    python benchmarks/bench_fl_insert.py --delay-us 20
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator import mock_flpianoroll
+
+BARS = [2, 16, 64]
+
+
+def legacy_pattern(flpianoroll, bars):
+    # Исходный построитель: кубики бросаются между вызовами addNote
+    score = flpianoroll.score
+    pattern = score.createPattern("Legacy")
+    score.selectPattern(pattern)
+    channel_index = score.getActiveChannel()
+    scale = [0, 2, 4, 5, 7, 9, 11]
+    ppq = score.PPQ()
+    total_ticks = ppq * 4 * bars
+    current_tick = 0
+    while current_tick < total_ticks:
+        durations = [ppq / 4, ppq / 2, ppq, ppq * 2]
+        duration = random.choice(durations)
+        if random.random() > 0.2:
+            note = 60 + random.choice(scale) + random.randint(0, 2) * 12
+            score.addNote(time=current_tick, length=duration, note=note,
+                          velocity=random.randint(80, 110), channel=channel_index)
+        current_tick += duration
+
+
+def measure(run, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeats", type=int, default=50, help="patterns per measurement")
+    parser.add_argument("--delay-us", type=float, default=0.0, help="simulated cost of one addNote call")
+    args = parser.parse_args(argv)
+
+    score = mock_flpianoroll.install(ppq=96, add_note_delay=args.delay_us / 1e6)
+    import flpianoroll
+    import fl_studio_midi_generator as fl
+
+    print(f"addNote delay {args.delay_us:.0f} us, median over {args.repeats} patterns")
+    print(f"{'bars':>5} {'notes':>6} {'legacy ms':>10} {'array ms':>10} {'pooled ms':>10} {'speedup':>8}")
+    for bars in BARS:
+        random.seed(1)
+        score.clear()
+        legacy = measure(lambda: legacy_pattern(flpianoroll, bars), args.repeats)
+        notes = len(score.notes) // args.repeats
+
+        precomputed = measure(lambda: fl.generate_fl_studio_pattern("Array", bars=bars), args.repeats)
+
+        pool = fl.PatternPool(96, size=args.repeats, seed=1, bars=bars)
+        pool.wait_full()
+        pooled = measure(lambda: fl.generate_fl_studio_pattern("Pooled", pool, bars=bars), args.repeats)
+        pool.close()
+
+        print(f"{bars:>5} {notes:>6} {legacy * 1000:>10.3f} {precomputed * 1000:>10.3f} "
+              f"{pooled * 1000:>10.3f} {legacy / pooled:>7.1f}x")
+
+    mock_flpianoroll.uninstall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: constraint-propagating melody engine vs generate-and-fix.
+
+The legacy generator drew a random scale note and then folded it back by
+octaves when it leapt too far or left the range, which can break the leap
+rule again. The engine prunes the domains up front. For growing rule sets
+this prints the time per four bar phrase and how many generated phrases
+break a rule.
+
+    python benchmarks/bench_melody.py
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator.melody_engine import MelodyRules
+from fl_midi_generator.midi_generator import MAX_LEAP, MELODY_DURATIONS, REST_CHANCE, TICKS_PER_BAR
+
+SCALE = [0, 2, 4, 5, 7, 9, 11]
+BASE = 84
+BARS = 4
+RULE_SETS = [
+    ("range + scale", {"max_leap": 127, "cadence": None}),
+    ("+ max leap", {"cadence": None}),
+    ("+ cadence", {}),
+    ("+ strong beats", {"strong_beat": (0, 4, 7)}),
+    ("+ cyclic repeat", {"strong_beat": (0, 4, 7), "cyclic": True}),
+]
+
+
+def legacy_phrase(rng):
+    # Исходный подход: случайная нота, затем исправление переносом на октаву
+    previous = None
+    pitches = []
+    for _ in range(BARS):
+        tick = 0
+        while tick < TICKS_PER_BAR:
+            length = rng.choice([d for d in MELODY_DURATIONS if d <= TICKS_PER_BAR - tick])
+            if rng.random() >= REST_CHANCE:
+                pitch = BASE + rng.choice(SCALE) + 12 * rng.randint(0, 1)
+                if previous is not None:
+                    while pitch - previous > MAX_LEAP:
+                        pitch -= 12
+                    while previous - pitch > MAX_LEAP:
+                        pitch += 12
+                while pitch > BASE + 23:
+                    pitch -= 12
+                while pitch < BASE:
+                    pitch += 12
+                rng.randint(80, 110)
+                pitches.append(pitch)
+                previous = pitch
+            tick += length
+    return pitches
+
+
+def leap_violations(pitches):
+    return sum(abs(a - b) > MAX_LEAP for a, b in zip(pitches, pitches[1:]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--phrases", type=int, default=5000, help="phrases per measurement")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    print(f"{'generator':>24} {'us/phrase':>10} {'leap violations':>16}")
+    started = time.perf_counter()
+    broken = sum(leap_violations(legacy_phrase(rng)) > 0 for _ in range(args.phrases))
+    elapsed = (time.perf_counter() - started) / args.phrases
+    print(f"{'legacy generate-and-fix':>24} {elapsed * 1e6:>10.1f} {broken / args.phrases:>15.1%}")
+
+    for name, options in RULE_SETS:
+        options = dict(options)
+        cyclic = options.pop("cyclic", False)
+        rules = MelodyRules(SCALE, BASE, 1, **options)
+        broken = 0
+        started = time.perf_counter()
+        for _ in range(args.phrases):
+            bars, _ = rules.phrase(BARS, cyclic=cyclic, cadence=options.get("cadence", True) is not None,
+                                   rng=rng)
+            pitches = [pitch for notes in bars for _, _, pitch, _ in notes]
+            if cyclic:
+                pitches.append(pitches[0])
+            broken += leap_violations(pitches) > 0 and rules.max_leap == MAX_LEAP
+        elapsed = (time.perf_counter() - started) / args.phrases
+        print(f"{name:>24} {elapsed * 1e6:>10.1f} {broken / args.phrases:>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: vectorized MIDI reader vs a sequential event-by-event parser.
+
+Writes a large multi-track file with midi_writer (notes on the sixteenth
+grid, as the generators produce them), then reads it back with
+midi_reader.read_midi and with a plain Python parser that walks every
+event. Both must find the same notes.
+
+    python benchmarks/bench_midi_reader.py --megabytes 50
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from fl_midi_generator.midi_reader import read_midi
+from fl_midi_generator.midi_writer import TICKS_PER_QUARTER, write_midi
+from fl_midi_generator.note_buffer import NoteBuffer
+
+TRACKS = 16
+TEMPO = 90
+BYTES_PER_NOTE = 8  # note on + note off с running status
+
+
+def random_notes(count, rng):
+    step = TICKS_PER_QUARTER // 4
+    track = np.arange(count) % TRACKS
+    notes = NoteBuffer()
+    notes.extend_columns(track, track % 9, rng.integers(36, 96, count), (np.arange(count) // TRACKS) * step,
+                         step * rng.choice([1, 2, 4], count), rng.integers(70, 110, count))
+    return notes
+
+
+def sequential_read(data):
+    # Последовательный разбор: одно событие за раз
+    notes = 0
+    pos = 14
+    while pos < len(data):
+        end = pos + 8 + int.from_bytes(data[pos + 4:pos + 8], "big")
+        pos += 8
+        running = 0
+        on = {}
+        tick = 0
+        while pos < end:
+            delta = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                delta = (delta << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            tick += delta
+            status = data[pos]
+            if status >= 0x80:
+                pos += 1
+                if status < 0xF0:
+                    running = status
+            else:
+                status = running
+            if status == 0xFF:
+                length = data[pos + 1]
+                pos += 2 + length
+            elif status & 0xF0 in (0x80, 0x90):
+                key = (status & 0x0F, data[pos])
+                if key in on:
+                    notes += 1
+                    del on[key]
+                if status & 0xF0 == 0x90 and data[pos + 1]:
+                    on[key] = tick
+                pos += 2
+            elif status & 0xF0 in (0xC0, 0xD0):
+                pos += 1
+            else:
+                pos += 2
+        notes += len(on)
+    return notes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=50, help="size of the test file")
+    parser.add_argument("--skip-sequential", action="store_true", help="time only read_midi")
+    args = parser.parse_args(argv)
+
+    count = int(args.megabytes * 1e6 / BYTES_PER_NOTE)
+    data = write_midi(random_notes(count, np.random.default_rng(1)), TRACKS, TEMPO)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.mid")
+        with open(path, "wb") as f:
+            f.write(data)
+        started = time.perf_counter()
+        midi = read_midi(path)
+        reader_seconds = time.perf_counter() - started
+
+    print(f"{len(data) / 1e6:.1f} MB, {TRACKS} tracks, {len(midi.notes)} notes")
+    print(f"{'parser':>12} {'seconds':>8} {'MB/s':>7}")
+    print(f"{'read_midi':>12} {reader_seconds:>8.2f} {len(data) / 1e6 / reader_seconds:>7.1f}")
+    if not args.skip_sequential:
+        started = time.perf_counter()
+        notes = sequential_read(data)
+        sequential_seconds = time.perf_counter() - started
+        assert notes == len(midi.notes), (notes, len(midi.notes))
+        print(f"{'sequential':>12} {sequential_seconds:>8.2f} {len(data) / 1e6 / sequential_seconds:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
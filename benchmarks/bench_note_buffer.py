@@ -0,0 +1,118 @@
+"""
+Benchmark: array-backed NoteBuffer vs list of tuples vs midiutil.MIDIFile.
+
+For 1k, 100k and 1M notes measures the memory held by the note store, the
+time to add the notes one by one and the time to sort and serialize them.
+midiutil is slow and memory hungry at 1M notes, so by default it is only
+measured up to 100k notes (use --midiutil-max to change that).
+
+    python benchmarks/bench_note_buffer.py
+"""
+
+import argparse
+import gc
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midiutil.MidiFile import MIDIFile
+
+from fl_midi_generator.midi_writer import TICKS_PER_QUARTER, write_midi
+from fl_midi_generator.note_buffer import NoteBuffer
+
+SIZES = [1000, 100000, 1000000]
+TRACKS = 5
+TEMPO = 90
+
+
+def note_columns(count, seed=1):
+    # Ноты на сетке шестнадцатых, по одной ноте трека на шаг; колонки, чтобы
+    # каждое хранилище строило свое представление нот само
+    rng = random.Random(seed)
+    step = TICKS_PER_QUARTER // 4
+    return (
+        [i % TRACKS for i in range(count)],
+        [0] * count,
+        [rng.randint(36, 96) for _ in range(count)],
+        [(i // TRACKS) * step for i in range(count)],
+        [step * rng.choice((1, 2, 4)) for _ in range(count)],
+        [rng.randint(70, 110) for _ in range(count)],
+    )
+
+
+def measure(build, serialize, notes):
+    # Память хранилища (tracemalloc), время добавления нот и время записи
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = build(notes)
+    build_time = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    size = serialize(store)
+    return memory, build_time, time.perf_counter() - started, size
+
+
+def build_list(columns):
+    store = []
+    for track, channel, pitch, start, length, velocity in zip(*columns):
+        store.append((track, channel, pitch, start, length, velocity))
+    return store
+
+
+def build_buffer(columns):
+    store = NoteBuffer()
+    add = store.add
+    for track, channel, pitch, start, length, velocity in zip(*columns):
+        add(track, channel, pitch, start, length, velocity)
+    return store
+
+
+def build_midiutil(columns):
+    midi = MIDIFile(TRACKS, eventtime_is_ticks=True)
+    midi.addTempo(0, 0, TEMPO)
+    for track, channel, pitch, start, length, velocity in zip(*columns):
+        midi.addNote(track, channel, pitch, start, length, velocity)
+    return midi
+
+
+def write_midiutil(midi):
+    out = io.BytesIO()
+    midi.writeFile(out)
+    return out.tell()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--midiutil-max", type=int, default=100000,
+                        help="largest note count measured with midiutil (default: 100000)")
+    args = parser.parse_args(argv)
+
+    stores = [
+        ("list of tuples", build_list, lambda store: len(write_midi(store, TRACKS, TEMPO))),
+        ("NoteBuffer", build_buffer, lambda store: len(write_midi(store, TRACKS, TEMPO))),
+        ("midiutil", build_midiutil, write_midiutil),
+    ]
+
+    print(f"{'notes':>8} {'store':<15} {'memory MB':>10} {'B/note':>7} {'add ms':>9} "
+          f"{'write ms':>9} {'notes/s':>12} {'file B':>10}")
+    for count in SIZES:
+        notes = note_columns(count)
+        for name, build, serialize in stores:
+            if name == "midiutil" and count > args.midiutil_max:
+                continue
+            memory, build_time, write_time, size = measure(build, serialize, notes)
+            total = build_time + write_time
+            print(f"{count:>8} {name:<15} {memory / 1e6:>10.2f} {memory / count:>7.1f} "
+                  f"{build_time * 1000:>9.1f} {write_time * 1000:>9.1f} {count / total:>12,.0f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: timing jitter of the real-time streaming mode.
+
+Plays generated hip-hop bars into a MemorySink for some seconds and
+prints the jitter of the sent events (send time - due time), with and
+without the sleep + spin wait (plain asyncio.sleep until every event),
+optionally while a background thread keeps the interpreter busy.
+
+    python benchmarks/bench_realtime.py --seconds 10 --tempo 140 --load
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator import realtime
+from fl_midi_generator.realtime import LivePlayer, MemorySink, hiphop_bar_stream
+
+
+def busy(stop):
+    # Фоновая нагрузка: генерация в другом потоке
+    bars = hiphop_bar_stream(seed=1)
+    while not stop.is_set():
+        next(bars)
+
+
+def measure(seconds, tempo, spin):
+    realtime.SPIN = spin
+    player = LivePlayer(hiphop_bar_stream(seed=7), MemorySink(), tempo)
+    asyncio.run(player.play(seconds))
+    return player.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10, help="playing time per run")
+    parser.add_argument("--tempo", type=float, default=140)
+    parser.add_argument("--load", action="store_true", help="generate bars in a background thread meanwhile")
+    args = parser.parse_args(argv)
+
+    stop = threading.Event()
+    if args.load:
+        threading.Thread(target=busy, args=(stop,), daemon=True).start()
+    spin = realtime.SPIN
+    try:
+        print(f"{args.seconds:g} s at {args.tempo:g} BPM{', background load' if args.load else ''}")
+        print(f"{'wait':>12} {'events':>7} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, value in (("sleep", 0.0), ("sleep+spin", spin)):
+            stats = measure(args.seconds, args.tempo, value)
+            print(f"{name:>12} {stats['count']:>7} {stats['mean_ms']:>8.3f} {stats['p50_ms']:>8.3f} "
+                  f"{stats['p99_ms']:>8.3f} {stats['max_ms']:>8.3f}")
+    finally:
+        realtime.SPIN = spin
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
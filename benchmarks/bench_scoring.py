@@ -0,0 +1,62 @@
+"""
+Benchmark: batched musicality scoring vs scoring candidates one by one.
+
+Renders hip-hop beats in memory, then scores them with scoring.score_batch
+once as one batch and once per candidate (a batch of one each time), and
+prints the cost per candidate. Both give the same scores.
+
+    python benchmarks/bench_scoring.py --candidates 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from fl_midi_generator.midi_generator import HIPHOP_COMPONENTS, generate_hiphop_beat
+from fl_midi_generator.midi_reader import parse_midi
+from fl_midi_generator.scoring import CandidateBatch, score_batch, top_k
+
+SCALE = [0, 3, 5, 7, 10]
+BARS = 4
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--candidates", type=int, default=1000, help="beats to score")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    midis = [parse_midi(generate_hiphop_beat(None, BARS, seed=seed)) for seed in range(args.candidates)]
+    render_seconds = (time.perf_counter() - started) / args.candidates
+
+    started = time.perf_counter()
+    batch = CandidateBatch()
+    for midi in midis:
+        batch.add_midi(midi, BARS, SCALE, HIPHOP_COMPONENTS)
+    scores = score_batch(batch)["score"]
+    best = top_k(scores, 10)
+    batched_seconds = (time.perf_counter() - started) / args.candidates
+
+    started = time.perf_counter()
+    single = []
+    for midi in midis:
+        one = CandidateBatch()
+        one.add_midi(midi, BARS, SCALE, HIPHOP_COMPONENTS)
+        single.append(score_batch(one)["score"][0])
+    single_seconds = (time.perf_counter() - started) / args.candidates
+    assert np.allclose(single, scores)
+
+    print(f"{args.candidates} beats of {BARS} bars, render {render_seconds * 1e6:.0f} us each")
+    print(f"{'scoring':>14} {'us/candidate':>13}")
+    print(f"{'one by one':>14} {single_seconds * 1e6:>13.1f}")
+    print(f"{'batched':>14} {batched_seconds * 1e6:>13.1f}")
+    print(f"best 10: {', '.join(f'#{index} {scores[index]:.3f}' for index in best)}")
+
+
+if __name__ == "__main__":
+    main()
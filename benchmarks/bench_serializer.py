@@ -0,0 +1,78 @@
+"""
+Benchmark: in-memory MIDI writer vs the midiutil path.
+
+Compares speed and output size of fl_midi_generator.midi_writer.write_midi
+(into new bytes and into a reused preallocated buffer) with building a
+midiutil.MIDIFile and writing it to an in-memory file.
+
+    python benchmarks/bench_serializer.py
+"""
+
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midiutil.MidiFile import MIDIFile
+
+from fl_midi_generator.midi_writer import TICKS_PER_QUARTER, max_midi_size, write_midi
+
+SIZES = [100, 1000, 10000, 100000]
+TRACKS = 5
+TEMPO = 90
+
+
+def random_notes(count, seed=1):
+    # Ноты на сетке шестнадцатых, как у генераторов
+    rng = random.Random(seed)
+    step = TICKS_PER_QUARTER // 4
+    notes = []
+    for i in range(count):
+        track = i % TRACKS
+        start = (i // TRACKS) * step
+        notes.append((track, 0, rng.randint(36, 96), start, step * rng.choice([1, 2, 4]),
+                      rng.randint(70, 110)))
+    return notes
+
+
+def midiutil_bytes(notes):
+    midi = MIDIFile(TRACKS, eventtime_is_ticks=True)
+    midi.addTempo(0, 0, TEMPO)
+    for track, channel, pitch, start, length, velocity in notes:
+        midi.addNote(track, channel, pitch, start, length, velocity)
+    out = io.BytesIO()
+    midi.writeFile(out)
+    return out.getvalue()
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    print(f"{'notes':>8} {'midiutil ms':>12} {'bytes ms':>10} {'buffer ms':>10} "
+          f"{'speedup':>8} {'midiutil B':>11} {'writer B':>10} {'size':>6}")
+    for count in SIZES:
+        notes = random_notes(count)
+        repeat = 5 if count < 100000 else 2
+        buffer = bytearray(max_midi_size(notes, TRACKS))
+
+        t_midiutil, reference = best_time(lambda: midiutil_bytes(notes), repeat)
+        t_bytes, data = best_time(lambda: write_midi(notes, TRACKS, TEMPO), repeat)
+        t_buffer, _ = best_time(lambda: write_midi(notes, TRACKS, TEMPO, buffer=buffer), repeat)
+
+        print(f"{count:>8} {t_midiutil * 1000:>12.2f} {t_bytes * 1000:>10.2f} {t_buffer * 1000:>10.2f} "
+              f"{t_midiutil / t_bytes:>7.1f}x {len(reference):>11} {len(data):>10} "
+              f"{len(data) / len(reference):>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: request latency of the warm generation server.
+
+Starts the server in this process on a free localhost port, sends
+four-bar beat requests over one keep-alive connection and prints client
+side p50/p99 latency next to the server /metrics.
+
+    python benchmarks/bench_server.py --workers 4 --requests 2000
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator.server import GenerationService, make_server, percentile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-w", "--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="number of requests")
+    args = parser.parse_args(argv)
+
+    service = GenerationService(args.workers)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    latencies = []
+    try:
+        for i in range(args.requests):
+            body = json.dumps({"style": "Boom Bap", "tempo": 90, "duration": 4, "seed": i})
+            started = time.perf_counter()
+            connection.request("POST", "/render", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200 or not data.startswith(b"MThd"):
+                raise RuntimeError(f"bad response {response.status}: {data[:200]!r}")
+
+        connection.request("GET", "/metrics")
+        metrics = json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+    latencies.sort()
+    print(f"workers={args.workers} requests={args.requests}")
+    print(f"client  p50 {percentile(latencies, 0.5) * 1000:.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms  max {latencies[-1] * 1000:.2f} ms")
+    print(f"server  p50 {metrics['p50_ms']:.2f} ms  p99 {metrics['p99_ms']:.2f} ms  "
+          f"max {metrics['max_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
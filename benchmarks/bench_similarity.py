@@ -0,0 +1,69 @@
+"""
+Benchmark: top-k nearest drum pattern queries over a large index.
+
+Fills a DrumIndex with drum patterns from the vectorized drum engine
+(batches of generate_drum_patterns, inserted incrementally) and measures
+the query latency per metric and with the density / syncopation features.
+
+    python benchmarks/bench_similarity.py --patterns 1000000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import generate_drum_patterns
+from fl_midi_generator.similarity import DrumIndex
+
+BATCH = 50000
+QUERIES = [
+    ("hamming", {"metric": "hamming"}),
+    ("jaccard", {"metric": "jaccard"}),
+    ("hamming + features", {"metric": "hamming", "density_weight": 0.5, "syncopation_weight": 0.5}),
+    ("jaccard, kick+snare", {"metric": "jaccard", "weights": [1, 1, 0]}),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patterns", type=int, default=1000000, help="patterns in the index")
+    parser.add_argument("-k", type=int, default=10, help="results per query")
+    parser.add_argument("-n", "--repeats", type=int, default=20, help="queries per measurement")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    index = DrumIndex()
+    generate_seconds = insert_seconds = 0.0
+    for start in range(0, args.patterns, BATCH):
+        started = time.perf_counter()
+        matrices = generate_drum_patterns(min(BATCH, args.patterns - start), rng=rng)
+        generate_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        index.add_matrices(matrices)
+        insert_seconds += time.perf_counter() - started
+    print(f"{len(index)} patterns: generated in {generate_seconds:.2f} s, "
+          f"inserted in {insert_seconds:.2f} s ({insert_seconds / len(index) * 1e6:.2f} us/pattern)")
+
+    started = time.perf_counter()
+    for seed in range(1000):
+        index.add_beat(seed=seed)
+    print(f"add_beat: {(time.perf_counter() - started):.3f} ms per beat (generate + insert)")
+
+    print(f"{'query':>22} {'median ms':>10} {'min ms':>8}")
+    for name, options in QUERIES:
+        times = []
+        for i in range(args.repeats):
+            started = time.perf_counter()
+            index.query_id(i * 7919 % len(index), args.k, **options)
+            times.append(time.perf_counter() - started)
+        print(f"{name:>22} {statistics.median(times) * 1000:>10.2f} {min(times) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: import time of the package and its modules.
+
+Imports every module in a fresh interpreter (stdin closed, so a module
+that prompts at import time fails), subtracts the time of an empty
+interpreter start and checks that the import stays under a fixed budget
+and does not load midiutil or numpy. Exits with status 1 on failure.
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "fl_midi_generator",
+    "fl_midi_generator.midi_generator",
+    "fl_midi_generator.batch",
+    "fl_midi_generator.server",
+    "fl_midi_generator.hiphop_beat",
+    "fl_midi_generator.hiphop_components",
+    "fl_midi_generator.four_bar_melody",
+]
+HEAVY_MODULES = ["midiutil", "numpy"]
+IMPORT_BUDGET_MS = 150  # сверх пустого запуска интерпретатора
+
+IMPORT_CODE = (
+    "import sys\n"
+    + "".join(f"import {module}\n" for module in MODULES)
+    + f"loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+    + "if loaded:\n"
+    + "    sys.exit('heavy modules loaded at import: ' + ', '.join(loaded))\n"
+)
+
+
+def run(code):
+    # Время запуска интерпретатора с кодом, без чтения stdin
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdin=subprocess.DEVNULL,
+                            capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"exit status {result.returncode}")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=10, help="interpreter starts per measurement")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help=f"allowed import time over an empty start (default: {IMPORT_BUDGET_MS})")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = statistics.median(run("pass") for _ in range(args.runs))
+        total = statistics.median(run(IMPORT_CODE) for _ in range(args.runs))
+    except RuntimeError as e:
+        print(f"FAIL: {e}")
+        return 1
+
+    import_ms = (total - baseline) * 1000
+    print(f"interpreter start {baseline * 1000:.1f} ms, with imports {total * 1000:.1f} ms")
+    print(f"import time {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms), "
+          f"not loaded: {', '.join(HEAVY_MODULES)}")
+    if import_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Benchmark suite: every generator entry point with reproducible seeds.
+
+Sweeps generate_random_midi over duration, track count, scale size and
+the second voice, generate_hiphop_beat over duration and component sets,
+and the FL Studio pattern builder (against the flpianoroll mock outside
+FL Studio).
+Every case is rendered into memory with fixed seeds; the suite records
+throughput, the latency distribution, the tracemalloc peak and the output
+size, and writes them as JSON.
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --threshold 0.15
+    python benchmarks/run_benchmarks.py --quick --filter hiphop
+
+With --compare, cases whose median latency or peak memory grew by more
+than the threshold are reported as regressions and the exit status is 1.
+A changed output size means the generators produce different notes for
+the same seed and is reported as well.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fl_midi_generator.metrics import RenderMetrics, count, stage
+from fl_midi_generator.metrics import render as render_scope
+from fl_midi_generator.midi_generator import generate_hiphop_beat, generate_random_midi
+
+SEED = 1000
+DURATIONS = [4, 64, 512, 4096]
+QUICK_DURATIONS = [4, 64]
+SCALES = {
+    "pentatonic": [0, 3, 5, 7, 10],
+    "major": [0, 2, 4, 5, 7, 9, 11],
+    "chromatic": None,
+}
+COMPONENT_SETS = {
+    "all": None,
+    "drums": ["kick", "snare", "hihat"],
+    "kick": ["kick"],
+    "bass_melody": ["bass", "melody"],
+}
+
+
+def random_midi_cases(durations):
+    # Одна ось за раз вокруг базового случая, чтобы не перемножать все оси
+    base = {"duration": 16, "tracks": 1, "scale": "major", "generate_second_voice": False}
+    cases = []
+    for duration in durations:
+        cases.append(dict(base, duration=duration))
+    for scale in SCALES:
+        cases.append(dict(base, scale=scale))
+    for second_voice in (False, True):
+        cases.append(dict(base, generate_second_voice=second_voice, tracks=2))
+    for tracks in (1, 4):
+        cases.append(dict(base, tracks=tracks))
+    for duration in durations:
+        cases.append(dict(base, duration=duration, generate_second_voice=True, tracks=2))
+    return [("random_midi", params) for params in _unique(cases)]
+
+
+def hiphop_cases(durations):
+    cases = []
+    for duration in durations:
+        cases.append({"duration": duration, "components": "all"})
+    for components in COMPONENT_SETS:
+        cases.append({"duration": 16, "components": components})
+    return [("hiphop_beat", params) for params in _unique(cases)]
+
+
+def fl_builder_cases():
+    try:
+        import flpianoroll  # noqa: F401 - есть только внутри FL Studio
+    except ImportError:
+        # Вне FL Studio построитель меряется на заглушке flpianoroll
+        from fl_midi_generator import mock_flpianoroll
+        mock_flpianoroll.install()
+    return [("fl_pattern", {"pattern": "Benchmark", "bars": bars}) for bars in (2, 16)]
+
+
+def _unique(cases):
+    seen = []
+    for case in cases:
+        if case not in seen:
+            seen.append(case)
+    return seen
+
+
+def case_id(entry, params):
+    return entry + "[" + ",".join(f"{key}={value}" for key, value in sorted(params.items())) + "]"
+
+
+def make_render(entry, params):
+    # Функция (seed, metrics) -> MIDI bytes (или результат построителя FL)
+    if entry == "random_midi":
+        kwargs = dict(params, scale=SCALES[params["scale"]])
+        return lambda seed, metrics=None: generate_random_midi(None, seed=seed, metrics=metrics, **kwargs)
+    if entry == "hiphop_beat":
+        components = COMPONENT_SETS[params["components"]]
+        return lambda seed, metrics=None: generate_hiphop_beat(
+            None, duration=params["duration"], components=components, seed=seed, metrics=metrics)
+    if entry == "fl_pattern":
+        import random
+
+        from fl_studio_midi_generator import generate_fl_studio_pattern
+
+        def render(seed, metrics=None):
+            import flpianoroll
+
+            random.seed(seed)  # построитель FL использует глобальный random
+            # Нот считаем по вызовам addNote (счетчик есть у заглушки)
+            calls = getattr(flpianoroll.score, "add_note_calls", 0)
+            with render_scope(metrics):
+                with stage(metrics, "fl_insert"):
+                    result = generate_fl_studio_pattern(params["pattern"], bars=params["bars"])
+                count(metrics, "bars", params["bars"])
+                count(metrics, "notes", getattr(flpianoroll.score, "add_note_calls", 0) - calls)
+            # Построитель не бросает исключения, а возвращает строку ошибки
+            if result.startswith("Error"):
+                raise RuntimeError(f"FL pattern builder failed: {result}")
+            return result
+        return render
+    raise ValueError(f"unknown entry point {entry}")
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_case(entry, params, repeats, min_time):
+    render = make_render(entry, params)
+    render(SEED)  # прогрев: ленивые импорты и кэши
+
+    # Память и счетчики - отдельным прогоном, tracemalloc замедляет рендер
+    metrics = RenderMetrics(trace_memory=True)
+    output = render(SEED, metrics)
+    report = metrics.report()
+
+    latencies = []
+    started = time.perf_counter()
+    i = 0
+    while i < repeats or time.perf_counter() - started < min_time:
+        seed = SEED + i
+        call_started = time.perf_counter()
+        render(seed)
+        latencies.append(time.perf_counter() - call_started)
+        i += 1
+    latencies.sort()
+
+    median = percentile(latencies, 0.5)
+    bars = report["counters"].get("bars", 0)
+    notes = report["counters"].get("notes", 0)
+    return {
+        "entry": entry,
+        "params": params,
+        "runs": len(latencies),
+        "latency_ms": {
+            "min": latencies[0] * 1000,
+            "p50": median * 1000,
+            "p90": percentile(latencies, 0.9) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+            "mean": statistics.fmean(latencies) * 1000,
+        },
+        "renders_per_s": 1 / median,
+        "bars_per_s": bars / median,
+        "notes_per_s": notes / median,
+        "notes": notes,
+        "peak_memory_bytes": report["peak_memory_bytes"],
+        "output_bytes": len(output) if isinstance(output, bytes) else None,
+    }
+
+
+def environment():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy_version,
+        "seed": SEED,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline; returns a list of (case, problem) pairs
+    """
+    problems = []
+    for case, result in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        old_latency = old["latency_ms"]["p50"]
+        new_latency = result["latency_ms"]["p50"]
+        if new_latency > old_latency * (1 + threshold):
+            problems.append((case, f"p50 latency {old_latency:.3f} -> {new_latency:.3f} ms "
+                                   f"(+{new_latency / old_latency - 1:.0%})"))
+        old_memory, new_memory = old.get("peak_memory_bytes"), result.get("peak_memory_bytes")
+        if old_memory and new_memory and new_memory > old_memory * (1 + threshold):
+            problems.append((case, f"peak memory {old_memory / 1e6:.2f} -> {new_memory / 1e6:.2f} MB "
+                                   f"(+{new_memory / old_memory - 1:.0%})"))
+        if old.get("output_bytes") != result.get("output_bytes"):
+            problems.append((case, f"output size {old.get('output_bytes')} -> {result.get('output_bytes')} "
+                                   f"bytes (different notes for the same seed)"))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help=f"only durations {QUICK_DURATIONS}")
+    parser.add_argument("--filter", default="", help="run only cases whose id contains this text")
+    parser.add_argument("-n", "--repeats", type=int, default=5, help="minimum timed renders per case")
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="keep rendering a case for at least this many seconds")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed relative slowdown / memory growth (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    durations = QUICK_DURATIONS if args.quick else DURATIONS
+    cases = random_midi_cases(durations) + hiphop_cases(durations) + fl_builder_cases()
+
+    results = {}
+    print(f"{'case':<90} {'p50 ms':>9} {'p99 ms':>9} {'notes/s':>12} {'peak MB':>8} {'bytes':>8}")
+    for entry, params in cases:
+        case = case_id(entry, params)
+        if args.filter not in case:
+            continue
+        result = run_case(entry, params, args.repeats, args.min_time)
+        results[case] = result
+        peak = result["peak_memory_bytes"]
+        print(f"{case:<90} {result['latency_ms']['p50']:>9.3f} {result['latency_ms']['p99']:>9.3f} "
+              f"{result['notes_per_s']:>12,.0f} {(peak or 0) / 1e6:>8.2f} {result['output_bytes'] or 0:>8}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"results written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        problems = compare(results, baseline, args.threshold)
+        for case, problem in problems:
+            print(f"REGRESSION {case}: {problem}")
+        if problems:
+            return 1
+        print(f"no regressions against {args.compare} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Song arrangements built from a few reusable sections.
+
+A song (intro, verses, hooks, bridge, outro; 100+ bars) is a form: a list
+of parts, each playing one section for some bars with a variation. Only
+the sections are generated and stored (a few 4 bar loops); a part refers
+to its section by bar position, so a 104 bar song keeps the notes of 12
+bars.
+
+A Variation is a cheap delta applied when a bar is encoded: muted
+components, melody transposition, a velocity scale, and a drum fill on
+the last bar of a part. Every distinct (section bar, variation) is encoded
+once into per-track event blocks (see bar_pattern), and the track chunks
+are assembled by referencing those blocks, so repeats cost neither note
+storage nor encoding time.
+
+    song = Arrangement.hiphop(tempo=90, seed=7)          # SONG_FORM, 104 bars
+    song.write("song.mid")
+    short = Arrangement.hiphop(form=[Part("verse", 8, fill=True)], seed=7)
+"""
+
+import random
+import struct
+from collections import namedtuple
+
+from fl_midi_generator.bar_pattern import _encode_block, _track_pieces
+from fl_midi_generator.metrics import count, render, stage
+from fl_midi_generator.midi_generator import (
+    HIPHOP_LOOP_BARS, STEP_TICKS, TICKS_PER_BAR, TICKS_PER_QUARTER, _normalize_components,
+    iter_hiphop_beat_bars, write_bytes_output,
+)
+from fl_midi_generator.midi_writer import _header_and_tempo
+from fl_midi_generator.note_buffer import NoteBuffer
+
+# Дельта части: заглушенные компоненты, сдвиг мелодии в полутонах, громкость
+Variation = namedtuple("Variation", ["mute", "transpose", "velocity"], defaults=((), 0, 1.0))
+PLAIN = Variation()
+
+# Часть формы: секция играет bars тактов; fill = сбивка в последнем такте
+Part = namedtuple("Part", ["section", "bars", "variation", "fill"], defaults=(PLAIN, False))
+
+DRUM_PARTS = ("kick", "snare", "hihat")
+FILL_VELOCITIES = (70, 80, 90, 100)  # сбивка малого нарастает по шестнадцатым
+
+SONG_FORM = (
+    Part("verse", 8, Variation(mute=("kick", "snare", "bass"))),  # интро: хэт и мелодия
+    Part("verse", 16, fill=True),
+    Part("hook", 8, fill=True),
+    Part("verse", 16, Variation(mute=("melody",)), fill=True),
+    Part("hook", 8, fill=True),
+    Part("bridge", 8, Variation(mute=("kick",)), fill=True),
+    Part("verse", 16, fill=True),
+    Part("hook", 16, Variation(transpose=12), fill=True),
+    Part("verse", 8, Variation(mute=("kick", "snare", "hihat"), velocity=0.8)),  # аутро
+)
+
+
+def apply_variation(notes, variation, fill, track_map):
+    """
+    Notes of one bar with a variation applied
+
+    Parameters:
+    - notes: (track, channel, pitch, start, length, velocity), start
+      relative to the bar
+    - variation: Variation
+    - fill: replace the drums of the last beat with a snare fill
+    - track_map: component -> track of the notes
+    """
+    muted = {track_map[name] for name in variation.mute if name in track_map}
+    drums = {track_map[name] for name in DRUM_PARTS if name in track_map}
+    melody = track_map.get("melody")
+    fill_start = 3 * TICKS_PER_QUARTER
+    result = []
+    for track, channel, pitch, start, length, velocity in notes:
+        if track in muted or (fill and track in drums and start >= fill_start):
+            continue
+        if track == melody and variation.transpose:
+            pitch = min(max(pitch + variation.transpose, 0), 127)
+        if variation.velocity != 1.0:
+            velocity = min(max(int(round(velocity * variation.velocity)), 1), 127)
+        result.append((track, channel, pitch, start, length, velocity))
+    snare = track_map.get("snare")
+    if fill and snare is not None and snare not in muted:
+        channel = next((note[1] for note in notes if note[0] == snare), None)
+        if channel is not None:
+            pitch = next(note[2] for note in notes if note[0] == snare)
+            for step, level in enumerate(FILL_VELOCITIES):
+                velocity = min(max(int(round(level * variation.velocity)), 1), 127)
+                result.append((snare, channel, pitch, fill_start + step * STEP_TICKS, STEP_TICKS, velocity))
+    return result
+
+
+class Arrangement:
+    """
+    Song made of sections played by the parts of a form
+
+    Parameters:
+    - sections: dict name -> list of bars, every bar a list of (track,
+      channel, pitch, start, length, velocity) with start relative to the
+      bar (notes are clamped at the bar end)
+    - form: sequence of Part; a part of more bars than its section loops it
+    - components: component of every track, in track order (used by
+      variations to find the drum, bass and melody tracks)
+    - tempo: beats per minute
+    - ticks_per_bar: bar length in ticks
+
+    The attribute encoded_blocks counts the bars encoded so far (one per
+    distinct section bar, variation and fill).
+    """
+
+    def __init__(self, sections, form, components, tempo, ticks_per_bar=TICKS_PER_BAR):
+        self.components = list(components)
+        self.num_tracks = len(self.components)
+        self.tempo = tempo
+        self.ticks_per_bar = ticks_per_bar
+        self.sections = {name: [self._clamp(bar) for bar in bars] for name, bars in sections.items()}
+        self.form = [self._normalize_part(part) for part in form]
+        for part in self.form:
+            if not self.sections.get(part.section):
+                raise ValueError(f"form refers to section {part.section!r}, which has no bars")
+        self._track_map = {name: track for track, name in enumerate(self.components)}
+        self._blocks = {}  # (секция, такт секции, вариация, сбивка) -> блоки по трекам
+        self.encoded_blocks = 0
+
+    @classmethod
+    def hiphop(cls, form=SONG_FORM, section_bars=HIPHOP_LOOP_BARS, tempo=90, scale=None, components=None,
+               seed=None):
+        """
+        Hip-hop song: every section of the form is a generated hip-hop loop
+
+        Sections are generated in the order they first appear in the form,
+        from one random sequence, so the first section is the same loop
+        that generate_hiphop_beat(duration=section_bars, seed=seed) writes.
+        """
+        components = _normalize_components(components)
+        rng = random.Random(seed) if seed is not None else random
+        sections = {}
+        for part in form:
+            section = Part(*part).section
+            if section not in sections:
+                bars = iter_hiphop_beat_bars(section_bars, scale, components, rng)
+                sections[section] = [[(track, channel, pitch, start - index * TICKS_PER_BAR, length, velocity)
+                                      for track, channel, pitch, start, length, velocity in bar]
+                                     for index, bar in enumerate(bars)]
+        return cls(sections, form, components, tempo)
+
+    @staticmethod
+    def _normalize_part(part):
+        # Вариация входит в ключ кэша блоков: mute - кортеж
+        part = Part(*part)
+        variation = Variation(*part.variation)
+        return part._replace(variation=variation._replace(mute=tuple(variation.mute)))
+
+    def _clamp(self, notes):
+        bar_length = self.ticks_per_bar
+        clamped = []
+        for track, channel, pitch, start, length, velocity in notes:
+            if not 0 <= track < self.num_tracks:
+                raise ValueError(f"note on track {track}, but the arrangement has {self.num_tracks} tracks")
+            if not 0 <= start < bar_length:
+                raise ValueError(f"note start {start} is outside the bar (0..{bar_length - 1})")
+            clamped.append((track, channel, pitch, start, min(length, bar_length - start), velocity))
+        return clamped
+
+    def __len__(self):
+        return sum(part.bars for part in self.form)
+
+    def bar_refs(self):
+        """
+        Yield (section, bar of the section, variation, fill) for every bar of the song
+        """
+        for part in self.form:
+            length = len(self.sections[part.section])
+            for bar in range(part.bars):
+                yield part.section, bar % length, part.variation, part.fill and bar == part.bars - 1
+
+    def _bar_notes(self, section, bar, variation, fill):
+        notes = self.sections[section][bar]
+        if variation == PLAIN and not fill:
+            return notes
+        return apply_variation(notes, variation, fill, self._track_map)
+
+    def iter_bars(self):
+        """
+        Yield the notes of every bar with absolute times (for write_midi_stream
+        or the preview renderer)
+        """
+        for index, ref in enumerate(self.bar_refs()):
+            offset = index * self.ticks_per_bar
+            yield [(track, channel, pitch, offset + start, length, velocity)
+                   for track, channel, pitch, start, length, velocity in self._bar_notes(*ref)]
+
+    def notes(self):
+        """
+        All notes of the song with absolute times, as a NoteBuffer
+        """
+        notes = NoteBuffer()
+        for bar in self.iter_bars():
+            notes.extend(bar)
+        return notes
+
+    def _bar_blocks(self, ref):
+        blocks = self._blocks.get(ref)
+        if blocks is None:
+            by_track = [[] for _ in range(self.num_tracks)]
+            for track, channel, pitch, start, length, velocity in self._bar_notes(*ref):
+                by_track[track].append((channel, pitch, start, length, velocity))
+            blocks = [_encode_block(notes) if notes else None for notes in by_track]
+            self._blocks[ref] = blocks
+            self.encoded_blocks += 1
+        return blocks
+
+    def _chunks(self):
+        # Куски каждого MTrk: тела блоков общие для всех повторов
+        refs = list(self.bar_refs())
+        for track in range(self.num_tracks):
+            pieces = _track_pieces(((index, self._bar_blocks(ref)[track]) for index, ref in enumerate(refs)),
+                                   self.ticks_per_bar)
+            yield [b"MTrk" + struct.pack(">I", sum(map(len, pieces)))] + pieces
+
+    def to_bytes(self):
+        """
+        The song as a MIDI file (same bytes as write_midi of notes())
+        """
+        header = _header_and_tempo(self.num_tracks, self.tempo, TICKS_PER_QUARTER)
+        return header + b"".join(piece for chunk in self._chunks() for piece in chunk)
+
+    def write(self, output_file, message=None, metrics=None):
+        """
+        Write the song to a path, file-like object or buffer (see write_output)
+
+        Paths and file objects get the cached blocks written one after
+        another, the song is never assembled in memory.
+        """
+        message = message or f"Song created: {len(self)} bars, {len(self.form)} parts"
+        if output_file is None or isinstance(output_file, (bytearray, memoryview)):
+            with stage(metrics, "serialize"):
+                data = self.to_bytes()
+            count(metrics, "bytes_written", len(data))
+            return write_bytes_output(output_file, data, message, metrics)
+
+        def write_to(out):
+            size = out.write(_header_and_tempo(self.num_tracks, self.tempo, TICKS_PER_QUARTER))
+            for chunk in self._chunks():
+                for piece in chunk:
+                    size += out.write(piece)
+            return size
+
+        with stage(metrics, "serialize"):
+            if hasattr(output_file, "write"):
+                size = write_to(output_file)
+            else:
+                with open(output_file, "wb") as out:
+                    size = write_to(out)
+        count(metrics, "bytes_written", size)
+        return message
+
+
+def generate_hiphop_song(output_file="hiphop_song.mid", tempo=90, scale=None, components=None, form=SONG_FORM,
+                         section_bars=HIPHOP_LOOP_BARS, seed=None, metrics=None):
+    """
+    Generate a full hip-hop song arrangement
+
+    Parameters:
+    - output_file: where to put the MIDI file (see write_output)
+    - tempo, scale, components, seed: as for generate_hiphop_beat
+    - form: sequence of Part (default SONG_FORM: intro, verses, hooks,
+      bridge and outro, 104 bars)
+    - section_bars: length of every generated section in bars
+    - metrics: optional RenderMetrics (see metrics.py)
+    """
+    with render(metrics):
+        with stage(metrics, "generate"):
+            song = Arrangement.hiphop(form, section_bars, tempo, scale, components, seed)
+        return song.write(output_file, metrics=metrics)
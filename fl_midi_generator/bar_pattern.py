@@ -0,0 +1,336 @@
+"""
+Incremental bar-level pattern model for fast edits.
+
+A BarPattern keeps a beat or melody as a list of bars. Every bar is
+encoded once into one MIDI event block per track and cached; the track
+chunks are built from those blocks and cached too. Editing, mutating or
+regenerating one bar re-encodes only that bar and rebuilds only the track
+chunks it touches, so iterating on a loop costs well under a millisecond
+instead of a full render.
+
+    pattern = BarPattern.hiphop(duration=16, tempo=90, seed=7)
+    pattern.regenerate_bar(3)                 # new random bar 3, others kept
+    pattern.mutate_bar(5, lambda notes: [n for n in notes if n[0] != 2])
+    data = pattern.to_bytes()                 # re-encodes only what changed
+
+Notes of a bar are (track, channel, pitch, start, length, velocity) with
+start relative to the bar; notes are clamped at the bar end so bars stay
+independent. The output is byte-identical to midi_writer.write_midi for
+the same notes.
+
+A block stores the tick of its first event and the tick and running
+status of its last event separately from the encoded bytes: the first
+delta-time and the status byte of the first event depend on the previous
+bar and are written when the chunk is assembled.
+"""
+
+import random
+import struct
+
+from fl_midi_generator.midi_generator import (
+    BASS_CHANNEL, EVEN_RHYTHM_DURATIONS, MELODY_CHANNEL, STEP_TICKS, TICKS_PER_BAR,
+    _bass_bar, _melody_bar, _normalize_components, _second_voice, write_bytes_output,
+)
+from fl_midi_generator.midi_writer import TICKS_PER_QUARTER, _header_and_tempo, _vlq
+from fl_midi_generator.note_buffer import NoteBuffer
+
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def _encode_block(notes):
+    """
+    Encode the notes of one bar and track into an event block
+
+    Parameters:
+    - notes: (channel, pitch, start, length, velocity), start relative to the bar
+
+    Returns (first tick, first status, bytes after the first delta-time and
+    status, last tick, last status), or None if the bar has no events.
+    Same-pitch truncation and event order are the same as in write_midi.
+    """
+    # Обрезаем ноту там, где та же нота начинается снова; из одинаковых
+    # нот в одном тике остается последняя
+    order = sorted(range(len(notes)), key=lambda i: (notes[i][0], notes[i][1], notes[i][2]))
+    events = []
+    for position, i in enumerate(order):
+        channel, pitch, start, length, velocity = notes[i]
+        end = start + length
+        if position + 1 < len(order):
+            following = notes[order[position + 1]]
+            if following[0] == channel and following[1] == pitch:
+                end = min(end, following[2])
+        if end > start:
+            events.append((end, 0, channel, pitch, 0))
+            events.append((start, 1, channel, pitch, velocity))
+    if not events:
+        return None
+    events.sort(key=lambda event: event[:4])
+
+    out = bytearray()
+    first_tick = last_tick = events[0][0]
+    first_status = status = 0x90 | events[0][2]
+    for tick, _, channel, pitch, velocity in events:
+        if out:
+            out += _vlq(tick - last_tick)
+            if 0x90 | channel != status:
+                status = 0x90 | channel
+                out.append(status)
+        out.append(pitch)
+        out.append(velocity)
+        last_tick = tick
+    return first_tick, first_status, bytes(out), last_tick, status
+
+
+def _track_pieces(blocks, ticks_per_bar):
+    """
+    Body of a track chunk as a list of bytes pieces
+
+    Parameters:
+    - blocks: (bar index, block or None) pairs in bar order, blocks as
+      returned by _encode_block
+    - ticks_per_bar: bar length in ticks
+
+    Block bodies are referenced, not copied: only the first delta-time and
+    status byte of every block are new bytes. Ends with End of Track.
+    """
+    pieces = []
+    previous_tick = 0
+    running_status = -1
+    for index, block in blocks:
+        if block is None:
+            continue
+        first_tick, first_status, body, last_tick, last_status = block
+        bar_start = index * ticks_per_bar
+        # Первая delta-time и статус зависят от предыдущего такта
+        prefix = _vlq(bar_start + first_tick - previous_tick)
+        if first_status != running_status:
+            prefix += bytes((first_status,))
+        pieces.append(prefix)
+        pieces.append(body)
+        previous_tick = bar_start + last_tick
+        running_status = last_status
+    pieces.append(_END_OF_TRACK)
+    return pieces
+
+
+class BarPattern:
+    """
+    Pattern of individually addressable bars with cached encoded blocks
+
+    Parameters:
+    - num_tracks: number of note tracks
+    - tempo: beats per minute
+    - bar_factory: optional function (bar index, rng) -> notes of a new bar,
+      used by regenerate_bar (see hiphop_bar_factory, melody_bar_factory)
+    - ticks_per_bar: bar length in ticks
+
+    Attributes encoded_blocks and encoded_chunks count how many bar blocks
+    and track chunks were encoded so far.
+    """
+
+    def __init__(self, num_tracks, tempo, bar_factory=None, ticks_per_bar=TICKS_PER_BAR):
+        self.num_tracks = num_tracks
+        self.tempo = tempo
+        self.bar_factory = bar_factory
+        self.ticks_per_bar = ticks_per_bar
+        self._bars = []  # ноты такта, время от начала такта
+        self._blocks = []  # такт -> список блоков по трекам или None (не закодирован)
+        self._chunks = [None] * num_tracks  # готовые MTrk-чанки
+        self._header = _header_and_tempo(num_tracks, tempo, TICKS_PER_QUARTER)
+        self.encoded_blocks = 0
+        self.encoded_chunks = 0
+
+    @classmethod
+    def from_bars(cls, bars, num_tracks, tempo, bar_factory=None, ticks_per_bar=TICKS_PER_BAR):
+        """
+        Build a pattern from bars with absolute times, as yielded by
+        iter_random_midi_bars / iter_hiphop_beat_bars
+        """
+        pattern = cls(num_tracks, tempo, bar_factory, ticks_per_bar)
+        for index, bar in enumerate(bars):
+            offset = index * ticks_per_bar
+            pattern.append_bar([(track, channel, pitch, start - offset, length, velocity)
+                                for track, channel, pitch, start, length, velocity in bar])
+        return pattern
+
+    @classmethod
+    def hiphop(cls, duration=4, tempo=90, scale=None, components=None, seed=None):
+        """
+        Hip-hop beat with independently generated bars that can be regenerated
+        """
+        components = _normalize_components(components)
+        rng = random.Random(seed) if seed is not None else random
+        factory = hiphop_bar_factory(scale, components)
+        pattern = cls(len(components), tempo, factory)
+        for index in range(duration):
+            pattern.append_bar(factory(index, rng))
+        return pattern
+
+    def __len__(self):
+        return len(self._bars)
+
+    def _clamp(self, notes):
+        bar_length = self.ticks_per_bar
+        clamped = []
+        for track, channel, pitch, start, length, velocity in notes:
+            if not 0 <= track < self.num_tracks:
+                raise ValueError(f"note on track {track}, but the pattern has {self.num_tracks} tracks")
+            if not 0 <= start < bar_length:
+                raise ValueError(f"note start {start} is outside the bar (0..{bar_length - 1})")
+            clamped.append((track, channel, pitch, start, min(length, bar_length - start), velocity))
+        return clamped
+
+    def _invalidate(self, index, tracks):
+        self._blocks[index] = None
+        for track in tracks:
+            self._chunks[track] = None
+
+    def bar(self, index):
+        """
+        Notes of a bar (start relative to the bar), as a new list
+        """
+        return list(self._bars[index])
+
+    def set_bar(self, index, notes):
+        """
+        Replace the notes of a bar; only the tracks that change are rebuilt
+        """
+        notes = self._clamp(notes)
+        old = self._bars[index]
+        self._bars[index] = notes
+        changed = {note[0] for note in old} | {note[0] for note in notes}
+        self._invalidate(index, changed)
+
+    def append_bar(self, notes=()):
+        """
+        Add a bar at the end
+        """
+        notes = self._clamp(notes)
+        self._bars.append(notes)
+        self._blocks.append(None)
+        for track in {note[0] for note in notes}:
+            self._chunks[track] = None
+
+    def mutate_bar(self, index, function):
+        """
+        Replace a bar with function(notes of the bar)
+        """
+        self.set_bar(index, function(self.bar(index)))
+
+    def regenerate_bar(self, index, rng=random):
+        """
+        Replace a bar with a new one from the bar factory
+        """
+        if self.bar_factory is None:
+            raise ValueError("pattern has no bar_factory to regenerate bars with")
+        self.set_bar(index, self.bar_factory(index, rng))
+
+    def _bar_blocks(self, index):
+        blocks = self._blocks[index]
+        if blocks is None:
+            by_track = [[] for _ in range(self.num_tracks)]
+            for track, channel, pitch, start, length, velocity in self._bars[index]:
+                by_track[track].append((channel, pitch, start, length, velocity))
+            blocks = [_encode_block(notes) if notes else None for notes in by_track]
+            self._blocks[index] = blocks
+            self.encoded_blocks += 1
+        return blocks
+
+    def _track_chunk(self, track):
+        chunk = self._chunks[track]
+        if chunk is not None:
+            return chunk
+        body = b"".join(_track_pieces(((index, self._bar_blocks(index)[track])
+                                       for index in range(len(self._bars))), self.ticks_per_bar))
+        chunk = b"MTrk" + struct.pack(">I", len(body)) + body
+        self._chunks[track] = chunk
+        self.encoded_chunks += 1
+        return chunk
+
+    def to_bytes(self):
+        """
+        The pattern as a MIDI file; only changed bars and tracks are re-encoded
+        """
+        return self._header + b"".join(self._track_chunk(track) for track in range(self.num_tracks))
+
+    def write(self, output_file, message=None):
+        """
+        Write the pattern to a path, file-like object or buffer (see write_output)
+        """
+        return write_bytes_output(output_file, self.to_bytes(), message or f"MIDI file created: {output_file}")
+
+    def notes(self):
+        """
+        All notes with absolute times, as a NoteBuffer
+        """
+        notes = NoteBuffer()
+        for index, bar in enumerate(self._bars):
+            offset = index * self.ticks_per_bar
+            notes.extend([(track, channel, pitch, offset + start, length, velocity)
+                          for track, channel, pitch, start, length, velocity in bar])
+        return notes
+
+
+def hiphop_bar_factory(scale=None, components=None):
+    """
+    Bar factory for hip-hop beats: drums, bass on the kick and melody, one bar
+
+    Each call generates an independent bar (no loop repetition), tracks are
+    assigned in the order of components as in generate_hiphop_beat.
+    """
+    from fl_midi_generator.drum_matrix import DRUM_COMPONENTS, generate_drum_matrix, matrix_to_notes
+
+    if scale is None:
+        scale = [0, 3, 5, 7, 10]  # C minor pentatonic
+    components = _normalize_components(components)
+    track_map = {component: i for i, component in enumerate(components)}
+    drum_rows = [i for i, name in enumerate(DRUM_COMPONENTS) if name in track_map]
+    drum_tracks = [track_map[DRUM_COMPONENTS[i]] for i in drum_rows]
+    kick_row = DRUM_COMPONENTS.index("kick")
+
+    def factory(index, rng):
+        import numpy as np
+
+        drum_matrix = generate_drum_matrix(1, DRUM_COMPONENTS, np.random.default_rng(rng.getrandbits(64)))
+        notes = matrix_to_notes(drum_matrix[drum_rows], drum_tracks, STEP_TICKS)
+        kick_steps = [int(step) for step in np.nonzero(drum_matrix[kick_row])[0]]
+        bass = _bass_bar(kick_steps, scale, rng)
+        melody, _ = _melody_bar(scale, 84, 1, 2 * STEP_TICKS, None, rng)
+        if "bass" in track_map:
+            notes.extend((track_map["bass"], BASS_CHANNEL, pitch, start, length, velocity)
+                         for start, length, pitch, velocity in bass)
+        if "melody" in track_map:
+            notes.extend((track_map["melody"], MELODY_CHANNEL, pitch, start, length, velocity)
+                         for start, length, pitch, velocity in melody)
+        return notes
+
+    return factory
+
+
+def melody_bar_factory(scale=None, even_rhythm=False, base_octave=84, octave_range=1,
+                       generate_second_voice=False, second_voice_octave_offset=0, seed=None):
+    """
+    Bar factory for melodies, same parameters as generate_random_midi
+
+    With even_rhythm the note length is drawn once, here (from seed, or
+    the global random module if None), and every bar uses it, as in
+    generate_random_midi.
+    """
+    if scale is None:
+        scale = [0, 2, 4, 5, 7, 9, 11]  # C major scale intervals
+    rng = random.Random(seed) if seed is not None else random
+    note_length = rng.choice(EVEN_RHYTHM_DURATIONS) if even_rhythm else None
+    scale_classes = {interval % 12 for interval in scale}
+    scale_pitches = [p for p in range(128) if (p - base_octave) % 12 in scale_classes]
+
+    def factory(index, rng):
+        melody, _ = _melody_bar(scale, base_octave, octave_range, note_length, None, rng)
+        notes = [(0, MELODY_CHANNEL, pitch, start, length, velocity)
+                 for start, length, pitch, velocity in melody]
+        if generate_second_voice:
+            notes.extend((1, MELODY_CHANNEL, pitch, start, length, velocity)
+                         for start, length, pitch, velocity
+                         in _second_voice(melody, scale_pitches, second_voice_octave_offset))
+        return notes
+
+    return factory
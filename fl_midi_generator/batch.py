@@ -0,0 +1,401 @@
+"""
+Parallel batch rendering of MIDI files.
+
+Fans a list of job specs out over a process pool and streams the results
+back as jobs finish. A failing job is reported in its result and never
+stops the rest of the batch.
+
+Command line usage:
+
+    python -m fl_midi_generator.batch jobs.json --workers 8
+    python -m fl_midi_generator.batch --catalog 7 --start 0 --count 10000
+    python -m fl_midi_generator.batch --catalog 7 --count 1000000 --corpus beats.corpus
+    python -m fl_midi_generator.batch --catalog 7 --count 1000 --preview
+    python -m fl_midi_generator.batch --catalog 7 --count 1000 --keep 10
+
+The jobs file is either a JSON array of job specs or one JSON job spec per
+line. Example job spec:
+
+    {"style": "Trap", "tempo": 92, "duration": 4,
+     "components": ["kick", "snare", "hihat"], "output": "trap_001.mid"}
+
+A job spec with catalog_seed and index renders that pattern of a seeded
+catalog (see seeding.py): the result does not depend on the worker count
+or on the order in which jobs run.
+
+    {"catalog_seed": 7, "index": 1000000, "output": "beat_1000000.mid"}
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fl_midi_generator.midi_generator import generate_random_midi, hiphop_styles
+from fl_midi_generator.seeding import catalog_pattern
+
+# Result of one job: index is the position of the job in the input list
+JobResult = namedtuple("JobResult", ["index", "output", "ok", "message", "elapsed"])
+
+
+def job_to_kwargs(job):
+    """
+    Convert a job spec into keyword arguments for generate_random_midi
+
+    Parameters:
+    - job: dict with the keys style, scale, tempo, duration, components,
+      catalog_seed, index, group and output (and preview, see
+      render_job). Any other key is passed to generate_random_midi
+      unchanged.
+
+    A job with a style is rendered as a hip-hop beat; the scale defaults to
+    the scale of that style. A job with catalog_seed and index takes style,
+    tempo and seed from that catalog pattern (keys given in the job win)
+    and defaults to 4 bars.
+    """
+    kwargs = dict(job)
+    if "output" not in kwargs:
+        raise ValueError("job spec has no 'output' path")
+    kwargs["output_file"] = kwargs.pop("output")
+
+    kwargs.pop("group", None)  # только для отбора (см. job_group)
+    catalog_seed = kwargs.pop("catalog_seed", None)
+    index = kwargs.pop("index", None)
+    if catalog_seed is not None or index is not None:
+        if catalog_seed is None or index is None:
+            raise ValueError("a catalog job needs both 'catalog_seed' and 'index'")
+        pattern = catalog_pattern(catalog_seed, index)
+        for key in ("style", "tempo", "seed"):
+            kwargs.setdefault(key, pattern[key])
+        kwargs.setdefault("duration", 4)
+
+    style = kwargs.pop("style", None)
+    components = kwargs.pop("components", None)
+    if style is not None:
+        if style not in hiphop_styles:
+            raise ValueError(f"unknown style {style!r}, expected one of {sorted(hiphop_styles)}")
+        kwargs.setdefault("scale", hiphop_styles[style])
+        kwargs["hiphop_style"] = True
+    if components is not None:
+        kwargs["hiphop_components"] = components
+        kwargs["hiphop_style"] = True
+    return kwargs
+
+
+def render_job(index, job):
+    """
+    Render a single job and return its JobResult, capturing any error
+
+    A job with a preview key also writes a WAV preview of the result to
+    that path (see preview.py).
+    """
+    started = time.perf_counter()
+    output = job.get("output") if isinstance(job, dict) else None
+    try:
+        kwargs = job_to_kwargs(job)
+        preview = kwargs.pop("preview", None)
+        if preview is None:
+            message = generate_random_midi(**kwargs)
+        else:
+            message = _render_with_preview(kwargs, preview)
+        ok = True
+    except Exception as e:
+        message = "".join(traceback.format_exception_only(type(e), e)).strip()
+        ok = False
+    return JobResult(index, output, ok, message, time.perf_counter() - started)
+
+
+def _render_with_preview(kwargs, preview):
+    # MIDI рендерится в память, пишется в output и озвучивается в WAV
+    from fl_midi_generator.midi_generator import write_bytes_output
+
+    output = kwargs["output_file"]
+    data = generate_random_midi(**dict(kwargs, output_file=None))
+    write_bytes_output(output, data, None)
+    _write_preview(data, preview, kwargs)
+    return f"MIDI file created: {output}, preview: {preview}"
+
+
+def _write_preview(data, preview, kwargs):
+    # numpy загружается только для заданий с превью
+    from fl_midi_generator.midi_reader import parse_midi
+    from fl_midi_generator.preview import render_midi, write_wav
+
+    write_wav(preview, render_midi(parse_midi(data), _job_components(kwargs)))
+
+
+def _job_components(kwargs):
+    # Компонент каждого трека хип-хоп бита, None для мелодий
+    from fl_midi_generator.midi_generator import _normalize_components
+
+    if not kwargs.get("hiphop_style"):
+        return None
+    return _normalize_components(kwargs.get("hiphop_components"))
+
+
+def _render_chunk(chunk):
+    # Выполняется в рабочем процессе: несколько заданий за один вызов,
+    # чтобы не платить за пересылку каждого маленького задания отдельно
+    return [render_job(index, job) for index, job in chunk]
+
+
+def _map_chunks(function, chunks, workers):
+    # (chunk, результаты или None, ошибка) по мере готовности чанков
+    if workers == 1:
+        for chunk in chunks:
+            yield chunk, function(chunk), None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(function, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def render_batch(jobs, workers=None, chunksize=1):
+    """
+    Render many jobs in parallel, yielding a JobResult as each job finishes
+
+    Parameters:
+    - jobs: iterable of job specs (see job_to_kwargs)
+    - workers: number of worker processes (None = number of CPU cores,
+      1 = render in the current process without a pool)
+    - chunksize: number of jobs sent to a worker at once; larger chunks
+      reduce overhead for many short jobs
+
+    Results arrive in completion order, use JobResult.index to match them
+    with the input.
+    """
+    indexed = list(enumerate(jobs))
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    if workers == 1:
+        for index, job in indexed:
+            yield render_job(index, job)
+        return
+
+    chunks = [indexed[i:i + chunksize] for i in range(0, len(indexed), chunksize)]
+    for chunk, results, error in _map_chunks(_render_chunk, chunks, workers):
+        if error is not None:
+            # The worker itself died (e.g. killed or unpicklable job):
+            # report every job of the chunk as failed and keep going
+            results = [_failed(index, job, f"worker failed: {error!r}") for index, job in chunk]
+        for result in results:
+            yield result
+
+
+def _failed(index, job, message, elapsed=0.0):
+    return JobResult(index, job.get("output") if isinstance(job, dict) else None, False, message, elapsed)
+
+
+def job_group(job):
+    """
+    Selection group of a job spec: its group or style key, the style of
+    its catalog pattern, or None
+    """
+    group = job.get("group", job.get("style"))
+    if group is None and job.get("catalog_seed") is not None and job.get("index") is not None:
+        group = catalog_pattern(job["catalog_seed"], job["index"])["style"]
+    return group
+
+
+def _score_chunk(chunk):
+    # В рабочем процессе: задания рендерятся в память и оцениваются все
+    # разом; возвращаются (индекс, группа, оценка, MIDI-байты) и ошибки
+    from fl_midi_generator.midi_reader import parse_midi
+    from fl_midi_generator.scoring import CandidateBatch, score_batch
+
+    batch = CandidateBatch()
+    rendered = []
+    failed = []
+    for index, job in chunk:
+        started = time.perf_counter()
+        try:
+            kwargs = job_to_kwargs(job)
+            kwargs.pop("preview", None)
+            data = generate_random_midi(**dict(kwargs, output_file=None))
+            scale = kwargs.get("scale")
+            if scale is None and kwargs.get("hiphop_style"):
+                scale = [0, 3, 5, 7, 10]  # C minor pentatonic, как у хип-хоп бита
+            batch.add_midi(parse_midi(data), kwargs.get("duration", 8), scale, _job_components(kwargs))
+            rendered.append((index, job_group(job), data, time.perf_counter() - started))
+        except Exception as e:
+            message = "".join(traceback.format_exception_only(type(e), e)).strip()
+            failed.append(_failed(index, job, message, time.perf_counter() - started))
+    scores = score_batch(batch)["score"] if rendered else []
+    return [(index, group, float(score), data, elapsed)
+            for (index, group, data, elapsed), score in zip(rendered, scores)], failed
+
+
+def select_batch(jobs, keep, workers=None, chunksize=64):
+    """
+    Render and score many jobs, write only the best keep per group
+
+    Parameters:
+    - jobs: iterable of job specs (see job_to_kwargs); a job's group is
+      its group key or its style (see job_group)
+    - keep: number of results written per group
+    - workers, chunksize: see render_batch; every chunk is scored as one
+      batch (see scoring.py)
+
+    Candidates are rendered and scored in memory; only the best keep of
+    every group are ever kept (a heap per group) and written, so rejects
+    never touch the disk. Yields a JobResult per failed job as it fails,
+    then one per written result, best first within each group.
+    """
+    import heapq
+
+    indexed = list(enumerate(jobs))
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    chunks = [indexed[i:i + chunksize] for i in range(0, len(indexed), chunksize)]
+    best = {}  # группа -> куча (оценка, -индекс, MIDI, время)
+    for chunk, results, error in _map_chunks(_score_chunk, chunks, workers):
+        if error is not None:
+            for index, job in chunk:
+                yield _failed(index, job, f"worker failed: {error!r}")
+            continue
+        candidates, failed = results
+        yield from failed
+        for index, group, score, data, elapsed in candidates:
+            heap = best.setdefault(group, [])
+            item = (score, -index, data, elapsed)
+            if len(heap) < keep:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+
+    from fl_midi_generator.midi_generator import write_bytes_output
+
+    for group in sorted(best, key=str):
+        for score, negative_index, data, elapsed in sorted(best[group], key=lambda item: item[:2], reverse=True):
+            index, job = indexed[-negative_index]
+            started = time.perf_counter()
+            try:
+                kwargs = job_to_kwargs(job)
+                write_bytes_output(kwargs["output_file"], data, None)
+                if kwargs.get("preview") is not None:
+                    _write_preview(data, kwargs["preview"], kwargs)
+                message = f"kept {kwargs['output_file']} ({group or 'all'}, score {score:.3f})"
+                yield JobResult(index, job["output"], True, message, elapsed + time.perf_counter() - started)
+            except Exception as e:
+                message = "".join(traceback.format_exception_only(type(e), e)).strip()
+                yield _failed(index, job, message)
+
+
+def catalog_jobs(catalog_seed, start, count, output_pattern="catalog_{index:07d}.mid", **extra):
+    """
+    Job specs for patterns start .. start + count - 1 of a seeded catalog
+
+    Parameters:
+    - catalog_seed: catalog seed (see seeding.py)
+    - start, count: range of pattern numbers
+    - output_pattern: output path, formatted with the pattern index
+    - extra: more job spec keys for every job (duration, components, ...)
+    """
+    for index in range(start, start + count):
+        yield dict(extra, catalog_seed=catalog_seed, index=index,
+                   output=output_pattern.format(index=index))
+
+
+def load_jobs(path):
+    """
+    Load job specs from a JSON array file or a JSON lines file ("-" = stdin)
+    """
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        return json.loads(stripped)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fl_midi_generator.batch",
+        description="Render a batch of MIDI files in parallel")
+    parser.add_argument("jobs", nargs="?",
+                        help="JSON file with job specs (array or JSON lines), '-' for stdin")
+    parser.add_argument("--catalog", type=int, metavar="SEED",
+                        help="render patterns of a seeded catalog instead of a jobs file")
+    parser.add_argument("--start", type=int, default=0, help="first catalog pattern (default: 0)")
+    parser.add_argument("--count", type=int, default=100, help="number of catalog patterns (default: 100)")
+    parser.add_argument("--duration", type=int, default=4, help="catalog pattern length in bars (default: 4)")
+    parser.add_argument("--output-pattern", default="catalog_{index:07d}.mid",
+                        help="catalog output path, formatted with {index}")
+    parser.add_argument("--corpus", metavar="PATH",
+                        help="append the catalog patterns to a packed corpus instead of .mid files")
+    parser.add_argument("--preview", action="store_true",
+                        help="also write a WAV preview next to every MIDI file")
+    parser.add_argument("--keep", type=int, metavar="K",
+                        help="score all jobs in memory and write only the K best per style")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPU cores)")
+    parser.add_argument("-c", "--chunksize", type=int, default=1,
+                        help="jobs sent to a worker at once (default: 1)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only report failed jobs and the summary")
+    args = parser.parse_args(argv)
+
+    if (args.jobs is None) == (args.catalog is None):
+        parser.error("give either a jobs file or --catalog")
+    if args.corpus is not None:
+        if args.catalog is None:
+            parser.error("--corpus needs --catalog")
+        # numpy нужен только здесь - не загружаем его при импорте batch
+        from fl_midi_generator.corpus import build_catalog_corpus
+
+        started = time.perf_counter()
+        first = build_catalog_corpus(args.corpus, args.catalog, args.start, args.count, args.duration,
+                                     workers=args.workers, chunksize=max(args.chunksize, 256))
+        print(f"{args.count} patterns appended to {args.corpus} as #{first}..#{first + args.count - 1} "
+              f"in {time.perf_counter() - started:.2f} s")
+        return 0
+    if args.catalog is not None:
+        jobs = list(catalog_jobs(args.catalog, args.start, args.count, args.output_pattern,
+                                 duration=args.duration))
+    else:
+        jobs = load_jobs(args.jobs)
+    if args.preview:
+        for job in jobs:
+            if isinstance(job, dict) and "output" in job:
+                job.setdefault("preview", os.path.splitext(job["output"])[0] + ".wav")
+    started = time.perf_counter()
+    failed = 0
+    if args.keep is not None:
+        results = select_batch(jobs, args.keep, workers=args.workers, chunksize=max(args.chunksize, 64))
+    else:
+        results = render_batch(jobs, workers=args.workers, chunksize=args.chunksize)
+    written = 0
+    for result in results:
+        if not result.ok:
+            failed += 1
+            print(f"[{result.index}] FAILED {result.output}: {result.message}", file=sys.stderr)
+        else:
+            written += 1
+            if not args.quiet:
+                print(f"[{result.index}] {result.message} ({result.elapsed * 1000:.1f} ms)")
+
+    elapsed = time.perf_counter() - started
+    workers = args.workers or os.cpu_count()
+    kept = f", {written} kept" if args.keep is not None else ""
+    print(f"{len(jobs) - failed}/{len(jobs)} jobs done in {elapsed:.2f} s "
+          f"with {workers} workers{kept}, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
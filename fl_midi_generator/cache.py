@@ -0,0 +1,187 @@
+"""
+Two-tier cache for rendered MIDI files.
+
+A bounded in-memory LRU sits in front of an optional on-disk store. Both
+are addressed by a canonical hash of all generation parameters, so the
+same (style, scale, tempo, duration, components, seed, ...) combination is
+generated and serialized only once.
+
+    cache = PatternCache(max_items=256, directory="~/.cache/fl_midi_generator")
+    generate_random_midi("beat.mid", seed=42, hiphop_style=True, cache=cache)
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Меняется, когда генераторы начинают выдавать другой результат для тех же
+# параметров - старые записи кэша тогда просто перестают находиться
+CACHE_VERSION = 4
+
+
+def cache_key(params):
+    """
+    Canonical hash of generation parameters
+
+    Parameters:
+    - params: dict of JSON-serializable parameter values
+
+    Key order does not matter, tuples and lists are treated the same.
+    """
+    canonical = json.dumps({"version": CACHE_VERSION, "params": params},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PatternCache:
+    """
+    In-memory LRU + on-disk content-addressed store of MIDI bytes
+
+    Parameters:
+    - max_items: number of entries kept in memory (0 disables the memory tier)
+    - directory: directory of the on-disk store (None disables the disk tier)
+    - max_disk_bytes: size limit of the on-disk store; the least recently
+      used files are removed when it is exceeded
+    """
+
+    def __init__(self, max_items=256, directory=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_items = max_items
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _path(self, key):
+        # Раскладываем по подкаталогам, чтобы не держать все файлы в одном
+        return os.path.join(self.directory, key[:2], key + ".mid")
+
+    def _disk_entries(self):
+        # (path, size, last use) of every stored file
+        for prefix in os.scandir(self.directory):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.endswith(".mid"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _remember(self, key, data):
+        if self.max_items <= 0:
+            return
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return cached MIDI bytes for the key, or None
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # время последнего использования для вытеснения
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """
+        Store MIDI bytes under the key in both tiers
+        """
+        data = bytes(data)
+        with self._lock:
+            self._remember(key, data)
+        if not self.directory:
+            return
+
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и переименовываем - читатели не увидят
+        # недописанный файл, даже из других процессов
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        # Удаляем давно не использованные файлы, пока не уложимся в лимит
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """
+        Remove all entries from both tiers (counters are kept)
+        """
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            for path, _, _ in list(self._disk_entries()):
+                os.unlink(path)
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        """
+        Hit/miss counters and current sizes, for sizing the cache
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": sum(len(data) for data in self._memory.values()),
+                "disk_bytes": self._disk_bytes,
+            }
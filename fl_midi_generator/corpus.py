@@ -0,0 +1,407 @@
+"""
+Packed binary corpus of generated hip-hop beats.
+
+Millions of beats in two files instead of millions of .mid files:
+
+- NAME (records): a 16 byte header and one fixed-width record per beat with
+  style, tempo, scale (12 bit pitch class mask), duration, seed, component
+  order and the drum loop as bit-packed step grids (one uint64 per drum,
+  bit N = sixteenth step N of the loop);
+- NAME.notes: per beat, the drum velocities (one byte per set grid bit)
+  followed by the bass and melody notes of the loop as packed 7 byte
+  entries. A record holds the offset and count of its entries.
+
+Beats are stored as their loop (up to HIPHOP_LOOP_BARS bars, see
+iter_hiphop_beat_bars) and repeated to the full duration on export, which
+is byte-identical to generate_hiphop_beat with the same parameters.
+
+    with CorpusWriter("beats.corpus") as writer:      # append mode
+        writer.add_beat(duration=4, tempo=90, scale=hiphop_styles["Trap"], seed=1, style="Trap")
+
+    with Corpus("beats.corpus") as corpus:            # mmap, O(1) access
+        print(len(corpus), corpus.pattern(0))
+        corpus.to_midi(0, "beat_0.mid")
+        slow = corpus.records[corpus.records["tempo"] < 85]   # scan without parsing
+"""
+
+import mmap
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import DRUM_CHANNEL, DRUM_COMPONENTS, DRUM_NOTE
+from fl_midi_generator.midi_generator import (
+    BASS_CHANNEL, HIPHOP_COMPONENTS, HIPHOP_LOOP_BARS, MELODY_CHANNEL, STEP_TICKS, TICKS_PER_BAR,
+    _normalize_components, hiphop_styles, iter_hiphop_beat_bars, write_bytes_output,
+)
+from fl_midi_generator.midi_writer import write_midi
+from fl_midi_generator.note_buffer import NoteBuffer
+from fl_midi_generator.seeding import catalog_pattern
+
+MAGIC = b"FLMCORP1"
+NOTES_MAGIC = b"FLMNOTE1"
+VERSION = 1
+HEADER = struct.Struct("<8sII")  # magic, version, record size
+STYLE_NAMES = list(hiphop_styles)
+CUSTOM_STYLE = 255
+NO_COMPONENT = 255
+MAX_LOOP_STEPS = 64  # шагов в uint64-сетке
+
+RECORD_DTYPE = np.dtype([
+    ("notes_offset", "<u8"),
+    ("seed", "<u8"),
+    ("tempo", "<f8"),
+    ("drums", "<u8", (len(DRUM_COMPONENTS),)),
+    ("duration", "<u4"),
+    ("note_count", "<u4"),
+    ("velocity_count", "<u2"),
+    ("scale_mask", "<u2"),
+    ("style", "u1"),
+    ("loop_bars", "u1"),
+    ("flags", "u1"),  # бит 0: seed задан
+    ("components", "u1", (len(HIPHOP_COMPONENTS),)),
+    ("reserved", "u1", (4,)),
+])
+NOTE_DTYPE = np.dtype([
+    ("component", "u1"),  # индекс в HIPHOP_COMPONENTS
+    ("pitch", "u1"),
+    ("start", "<u2"),  # тики от начала лупа
+    ("length", "<u2"),
+    ("velocity", "u1"),
+])
+_CHANNELS = {"bass": BASS_CHANNEL, "melody": MELODY_CHANNEL}
+
+
+def scale_to_mask(scale):
+    mask = 0
+    for degree in scale:
+        mask |= 1 << (degree % 12)
+    return mask
+
+
+def mask_to_scale(mask):
+    return [degree for degree in range(12) if mask >> degree & 1]
+
+
+def pack_loop(loop_notes, loop_bars, duration, tempo, scale, components, style=None, seed=None):
+    """
+    Pack the loop of a beat into a record and its notes section entry
+
+    Parameters:
+    - loop_notes: notes of the loop bars, (track, channel, pitch, start,
+      length, velocity) with start from the loop start; tracks follow
+      the order of components
+    - loop_bars, duration: loop length and full beat length in bars
+    - tempo, scale, components, style, seed: beat parameters
+
+    Returns (record, notes bytes); record.notes_offset is set on write.
+    """
+    components = _normalize_components(components)
+    if loop_bars * 16 > MAX_LOOP_STEPS:
+        raise ValueError(f"loop of {loop_bars} bars does not fit into a {MAX_LOOP_STEPS} step grid")
+    record = np.zeros(1, dtype=RECORD_DTYPE)[0]
+    record["tempo"] = tempo
+    record["duration"] = duration
+    record["loop_bars"] = loop_bars
+    record["scale_mask"] = scale_to_mask(scale)
+    if style is None:
+        record["style"] = CUSTOM_STYLE
+    else:
+        record["style"] = STYLE_NAMES.index(style)
+    if seed is not None:
+        record["seed"] = seed & ((1 << 64) - 1)
+        record["flags"] = 1
+    order = [HIPHOP_COMPONENTS.index(name) for name in components]
+    record["components"] = order + [NO_COMPONENT] * (len(HIPHOP_COMPONENTS) - len(order))
+
+    drums = np.zeros((len(DRUM_COMPONENTS), MAX_LOOP_STEPS), dtype=np.uint8)
+    entries = []
+    for track, channel, pitch, start, length, velocity in loop_notes:
+        name = components[track]
+        if name in DRUM_COMPONENTS:
+            drums[DRUM_COMPONENTS.index(name), start // STEP_TICKS] = velocity
+        else:
+            entries.append((HIPHOP_COMPONENTS.index(name), pitch, start, length, velocity))
+
+    hits = drums != 0
+    bits = np.packbits(hits, axis=1, bitorder="little")  # (drums, 8) байт
+    record["drums"] = bits.view("<u8")[:, 0]
+    velocities = drums[hits]  # по дорожкам, шаги по возрастанию
+    record["velocity_count"] = len(velocities)
+    record["note_count"] = len(entries)
+    return record, velocities.tobytes() + np.array(entries, dtype=NOTE_DTYPE).tobytes()
+
+
+def pack_beat(duration=4, tempo=90, scale=None, components=None, seed=None, style=None):
+    """
+    Generate a beat (as generate_hiphop_beat does) and pack it, see pack_loop
+    """
+    if scale is None:
+        scale = hiphop_styles[style] if style else [0, 3, 5, 7, 10]
+    components = _normalize_components(components)
+    rng = random.Random(seed) if seed is not None else random
+    loop_bars = max(1, min(duration, HIPHOP_LOOP_BARS))
+    loop_notes = []
+    # Генератор повторяет луп, поэтому достаточно первых loop_bars тактов
+    for bar, notes in zip(range(loop_bars), iter_hiphop_beat_bars(duration, scale, components, rng)):
+        loop_notes.extend(notes)
+    return pack_loop(loop_notes, loop_bars, duration, tempo, scale, components, style, seed)
+
+
+class CorpusWriter:
+    """
+    Appends beats to a corpus (creates it if needed)
+
+    Parameters:
+    - path: records file; the notes section goes to path + ".notes"
+
+    A torn record left by an interrupted writer is cut off on open.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = open(path, "ab+")
+        self._notes = open(path + ".notes", "ab+")
+        size = self._records.seek(0, os.SEEK_END)
+        if size == 0:
+            self._records.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize))
+            self._records.flush()
+        else:
+            _check_header(self._records, path)
+            count = (size - HEADER.size) // RECORD_DTYPE.itemsize
+            self._records.truncate(HEADER.size + count * RECORD_DTYPE.itemsize)
+        if self._notes.seek(0, os.SEEK_END) == 0:
+            self._notes.write(NOTES_MAGIC)
+            self._notes.flush()
+        self.count = (self._records.seek(0, os.SEEK_END) - HEADER.size) // RECORD_DTYPE.itemsize
+
+    def add_packed(self, record, notes):
+        """
+        Append a packed beat (see pack_loop); returns its index
+        """
+        record = np.array(record, dtype=RECORD_DTYPE)
+        # Ноты дописываются раньше записи, которая на них ссылается
+        record["notes_offset"] = self._notes.seek(0, os.SEEK_END)
+        self._notes.write(notes)
+        self._records.seek(0, os.SEEK_END)
+        self._records.write(record.tobytes())
+        self.count += 1
+        return self.count - 1
+
+    def add_beat(self, duration=4, tempo=90, scale=None, components=None, seed=None, style=None):
+        """
+        Generate a beat and append it; returns its index
+        """
+        return self.add_packed(*pack_beat(duration, tempo, scale, components, seed, style))
+
+    def flush(self):
+        self._notes.flush()
+        self._records.flush()
+
+    def close(self):
+        self.flush()
+        self._notes.close()
+        self._records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(f, path):
+    f.seek(0)
+    magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a beat corpus")
+    if version != VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported corpus version {version} (record size {record_size})")
+
+
+def _map(f):
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Corpus:
+    """
+    Read-only memory-mapped view of a corpus
+
+    records is a NumPy structured array (RECORD_DTYPE) over the mapped
+    records file, so pattern N costs one index computation and whole
+    columns (tempo, style, ...) can be scanned without parsing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records_file = open(path, "rb")
+        self._notes_file = open(path + ".notes", "rb")
+        _check_header(self._records_file, path)
+        self._records_map = _map(self._records_file)
+        self._notes_map = _map(self._notes_file)
+        count = (len(self._records_map) - HEADER.size) // RECORD_DTYPE.itemsize
+        self.records = np.frombuffer(self._records_map, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _record(self, index):
+        if index < 0:
+            index += len(self.records)
+        if not 0 <= index < len(self.records):
+            raise IndexError(f"pattern {index} out of range (corpus has {len(self.records)})")
+        return self.records[index]
+
+    def pattern(self, index):
+        """
+        Parameters of a stored beat as a dict
+        """
+        record = self._record(index)
+        style = int(record["style"])
+        return {
+            "index": index,
+            "style": STYLE_NAMES[style] if style != CUSTOM_STYLE else None,
+            "tempo": float(record["tempo"]),
+            "scale": mask_to_scale(int(record["scale_mask"])),
+            "duration": int(record["duration"]),
+            "loop_bars": int(record["loop_bars"]),
+            "components": [HIPHOP_COMPONENTS[c] for c in record["components"] if c != NO_COMPONENT],
+            "seed": int(record["seed"]) if record["flags"] & 1 else None,
+        }
+
+    def _sections(self, record):
+        offset = int(record["notes_offset"])
+        velocity_count = int(record["velocity_count"])
+        velocities = np.frombuffer(self._notes_map, dtype=np.uint8, count=velocity_count, offset=offset)
+        entries = np.frombuffer(self._notes_map, dtype=NOTE_DTYPE, count=int(record["note_count"]),
+                                offset=offset + velocity_count)
+        return velocities, entries
+
+    def drum_matrix(self, index):
+        """
+        Drum loop as a (len(DRUM_COMPONENTS) x loop steps) velocity matrix
+        """
+        record = self._record(index)
+        steps = int(record["loop_bars"]) * 16
+        bits = record["drums"].astype("<u8").view(np.uint8).reshape(len(DRUM_COMPONENTS), 8)
+        hits = np.unpackbits(bits, axis=1, bitorder="little")[:, :steps].astype(bool)
+        velocities, _ = self._sections(record)
+        matrix = np.zeros((len(DRUM_COMPONENTS), steps), dtype=np.uint8)
+        matrix[hits] = velocities
+        return matrix
+
+    def notes(self, index):
+        """
+        All notes of the full-length beat as a NoteBuffer
+        """
+        record = self._record(index)
+        components = [HIPHOP_COMPONENTS[c] for c in record["components"] if c != NO_COMPONENT]
+        track_of = np.full(len(HIPHOP_COMPONENTS), 255, dtype=np.uint8)
+        for track, name in enumerate(components):
+            track_of[HIPHOP_COMPONENTS.index(name)] = track
+
+        loop = NoteBuffer()
+        matrix = self.drum_matrix(index)
+        for row, name in enumerate(DRUM_COMPONENTS):
+            if name not in components:
+                continue
+            steps = np.nonzero(matrix[row])[0]
+            loop.extend_columns(components.index(name), DRUM_CHANNEL, DRUM_NOTE,
+                                steps * STEP_TICKS, STEP_TICKS, matrix[row, steps])
+        _, entries = self._sections(record)
+        if len(entries):
+            channel = np.where(entries["component"] == HIPHOP_COMPONENTS.index("bass"),
+                               _CHANNELS["bass"], _CHANNELS["melody"])
+            loop.extend_columns(track_of[entries["component"]], channel, entries["pitch"],
+                                entries["start"], entries["length"], entries["velocity"])
+
+        # Луп повторяется до полной длины; последний повтор может быть неполным
+        loop_ticks = int(record["loop_bars"]) * TICKS_PER_BAR
+        total_ticks = int(record["duration"]) * TICKS_PER_BAR
+        cols = loop.columns()
+        repeats = -(-total_ticks // loop_ticks)
+        offsets = np.repeat(np.arange(repeats, dtype=np.int64) * loop_ticks, len(loop))
+        starts = np.tile(cols["start"], repeats) + offsets
+        keep = starts < total_ticks
+        notes = NoteBuffer()
+        notes.extend_columns(*(np.tile(cols[name], repeats)[keep] if name != "start" else starts[keep]
+                               for name in ("track", "channel", "pitch", "start", "length", "velocity")))
+        return notes
+
+    def to_midi(self, index, output_file=None):
+        """
+        Export a stored beat as a MIDI file (see write_output for destinations)
+
+        Returns bytes for output_file=None.
+        """
+        pattern = self.pattern(index)
+        data = write_midi(self.notes(index), len(pattern["components"]), pattern["tempo"])
+        return write_bytes_output(output_file, data, f"MIDI file created: {output_file}")
+
+    def close(self):
+        self.records = None
+        for mapped in (self._records_map, self._notes_map):
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # массивы вызывающего кода еще смотрят в файл, отображение закроет GC
+        self._records_file.close()
+        self._notes_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _pack_catalog_chunk(catalog_seed, indices, duration, components):
+    # Выполняется в рабочем процессе: упаковка без записи
+    packed = []
+    for index in indices:
+        pattern = catalog_pattern(catalog_seed, index)
+        packed.append(pack_beat(duration, pattern["tempo"], pattern["scale"], components,
+                                pattern["seed"], pattern["style"]))
+    return packed
+
+
+def build_catalog_corpus(path, catalog_seed, start, count, duration=4, components=None,
+                         workers=None, chunksize=256):
+    """
+    Append patterns start .. start + count - 1 of a seeded catalog to a corpus
+
+    Parameters:
+    - path: corpus records file (created or appended to)
+    - catalog_seed, start, count: catalog range (see seeding.py)
+    - duration, components: beat length and components
+    - workers: worker processes packing beats (None = number of CPU cores,
+      1 = pack in the current process)
+    - chunksize: patterns packed per worker call
+
+    Beats are packed in parallel and appended by this process in index
+    order, so the corpus is the same for any worker count. Returns the
+    corpus index of the first appended pattern.
+    """
+    chunks = [range(i, min(i + chunksize, start + count)) for i in range(start, start + count, chunksize)]
+    with CorpusWriter(path) as writer:
+        first = writer.count
+        if workers == 1:
+            results = (_pack_catalog_chunk(catalog_seed, chunk, duration, components) for chunk in chunks)
+            for packed in results:
+                for record, notes in packed:
+                    writer.add_packed(record, notes)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(_pack_catalog_chunk, [catalog_seed] * len(chunks), chunks,
+                                       [duration] * len(chunks), [components] * len(chunks))
+                for packed in results:
+                    for record, notes in packed:
+                        writer.add_packed(record, notes)
+    return first
@@ -0,0 +1,254 @@
+"""
+Bitmask drum engine: one integer per instrument and bar.
+
+Every voice (kick, snare, ghost snare, hihat, any extra percussion) keeps
+its hits of a bar as the bits of a uint64, bit N = step N of the bar, so a
+bar holds up to 64 steps (32nd notes and finer). Masks of a batch are
+arrays (..., bars) and every rule is a few bitwise operations per voice
+and bar, whatever the number of hits:
+
+- collisions: a voice keeps only the steps no higher priority voice has
+  taken (mask & ~occupied); voices in OVERLAP_ALLOWED (the kick) are
+  never cut and take no steps from others;
+- fills: inside a region mask the voices are replaced by the fill voices
+  ((mask & ~region) | (fill & region)), then collisions are resolved again;
+- hat rolls: the roll steps of a region are OR-ed into the hihat;
+- resolution: spread_bits moves 16th masks to 32nds (and 32nds to 64ths)
+  by bit interleaving.
+
+    masks = generate_drum_masks(1000, bars=4, rng=np.random.default_rng(7))
+    matrix = masks_to_matrix(masks, rng=np.random.default_rng(7))   # (1000, 3, 128)
+    notes = matrix_to_notes(matrix[0], tracks=[0, 1, 2], ticks_per_step=STEP_TICKS // 2)
+"""
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import (
+    DRUM_COMPONENTS, DRUM_PRIORITY, FILL_CHANCE, HUMANIZE, OVERLAP_ALLOWED, STEP_PROBABILITIES,
+    STEPS_PER_BAR, drum_volumes,
+)
+
+MASK_STEPS_PER_BAR = 32  # 32-е доли в такте: хватает на роллы хай-хэта
+MAX_STEPS_PER_BAR = 64  # шагов в uint64
+
+# Порядок важен: кто раньше, тот и остается на шаге. Призрачные удары малого
+# ниже хай-хэта - они заполняют только пустые шаги
+VOICE_PRIORITY = DRUM_PRIORITY + ("ghost",)
+VOICE_COMPONENTS = {"kick": "kick", "snare": "snare", "ghost": "snare", "hihat": "hihat"}
+
+GHOST_PROBABILITIES = [0.00, 0.00, 0.00, 0.20, 0.00, 0.00, 0.10, 0.25,
+                       0.00, 0.15, 0.00, 0.20, 0.00, 0.00, 0.10, 0.25]
+GHOST_VOLUME = 45
+ROLL_VOLUME = 65  # удары ролла между шестнадцатыми
+ROLL_CHANCE = 0.35  # шанс ролла хай-хэта в такте
+ROLL_BEATS = (1, 3)  # ролл на второй или четвертой доле
+FILL_SNARE_CHANCE = 0.6
+
+_SPREAD = [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+           (2, 0x3333333333333333), (1, 0x5555555555555555)]
+
+
+def _u64(value):
+    return np.uint64(value)
+
+
+def steps_to_mask(steps):
+    """
+    Bitmask with the given steps set
+    """
+    mask = 0
+    for step in steps:
+        mask |= 1 << step
+    return _u64(mask)
+
+
+def every_step_mask(steps_per_bar, every=1, offset=0):
+    """
+    Bitmask of every N-th step of a bar, starting at offset
+    """
+    return steps_to_mask(range(offset, steps_per_bar, every))
+
+
+def beat_mask(beat, steps_per_bar=MASK_STEPS_PER_BAR):
+    """
+    Bitmask of all steps of one quarter-note beat (0..3) of a bar
+    """
+    per_beat = steps_per_bar // 4
+    return steps_to_mask(range(beat * per_beat, (beat + 1) * per_beat))
+
+
+def spread_bits(masks):
+    """
+    Double the resolution of masks: step N becomes step 2N
+
+    Works on masks of up to 32 steps (16ths -> 32nds, 32nds -> 64ths).
+    """
+    masks = np.asarray(masks, dtype=np.uint64) & _u64(0xFFFFFFFF)
+    for shift, pattern in _SPREAD:
+        masks = (masks | (masks << _u64(shift))) & _u64(pattern)
+    return masks
+
+
+def hits_to_masks(hits, steps_per_bar=STEPS_PER_BAR):
+    """
+    Pack a boolean hit array (..., bars * steps_per_bar) into (..., bars) masks
+    """
+    hits = np.asarray(hits, dtype=bool)
+    if steps_per_bar > MAX_STEPS_PER_BAR:
+        raise ValueError(f"a bar mask holds at most {MAX_STEPS_PER_BAR} steps, got {steps_per_bar}")
+    bars = hits.shape[-1] // steps_per_bar
+    hits = hits.reshape(hits.shape[:-1] + (bars, steps_per_bar))
+    padded = np.zeros(hits.shape[:-1] + (MAX_STEPS_PER_BAR,), dtype=bool)
+    padded[..., :steps_per_bar] = hits
+    return np.packbits(padded, axis=-1, bitorder="little").view("<u8")[..., 0].astype(np.uint64)
+
+
+def masks_to_hits(masks, steps_per_bar=STEPS_PER_BAR):
+    """
+    Unpack (..., bars) masks into a boolean hit array (..., bars * steps_per_bar)
+    """
+    masks = np.ascontiguousarray(masks, dtype="<u8")
+    bits = np.unpackbits(masks[..., np.newaxis].view(np.uint8), axis=-1, bitorder="little")
+    hits = bits[..., :steps_per_bar].astype(bool)
+    return hits.reshape(hits.shape[:-2] + (-1,))
+
+
+def resolve_collisions(masks, priority=VOICE_PRIORITY, overlap_allowed=OVERLAP_ALLOWED):
+    """
+    Apply the non-overlap rule to a dict voice -> masks
+
+    Parameters:
+    - masks: dict voice -> uint64 array (..., bars), all of the same shape
+    - priority: voices in the order they keep a shared step
+    - overlap_allowed: voices that may share steps with any other voice
+
+    Voices that are in neither list rank below the voices of priority, in
+    the order of the dict. Returns a new dict.
+    """
+    ranked = [voice for voice in priority if voice in masks and voice not in overlap_allowed]
+    ranked += [voice for voice in masks if voice not in ranked and voice not in overlap_allowed]
+    resolved = dict(masks)
+    occupied = None
+    for voice in ranked:
+        mask = resolved[voice]
+        if occupied is None:
+            occupied = mask
+        else:
+            mask = mask & ~occupied
+            occupied = occupied | mask
+        resolved[voice] = mask
+    return resolved
+
+
+def insert_fill(masks, fill, region, **rules):
+    """
+    Replace the hits inside a region by a fill
+
+    Parameters:
+    - masks: dict voice -> uint64 array (..., bars)
+    - fill: dict voice -> masks of the fill (voices missing in fill are
+      silenced inside the region)
+    - region: uint64 mask(s) of the steps the fill covers, broadcast
+      against the masks (e.g. zero for all bars but the last)
+    - rules: priority / overlap_allowed, see resolve_collisions
+    """
+    region = np.asarray(region, dtype=np.uint64)
+    keep = ~region
+    merged = {voice: mask & keep for voice, mask in masks.items()}
+    for voice, mask in fill.items():
+        merged[voice] = merged.get(voice, _u64(0)) | (np.asarray(mask, dtype=np.uint64) & region)
+    return resolve_collisions(merged, **rules)
+
+
+def hat_roll(masks, region, every=1, voice="hihat", **rules):
+    """
+    Add a hat roll: every N-th step inside the region is played by the voice
+
+    Parameters:
+    - masks: dict voice -> uint64 array (..., bars)
+    - region: uint64 mask(s) of the roll steps, broadcast against the masks
+    - every: 1 = every step (32nd roll at MASK_STEPS_PER_BAR), 2 = every
+      other step, ...
+    """
+    roll = np.asarray(region, dtype=np.uint64) & every_step_mask(MAX_STEPS_PER_BAR, every)
+    rolled = dict(masks)
+    rolled[voice] = rolled.get(voice, _u64(0)) | roll
+    return resolve_collisions(rolled, **rules)
+
+
+def _sample_masks(probabilities, shape, rng):
+    # Маска шестнадцатых по вероятностям шагов -> 32-е доли
+    hits = rng.random(shape + (STEPS_PER_BAR,)) < np.asarray(probabilities)
+    return spread_bits(hits_to_masks(hits)[..., 0])
+
+
+def generate_drum_masks(count, bars=4, rng=None, ghost_notes=True, hat_rolls=True, fills=True):
+    """
+    Generate a batch of drum patterns as bar masks at MASK_STEPS_PER_BAR
+
+    Parameters:
+    - count: number of patterns
+    - bars: length of each pattern in measures
+    - rng: numpy.random.Generator (None = a fresh unseeded one)
+    - ghost_notes: add quiet snare hits on empty 16ths
+    - hat_rolls: add 32nd hihat rolls on beat 2 or 4 of some bars
+    - fills: replace the last beat of the last bar of some patterns with
+      a snare fill
+
+    Returns a dict voice -> uint64 array (count, bars) with the voices
+    kick, snare, ghost and hihat, collisions resolved.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    shape = (count, bars)
+    masks = {name: _sample_masks(STEP_PROBABILITIES[name], shape, rng) for name in DRUM_COMPONENTS}
+    if ghost_notes:
+        masks["ghost"] = _sample_masks(GHOST_PROBABILITIES, shape, rng)
+    masks = resolve_collisions(masks)
+
+    if hat_rolls:
+        beats = np.array([beat_mask(beat) for beat in ROLL_BEATS], dtype=np.uint64)
+        region = np.where(rng.random(shape) < ROLL_CHANCE, beats[rng.integers(len(beats), size=shape)], _u64(0))
+        masks = hat_roll(masks, region)
+
+    if fills:
+        region = np.zeros(shape, dtype=np.uint64)
+        region[rng.random(count) < FILL_CHANCE, -1] = beat_mask(3)
+        snare = _sample_masks([FILL_SNARE_CHANCE] * STEPS_PER_BAR, shape, rng)
+        kick = masks["kick"] & every_step_mask(MASK_STEPS_PER_BAR, 8)  # бочка только на долях
+        masks = insert_fill(masks, {"snare": snare, "kick": kick}, region)
+    return masks
+
+
+def masks_to_matrix(masks, steps_per_bar=MASK_STEPS_PER_BAR, components=DRUM_COMPONENTS, rng=None):
+    """
+    Velocity matrix (count, components, bars * steps_per_bar) from voice masks
+
+    Voices are mixed into their component rows (VOICE_COMPONENTS, the
+    ghost snare plays on the snare track), with the drum_matrix volumes,
+    quiet ghost notes and roll hits, and humanized velocities. The result
+    can be passed to drum_matrix.matrix_to_notes with
+    ticks_per_step = STEP_TICKS * STEPS_PER_BAR // steps_per_bar.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    components = list(components)
+    hits = {voice: masks_to_hits(mask, steps_per_bar) for voice, mask in masks.items()}
+    shape = next(iter(hits.values())).shape
+    on_sixteenth = np.arange(shape[-1]) % (steps_per_bar // STEPS_PER_BAR) == 0
+    matrix = np.zeros(shape[:-1] + (len(components), shape[-1]), dtype=np.int16)
+    for voice, voice_hits in hits.items():
+        component = VOICE_COMPONENTS.get(voice, voice)
+        if component not in components:
+            continue
+        if voice == "ghost":
+            volume = GHOST_VOLUME
+        elif voice == "hihat":
+            volume = np.where(on_sixteenth, drum_volumes["closed_hh"], ROLL_VOLUME)
+        else:
+            volume = drum_volumes.get(voice, drum_volumes["snare"])
+        row = matrix[..., components.index(component), :]
+        # Голоса одного трека после разрешения коллизий не пересекаются
+        row[voice_hits] = np.broadcast_to(volume, voice_hits.shape)[voice_hits]
+    humanize = rng.integers(-HUMANIZE, HUMANIZE + 1, size=matrix.shape, dtype=np.int16)
+    return np.where(matrix > 0, np.clip(matrix + humanize, 1, 127), 0).astype(np.uint8)
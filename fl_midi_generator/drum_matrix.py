@@ -0,0 +1,158 @@
+"""
+Vectorized drum pattern engine.
+
+A drum pattern is a (components x steps) matrix of velocities on a grid of
+sixteenth notes, 0 means no hit. Whole batches of patterns are generated at
+once as a (patterns x components x steps) array, so no Python loop runs per
+step or per hit.
+
+Rules (same as the rest of the generator):
+- drums never overlap each other, except the kick
+- all drums use the same MIDI note (DRUM_NOTE), each in its own track
+"""
+
+import numpy as np
+
+DRUM_COMPONENTS = ("kick", "snare", "hihat")
+
+# Бочка может накладываться на другие ударные, остальные - нет.
+# Порядок в DRUM_PRIORITY решает, кто остается при совпадении.
+OVERLAP_ALLOWED = ("kick",)
+DRUM_PRIORITY = ("snare", "hihat")
+
+DRUM_NOTE = 36  # Используем только одну ноту для всех ударных
+DRUM_CHANNEL = 9
+STEPS_PER_BAR = 16  # шестнадцатые в такте 4/4
+
+# Вероятность удара на каждой шестнадцатой такта
+STEP_PROBABILITIES = {
+    "kick":  [0.95, 0.00, 0.15, 0.05, 0.00, 0.00, 0.10, 0.30,
+              0.20, 0.00, 0.60, 0.10, 0.00, 0.05, 0.20, 0.10],
+    "snare": [0.00, 0.00, 0.00, 0.03, 0.97, 0.00, 0.00, 0.08,
+              0.00, 0.05, 0.00, 0.03, 0.97, 0.00, 0.05, 0.12],
+    "hihat": [0.95, 0.25, 0.85, 0.30, 0.90, 0.25, 0.85, 0.35,
+              0.95, 0.25, 0.85, 0.30, 0.90, 0.25, 0.85, 0.45],
+}
+
+# Volume variations for more realistic feel
+drum_volumes = {
+    "kick": 110,     # Громкость бочки
+    "snare": 90,     # Средняя громкость малого барабана
+    "clap": 85,      # Громкость хлопка
+    "closed_hh": 80, # Тихие хай-хэты
+    "open_hh": 85    # Немного громче открытый хай-хэт
+}
+
+HUMANIZE = 8  # максимальное случайное отклонение громкости
+OPEN_HAT_CHANCE = 0.15  # шанс открытого хай-хэта на слабой восьмой
+FILL_CHANCE = 0.5  # шанс вариации (брейка) в последнем такте
+
+
+def resolve_overlaps(hits, components):
+    """
+    Apply the non-overlap rule in place on a boolean hit array
+
+    Parameters:
+    - hits: bool array (..., components, steps)
+    - components: component names matching the second to last axis
+
+    Only components in OVERLAP_ALLOWED may share a step with another drum;
+    otherwise the component that comes first in DRUM_PRIORITY keeps the step.
+    """
+    occupied = np.zeros(hits.shape[:-2] + hits.shape[-1:], dtype=bool)
+    for name in DRUM_PRIORITY:
+        if name in components and name not in OVERLAP_ALLOWED:
+            row = components.index(name)
+            hits[..., row, :] &= ~occupied
+            occupied |= hits[..., row, :]
+    return hits
+
+
+def _sample_bars(count, bars, components, rng):
+    # Булев массив (count, components, bars * 16) по вероятностям шагов
+    probabilities = np.array([STEP_PROBABILITIES[name] for name in components])
+    probabilities = np.tile(probabilities, (1, bars))
+    return rng.random((count, len(components), bars * STEPS_PER_BAR)) < probabilities
+
+
+def _velocities(hits, components, rng):
+    # Базовая громкость компонента + случайное отклонение
+    count, _, steps = hits.shape
+    base = np.empty((count, len(components), steps), dtype=np.int16)
+    for row, name in enumerate(components):
+        if name == "snare":
+            # Малый барабан или хлопок - выбирается на весь паттерн
+            use_clap = rng.random(count) < 0.3
+            base[:, row, :] = np.where(use_clap, drum_volumes["clap"], drum_volumes["snare"])[:, None]
+        elif name == "hihat":
+            offbeat = np.zeros(steps, dtype=bool)
+            offbeat[2::4] = True
+            open_hat = offbeat & (rng.random((count, steps)) < OPEN_HAT_CHANCE)
+            base[:, row, :] = np.where(open_hat, drum_volumes["open_hh"], drum_volumes["closed_hh"])
+        else:
+            base[:, row, :] = drum_volumes[name]
+    base += rng.integers(-HUMANIZE, HUMANIZE + 1, size=base.shape, dtype=np.int16)
+    return np.where(hits, np.clip(base, 1, 127), 0).astype(np.uint8)
+
+
+def generate_drum_patterns(count, bars=4, components=DRUM_COMPONENTS, rng=None):
+    """
+    Generate a batch of drum patterns
+
+    Parameters:
+    - count: number of patterns
+    - bars: length of each pattern in measures
+    - components: drum components (rows), subset of DRUM_COMPONENTS
+    - rng: numpy.random.Generator (None = a fresh unseeded one)
+
+    Returns a uint8 array (count, len(components), bars * 16) of velocities.
+    Each pattern is a two bar phrase repeated over all bars; the last bar of
+    about half of the patterns is replaced by a fresh variation (fill).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    components = list(components)
+    for name in components:
+        if name not in STEP_PROBABILITIES:
+            raise ValueError(f"unknown drum component {name!r}")
+
+    phrase_bars = min(bars, 2)
+    phrase = _sample_bars(count, phrase_bars, components, rng)
+    repeats = -(-bars // phrase_bars)
+    hits = np.tile(phrase, (1, 1, repeats))[:, :, :bars * STEPS_PER_BAR]
+
+    if bars > 1:
+        fill = _sample_bars(count, 1, components, rng)
+        use_fill = rng.random(count) < FILL_CHANCE
+        hits[use_fill, :, -STEPS_PER_BAR:] = fill[use_fill]
+
+    resolve_overlaps(hits, components)
+    return _velocities(hits, components, rng)
+
+
+def generate_drum_matrix(bars=4, components=DRUM_COMPONENTS, rng=None):
+    """
+    Generate a single drum pattern as a (components x steps) velocity matrix
+    """
+    return generate_drum_patterns(1, bars, components, rng)[0]
+
+
+def matrix_to_notes(matrix, tracks, ticks_per_step, offset=0):
+    """
+    Convert a drum matrix into note tuples
+
+    Parameters:
+    - matrix: (components x steps) velocity matrix
+    - tracks: track index for each row of the matrix
+    - ticks_per_step: length of one step in ticks
+    - offset: start time of the first step in ticks
+
+    Returns a list of (track, channel, pitch, start, length, velocity).
+    """
+    rows, steps = np.nonzero(matrix)
+    velocities = matrix[rows, steps]
+    track_of_row = np.asarray(tracks)[rows]
+    return [
+        (int(track), DRUM_CHANNEL, DRUM_NOTE, offset + int(step) * ticks_per_step, ticks_per_step, int(velocity))
+        for track, step, velocity in zip(track_of_row, steps, velocities)
+    ]
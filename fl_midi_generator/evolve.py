@@ -0,0 +1,414 @@
+"""
+Evolutionary search for drum and melody patterns.
+
+Instead of sampling patterns at random and hoping one fits, a population
+of loops is evolved towards a target profile. A genome is the step
+representation of a loop:
+
+- drums: (kick, snare, hihat) x sixteenth steps velocity matrix, as in
+  drum_matrix (0 = no hit);
+- melody: one value per sixteenth step, the index of a scale pitch that
+  starts a note there, or HOLD (-1) to let the previous note ring.
+
+Every generation keeps the best few (elitism), picks parents by
+tournament, crosses them over at a random step (drums and melody cut at
+the same step, so they stay in time) and mutates single steps. Fitness is
+computed for the whole population at once with array operations, split
+over a process pool when workers > 1.
+
+The search runs for a number of generations and/or a time budget, and
+can checkpoint the population (np.savez, written atomically) so a long
+search resumes where it stopped:
+
+    search = Evolution(Profile(density=12, swing=0.4), bars=2, seed=7)
+    search.run(seconds=60, checkpoint="search.npz")
+    search = Evolution.load("search.npz")     # later: continue
+    search.run(seconds=60, checkpoint="search.npz")
+    search.write("best.mid", tempo=90)
+"""
+
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import (
+    DRUM_COMPONENTS, HUMANIZE, STEPS_PER_BAR, drum_volumes, generate_drum_patterns, matrix_to_notes,
+    resolve_overlaps,
+)
+from fl_midi_generator.midi_generator import MAX_LEAP, MELODY_CHANNEL, STEP_TICKS, write_bytes_output
+from fl_midi_generator.midi_writer import write_midi
+from fl_midi_generator.note_buffer import NoteBuffer
+
+HOLD = -1  # шаг без новой ноты мелодии
+
+# Целевой профиль лупа:
+# - density: удары ударных в такте
+# - melody_density: ноты мелодии в такте
+# - swing: доля начал нот на слабых шестнадцатых (нечетные шаги)
+# - energy: средняя громкость ударов, 0..1
+# - reference: (kick, snare, hihat) x шаги - луп, на который похожи
+#   (например, MidiData.drum_matrix), None = без образца
+Profile = namedtuple("Profile", ["density", "melody_density", "swing", "energy", "reference"],
+                     defaults=(10.0, 6.0, 0.3, 0.7, None))
+
+# Вес каждого отклонения от профиля и его масштаб (отклонение на масштаб = 1)
+WEIGHTS = {"density": 1.0, "melody_density": 1.0, "swing": 1.0, "energy": 0.5, "reference": 2.0,
+           "leaps": 1.0}
+SCALES = {"density": 4.0, "melody_density": 2.0, "swing": 0.2, "energy": 0.2}
+
+DRUM_VELOCITIES = np.array([drum_volumes["kick"], drum_volumes["snare"], drum_volumes["closed_hh"]])
+ONSET_CHANCE = 0.35  # доля шагов с новой нотой в начальной мелодии
+PARALLEL_MINIMUM = 512  # меньшие популяции считаются без пула
+
+
+def profile_metrics(drums, melody, pitches):
+    """
+    Profile values of a population
+
+    Parameters:
+    - drums: uint8 array (population, 3, steps)
+    - melody: int array (population, steps), pitch index or HOLD
+    - pitches: MIDI pitch of every index
+
+    Returns a dict name -> array (population,) with density,
+    melody_density, swing, energy and leaps (share of melody intervals
+    larger than MAX_LEAP).
+    """
+    steps = drums.shape[-1]
+    bars = steps / STEPS_PER_BAR
+    hits = drums > 0
+    onsets = melody != HOLD
+    hit_count = hits.sum(axis=(1, 2))
+    onset_count = onsets.sum(axis=1)
+    odd = np.arange(steps) % 2 == 1
+    offbeat = hits[:, :, odd].sum(axis=(1, 2)) + onsets[:, odd].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        swing = np.where(hit_count + onset_count > 0, offbeat / np.maximum(hit_count + onset_count, 1), 0.0)
+        energy = np.where(hit_count > 0, drums.sum(axis=(1, 2), dtype=np.int64) / np.maximum(hit_count, 1) / 127,
+                          0.0)
+
+    # Скачки: интервал от предыдущей ноты (по кругу - луп повторяется)
+    pitch = np.where(onsets, np.asarray(pitches)[np.maximum(melody, 0)], 0)
+    position = np.where(onsets, np.arange(steps), -1)
+    last = np.maximum.accumulate(position, axis=1)
+    # Перед первой нотой предыдущей считается последняя нота лупа
+    previous = np.concatenate([last[:, -1:], last[:, :-1]], axis=1)
+    previous = np.where(previous >= 0, previous, last[:, -1:])
+    previous_pitch = np.take_along_axis(pitch, np.maximum(previous, 0), axis=1)
+    interval = np.abs(pitch - previous_pitch)
+    leaps = np.where(onset_count > 1, ((interval > MAX_LEAP) & onsets).sum(axis=1) / np.maximum(onset_count, 1),
+                     0.0)
+    return {"density": hit_count / bars, "melody_density": onset_count / bars, "swing": swing,
+            "energy": energy, "leaps": leaps}
+
+
+def fitness(drums, melody, pitches, profile, weights=None):
+    """
+    Fitness of every pattern of a population (higher is better, 0 = perfect)
+
+    Minus the weighted, scaled distances of the profile metrics to the
+    targets, minus the share of leaps, minus the distance to the reference
+    loop (1 - Dice similarity of the hit grids) if the profile has one.
+    """
+    weights = WEIGHTS if weights is None else weights
+    metrics = profile_metrics(drums, melody, pitches)
+    score = -weights.get("leaps", 0.0) * metrics["leaps"]
+    for name, scale in SCALES.items():
+        score -= weights.get(name, 0.0) * np.abs(metrics[name] - getattr(profile, name)) / scale
+    if profile.reference is not None and weights.get("reference"):
+        hits = drums > 0
+        reference = np.asarray(profile.reference) > 0
+        shared = (hits & reference).sum(axis=(1, 2))
+        total = hits.sum(axis=(1, 2)) + reference.sum()
+        score -= weights["reference"] * (1 - 2 * shared / np.maximum(total, 1))
+    return score
+
+
+def _fitness_chunk(args):
+    # В рабочем процессе: часть популяции целиком
+    return fitness(*args)
+
+
+class Evolution:
+    """
+    Population of drum + melody loops evolving towards a Profile
+
+    Parameters:
+    - profile: target Profile
+    - bars: loop length in bars
+    - population: number of patterns
+    - scale: melody scale intervals (default: C minor pentatonic)
+    - base_octave, octave_range: melody range as for generate_random_midi
+    - mutation_rate: chance of every step to mutate, per child
+    - elite: best patterns copied unchanged into the next generation
+    - tournament: patterns compared to pick each parent
+    - workers: processes for the fitness evaluation (1 = in process)
+    - weights: dict of fitness weights (default WEIGHTS)
+    - seed: seed of the search (None = random)
+    """
+
+    def __init__(self, profile=Profile(), bars=2, population=256, scale=None, base_octave=84, octave_range=1,
+                 mutation_rate=0.02, elite=4, tournament=3, workers=1, weights=None, seed=None):
+        if scale is None:
+            scale = [0, 3, 5, 7, 10]  # C minor pentatonic
+        if elite >= population:
+            raise ValueError("elite must be smaller than the population")
+        if profile.reference is not None:
+            reference = np.asarray(profile.reference, dtype=np.uint8)
+            steps = bars * STEPS_PER_BAR
+            reference = np.tile(reference, (1, -(-steps // reference.shape[1])))[:, :steps]
+            profile = profile._replace(reference=reference)
+        self.profile = profile
+        self.bars = bars
+        self.scale = list(scale)
+        self.base_octave = base_octave
+        self.octave_range = octave_range
+        self.mutation_rate = mutation_rate
+        self.elite = elite
+        self.tournament = tournament
+        self.workers = workers
+        self.weights = dict(WEIGHTS if weights is None else weights)
+        classes = {interval % 12 for interval in self.scale}
+        highest = min(base_octave + 12 * (octave_range + 1) - 1, 127)
+        self.pitches = np.array([pitch for pitch in range(base_octave, highest + 1) if pitch % 12 in classes])
+        self.rng = np.random.default_rng(seed)
+        self.generation = 0
+
+        steps = bars * STEPS_PER_BAR
+        self.drums = generate_drum_patterns(population, bars, DRUM_COMPONENTS, self.rng)
+        onsets = self.rng.random((population, steps)) < ONSET_CHANCE
+        onsets[:, 0] = True
+        self.melody = np.where(onsets, self.rng.integers(len(self.pitches), size=(population, steps)),
+                               HOLD).astype(np.int16)
+        self.fitness = None
+        self._executor = None
+
+    def __len__(self):
+        return len(self.drums)
+
+    def evaluate(self, drums=None, melody=None):
+        """
+        Fitness of a population (default: the current one)
+        """
+        drums = self.drums if drums is None else drums
+        melody = self.melody if melody is None else melody
+        if self._executor is None or len(drums) < PARALLEL_MINIMUM:
+            return fitness(drums, melody, self.pitches, self.profile, self.weights)
+        parts = np.array_split(np.arange(len(drums)), self.workers)
+        jobs = [(drums[part], melody[part], self.pitches, self.profile, self.weights) for part in parts]
+        return np.concatenate(list(self._executor.map(_fitness_chunk, jobs)))
+
+    def _tournament(self, count):
+        entrants = self.rng.integers(len(self), size=(count, self.tournament))
+        return entrants[np.arange(count), np.argmax(self.fitness[entrants], axis=1)]
+
+    def _mutate(self, drums, melody):
+        # Мутации редки: выбираются их позиции, а не жребий на каждый шаг
+        rng = self.rng
+        count, rows, steps = drums.shape
+        flat = drums.reshape(-1)
+        where = rng.integers(flat.size, size=rng.binomial(flat.size, self.mutation_rate))
+        # Ударные: шаг включается или выключается, громкость чуть плавает
+        velocity = DRUM_VELOCITIES[where // steps % rows] + rng.integers(-HUMANIZE, HUMANIZE + 1, size=len(where))
+        flat[where] = np.where(flat[where] > 0, 0, np.clip(velocity, 1, 127))
+        changed = np.unique(where // (rows * steps))
+        hits = resolve_overlaps(drums[changed] > 0, list(DRUM_COMPONENTS))
+        drums[changed] = np.where(hits, drums[changed], 0)
+
+        # Мелодия: соседняя ступень, новая случайная нота или удержание
+        flat = melody.reshape(-1)
+        where = rng.integers(flat.size, size=rng.binomial(flat.size, self.mutation_rate))
+        current = flat[where]
+        kind = rng.random(len(where))
+        random_pitch = rng.integers(len(self.pitches), size=len(where))
+        neighbour = np.where(current == HOLD, random_pitch,
+                             np.clip(current + rng.choice([-2, -1, 1, 2], size=len(where)), 0, len(self.pitches) - 1))
+        flat[where] = np.where(kind < 0.5, neighbour, np.where(kind < 0.75, random_pitch, HOLD))
+        return drums, melody
+
+    def step(self):
+        """
+        Advance one generation
+        """
+        if self.fitness is None:
+            self.fitness = self.evaluate()
+        size = len(self)
+        children = size - self.elite
+        elite = np.argsort(-self.fitness, kind="stable")[:self.elite]
+
+        first, second = self._tournament(children), self._tournament(children)
+        steps = self.drums.shape[-1]
+        cut = self.rng.integers(1, steps, size=children)
+        take_first = np.arange(steps) < cut[:, np.newaxis]
+        drums = np.where(take_first[:, np.newaxis, :], self.drums[first], self.drums[second])
+        melody = np.where(take_first, self.melody[first], self.melody[second])
+        drums, melody = self._mutate(drums, melody)
+
+        self.drums = np.concatenate([self.drums[elite], drums])
+        self.melody = np.concatenate([self.melody[elite], melody])
+        self.fitness = np.concatenate([self.fitness[elite], self.evaluate(drums, melody)])
+        self.generation += 1
+
+    def run(self, generations=None, seconds=None, checkpoint=None, checkpoint_every=30.0, target=0.0):
+        """
+        Evolve until a limit is reached
+
+        Parameters:
+        - generations: maximum number of generations (None = no limit)
+        - seconds: time budget in seconds (None = no limit)
+        - checkpoint: path of a .npz checkpoint, saved every
+          checkpoint_every seconds and at the end
+        - target: stop early when the best fitness reaches this value
+
+        At least one of generations and seconds must be given. Returns the
+        best fitness.
+        """
+        if generations is None and seconds is None:
+            raise ValueError("give a number of generations, a time budget or both")
+        started = last_saved = time.perf_counter()
+        done = 0
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self._executor = executor
+        try:
+            # Оценка начальной популяции: бюджет может кончиться до первого step()
+            if self.fitness is None:
+                self.fitness = self.evaluate()
+            while generations is None or done < generations:
+                if seconds is not None and time.perf_counter() - started >= seconds:
+                    break
+                self.step()
+                done += 1
+                if self.fitness.max() >= target:
+                    break
+                if checkpoint is not None and time.perf_counter() - last_saved >= checkpoint_every:
+                    self.save(checkpoint)
+                    last_saved = time.perf_counter()
+        finally:
+            self._executor = None
+            if executor is not None:
+                executor.shutdown()
+            if checkpoint is not None:
+                self.save(checkpoint)
+        return float(self.fitness.max())
+
+    def save(self, path):
+        """
+        Save the population and the search state to a .npz checkpoint
+
+        The file is written next to path and renamed over it, so an
+        interrupted save never leaves a broken checkpoint.
+        """
+        settings = {"bars": self.bars, "scale": self.scale, "base_octave": self.base_octave,
+                    "octave_range": self.octave_range, "mutation_rate": self.mutation_rate,
+                    "elite": self.elite, "tournament": self.tournament, "weights": self.weights,
+                    "generation": self.generation,
+                    "profile": [value for name, value in self.profile._asdict().items() if name != "reference"]}
+        arrays = {"drums": self.drums, "melody": self.melody,
+                  "fitness": self.fitness if self.fitness is not None else np.zeros(0),
+                  "settings": np.array(json.dumps(settings)),
+                  "rng": np.array(json.dumps(self.rng.bit_generator.state))}
+        if self.profile.reference is not None:
+            arrays["reference"] = self.profile.reference
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path, workers=1):
+        """
+        Resume a search from a checkpoint written by save
+        """
+        with np.load(path) as data:
+            settings = json.loads(str(data["settings"]))
+            reference = data["reference"] if "reference" in data else None
+            profile = Profile(*settings.pop("profile"), reference)
+            generation = settings.pop("generation")
+            search = cls(profile, population=len(data["drums"]), workers=workers, **settings)
+            search.drums = data["drums"]
+            search.melody = data["melody"]
+            search.fitness = data["fitness"] if len(data["fitness"]) else None
+            search.rng.bit_generator.state = json.loads(str(data["rng"]))
+        search.generation = generation
+        return search
+
+    def best(self):
+        """
+        (drums, melody, fitness) of the best pattern
+        """
+        if self.fitness is None:
+            self.fitness = self.evaluate()
+        index = int(np.argmax(self.fitness))
+        return self.drums[index], self.melody[index], float(self.fitness[index])
+
+    def best_notes(self):
+        """
+        Notes of the best pattern: drums on tracks 0-2, melody on track 3
+        (components kick, snare, hihat, melody)
+        """
+        drums, melody, _ = self.best()
+        notes = NoteBuffer(matrix_to_notes(drums, [0, 1, 2], STEP_TICKS))
+        starts = np.flatnonzero(melody != HOLD)
+        ends = np.append(starts[1:], len(melody))
+        notes.extend_columns(3, MELODY_CHANNEL, self.pitches[melody[starts]], starts * STEP_TICKS,
+                             (ends - starts) * STEP_TICKS, 96)
+        return notes
+
+    def write(self, output_file, tempo=90):
+        """
+        Write the best pattern as a MIDI file (see write_output for the
+        destinations)
+        """
+        return write_bytes_output(output_file, write_midi(self.best_notes(), 4, tempo),
+                                  f"Evolved pattern written: {output_file} (generation {self.generation})")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m fl_midi_generator.evolve",
+                                     description="Evolve a drum and melody loop towards a target profile")
+    parser.add_argument("output", help="MIDI file for the best pattern")
+    parser.add_argument("--seconds", type=float, default=60, help="time budget (default: 60)")
+    parser.add_argument("--generations", type=int, help="maximum number of generations")
+    parser.add_argument("--checkpoint", help="save the population here; resumed from if it exists")
+    parser.add_argument("--reference", help="MIDI loop whose drums the pattern should resemble")
+    parser.add_argument("--bars", type=int, default=2, help="loop length (default: 2)")
+    parser.add_argument("--population", type=int, default=1024, help="population size (default: 1024)")
+    parser.add_argument("--density", type=float, default=Profile().density, help="drum hits per bar")
+    parser.add_argument("--melody-density", type=float, default=Profile().melody_density,
+                        help="melody notes per bar")
+    parser.add_argument("--swing", type=float, default=Profile().swing, help="share of off-beat onsets")
+    parser.add_argument("--energy", type=float, default=Profile().energy, help="mean drum velocity, 0..1")
+    parser.add_argument("--tempo", type=float, default=90)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="fitness processes")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        search = Evolution.load(args.checkpoint, workers=args.workers)
+        print(f"Resuming from {args.checkpoint} at generation {search.generation}")
+    else:
+        reference = None
+        if args.reference:
+            from fl_midi_generator.midi_reader import read_midi
+
+            reference = read_midi(args.reference).drum_matrix()
+        profile = Profile(args.density, args.melody_density, args.swing, args.energy, reference)
+        search = Evolution(profile, args.bars, args.population, workers=args.workers, seed=args.seed)
+    started = time.perf_counter()
+    first = search.generation
+    best = search.run(args.generations, args.seconds, args.checkpoint)
+    print(f"{search.generation - first} generations in {time.perf_counter() - started:.1f} s, "
+          f"best fitness {best:.3f}")
+    print(search.write(args.output, args.tempo))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Constraint-propagating melody engine.
+
+Instead of drawing random notes and folding them back into the rules, the
+engine prunes every note's pitch domain before drawing it, so a drawn
+note never has to be fixed up and never breaks a rule.
+
+A melody is generated phrase by phrase (a few bars):
+
+1. the rhythm of the phrase is drawn first, from note lengths that still
+   fit into the bar, with occasional rests;
+2. every note gets a domain: the pitches of the scale inside the range,
+   narrowed by its position (e.g. only chord tones on strong beats), and
+   the last note of the phrase by the cadence targets;
+3. a backward pass keeps in the domain of each note only the pitches from
+   which the rest of the phrase can still be completed within max_leap
+   (arc consistency along the note chain);
+4. notes are drawn front to back from domain & (pitches within max_leap of
+   the previous note). Once the first note is drawn, the backward pass
+   guarantees this is never empty, so there is no backtracking. Only a
+   rhythm that leaves no valid first note at all (e.g. a single note that
+   cannot reach the cadence) is drawn again.
+
+Domains are bitmasks over the MIDI pitches, so a rule is one AND per note
+and widening a domain by max_leap is a few shifts; the cost of a phrase
+is O(notes) whatever the number of rules. A phrase that is repeated (repeat_every, the hip-hop
+melody loop) is generated cyclically: its last note must also lead back to
+its first note within max_leap.
+
+    rules = melody_rules([0, 2, 4, 5, 7, 9, 11], base_octave=84, octave_range=1)
+    bars, last = rules.phrase(4, previous=None, rng=random.Random(7))
+"""
+
+import random
+from functools import lru_cache
+
+from fl_midi_generator.midi_generator import (
+    MAX_LEAP, MELODY_DURATIONS, REST_CHANCE, TICKS_PER_BAR, TICKS_PER_QUARTER,
+)
+
+CADENCE = (0, 7)  # фраза заканчивается на тонике или квинте
+PHRASE_BARS = 4
+VELOCITY_RANGE = (80, 110)
+RHYTHM_ATTEMPTS = 100
+
+
+def _bits(mask):
+    # Индексы установленных бит по возрастанию
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+class MelodyRules:
+    """
+    Constraints of a melody line and the generator that satisfies them
+
+    Parameters:
+    - scale: scale intervals relative to base_octave
+    - base_octave: lowest MIDI note of the range (84 = C6)
+    - octave_range: octaves above the base octave (1 = two octaves)
+    - note_length: fixed note length in ticks (even rhythm) or None for
+      random lengths from MELODY_DURATIONS
+    - max_leap: largest interval in semitones between consecutive notes
+    - cadence: pitch classes (semitones above the root, scale[0]) the
+      last note of a phrase must have; classes missing from the scale are
+      ignored, and if none is left phrases end freely
+    - strong_beat: pitch classes (above the root) allowed on notes that
+      start on a beat, None = any scale note
+    - rest_chance: chance of a rest instead of a note
+
+    Domains are masks over MIDI pitches (bit N = pitch N).
+    """
+
+    def __init__(self, scale, base_octave=84, octave_range=1, note_length=None, max_leap=MAX_LEAP,
+                 cadence=CADENCE, strong_beat=None, rest_chance=REST_CHANCE):
+        self.base_octave = base_octave
+        self.root = scale[0] % 12 if len(scale) else 0
+        self.note_length = note_length
+        self.max_leap = max_leap
+        self.rest_chance = rest_chance
+        highest = min(base_octave + 12 * (octave_range + 1) - 1, 127)
+        self.domain = self._classes_mask(scale, 0) & ((1 << highest + 1) - 1) & ~((1 << max(base_octave, 0)) - 1)
+        if not self.domain:
+            raise ValueError(f"no scale notes between MIDI {base_octave} and {highest}")
+        # Сдвиги, которые вместе расширяют маску на max_leap в обе стороны
+        self._shifts = []
+        covered = 0
+        while covered < max_leap:
+            shift = min(covered + 1, max_leap - covered)
+            self._shifts.append(shift)
+            covered += shift
+        self._near = [self._expand(1 << pitch) for pitch in range(128)]
+        self.cadence = self._classes_mask(cadence) & self.domain if cadence else 0
+        if not self.cadence:
+            self.cadence = self.domain
+        self.strong_beat = self.domain
+        if strong_beat is not None:
+            self.strong_beat &= self._classes_mask(strong_beat)
+            if not self.strong_beat:
+                raise ValueError(f"none of the strong beat pitch classes {strong_beat} is in the scale")
+
+    def _classes_mask(self, classes, root=None):
+        root = self.root if root is None else root
+        classes = {(root + pitch_class) % 12 for pitch_class in classes}
+        return sum(1 << pitch for pitch in range(128) if (pitch - self.base_octave) % 12 in classes)
+
+    @property
+    def pitches(self):
+        """
+        Pitches of the domain (scale notes in the range), ascending
+        """
+        return _bits(self.domain)
+
+    def near(self, pitch):
+        """
+        Domain mask of the pitches within max_leap of a pitch
+        """
+        return self._near[pitch]
+
+    def _expand(self, mask):
+        # Все высоты домена, из которых за один скачок можно попасть в mask
+        for shift in self._shifts:
+            mask |= (mask << shift) | (mask >> shift)
+        return mask & self.domain
+
+    def _backward(self, masks, end):
+        # Домен каждой ноты: только высоты, из которых фразу можно закончить
+        allowed = [0] * len(masks)
+        current = masks[-1] & end
+        allowed[-1] = current
+        for i in range(len(masks) - 2, -1, -1):
+            current = masks[i] & self._expand(current)
+            allowed[i] = current
+        return allowed
+
+    def rhythm(self, bars, rng=random):
+        """
+        Rhythm of a phrase: per bar a list of (start, length, velocity),
+        start relative to the bar, velocity None for a rest
+        """
+        phrase = []
+        for _ in range(bars):
+            slots = []
+            tick = 0
+            while tick < TICKS_PER_BAR:
+                if self.note_length:
+                    length = self.note_length
+                else:
+                    length = rng.choice([d for d in MELODY_DURATIONS if d <= TICKS_PER_BAR - tick])
+                velocity = rng.randint(*VELOCITY_RANGE) if rng.random() >= self.rest_chance else None
+                slots.append((tick, length, velocity))
+                tick += length
+            phrase.append(slots)
+        return phrase
+
+    def _pitches(self, masks, previous, cyclic, cadence, rng):
+        # None, если для этого ритма правила невыполнимы
+        start = self._expand(1 << previous) if previous is not None else self.domain
+        end = self.cadence if cadence else self.domain
+        allowed = self._backward(masks, end)
+        candidates = _bits(allowed[0] & start)
+        if cyclic and candidates:
+            # Последняя нота повторяемой фразы ведет обратно к первой
+            rng.shuffle(candidates)
+            for first in candidates:
+                allowed = self._backward(masks, end & self._near[first])
+                if allowed[0] >> first & 1:
+                    break
+            else:
+                return None
+            candidates = [first]
+        if not candidates:
+            return None
+        chosen = [rng.choice(candidates)]
+        for mask in allowed[1:]:
+            chosen.append(rng.choice(_bits(mask & self._near[chosen[-1]])))
+        return chosen
+
+    def phrase(self, bars, previous=None, cyclic=False, cadence=True, rng=random):
+        """
+        Generate a phrase of melody
+
+        Parameters:
+        - bars: phrase length in bars
+        - previous: last pitch before the phrase (its first note stays
+          within max_leap of it), None for a free start
+        - cyclic: the phrase is repeated, so its last note must also lead
+          back to its first note within max_leap
+        - cadence: end the phrase on a cadence pitch
+        - rng: random.Random instance or the random module
+
+        Returns (bars, last pitch); every bar is a list of (start, length,
+        pitch, velocity) with start relative to the bar. Raises ValueError
+        if no rhythm can satisfy the rules.
+        """
+        for _ in range(RHYTHM_ATTEMPTS):
+            rhythm = self.rhythm(bars, rng)
+            masks = [self.strong_beat if start % TICKS_PER_QUARTER == 0 else self.domain
+                     for slots in rhythm for start, _, velocity in slots if velocity is not None]
+            if not masks:
+                return [[] for _ in rhythm], previous
+            pitches = self._pitches(masks, previous, cyclic, cadence, rng)
+            if pitches is not None:
+                break
+        else:
+            raise ValueError("melody rules cannot be satisfied (max_leap too small for the scale?)")
+
+        notes = iter(pitches)
+        result = [[(start, length, next(notes), velocity)
+                   for start, length, velocity in slots if velocity is not None]
+                  for slots in rhythm]
+        return result, pitches[-1]
+
+
+@lru_cache(maxsize=64)
+def _cached_rules(scale, base_octave, octave_range, note_length, max_leap, cadence, strong_beat):
+    return MelodyRules(list(scale), base_octave, octave_range, note_length, max_leap, cadence,
+                       strong_beat)
+
+
+def melody_rules(scale, base_octave=84, octave_range=1, note_length=None, max_leap=MAX_LEAP,
+                 cadence=CADENCE, strong_beat=None):
+    """
+    Cached MelodyRules for the given parameters (domains are built once)
+    """
+    return _cached_rules(tuple(scale), base_octave, octave_range, note_length, max_leap,
+                         tuple(cadence) if cadence else None,
+                         tuple(strong_beat) if strong_beat is not None else None)
@@ -0,0 +1,193 @@
+"""
+Per-stage profiling of the generation pipeline.
+
+Pass a RenderMetrics object as metrics= to generate_random_midi or
+generate_hiphop_beat to see where a render spends its time:
+
+    metrics = RenderMetrics(trace_memory=True)
+    generate_random_midi("long.mid", duration=4096, seed=1, metrics=metrics)
+    print(metrics.format())
+
+Stages:
+- generate   pattern and melody generation (bar by bar)
+- assemble   collecting the bars into a NoteBuffer
+- sort       same-pitch truncation and event ordering
+- serialize  encoding the events into MIDI bytes
+- write      copying the bytes to the file or file-like object
+- cache      PatternCache lookup
+
+Stage times are exclusive: a stage running inside another one (generation
+pulled by the streaming writer) is not counted twice, so the stages add up
+to the render time. Counters record notes, bars and bytes written.
+
+Without a metrics object the pipeline only checks for None, so the
+instrumentation costs nothing measurable when disabled.
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+
+def stage(metrics, name):
+    """
+    Context manager timing a stage, or a no-op when metrics is None
+    """
+    if metrics is None:
+        return _DISABLED
+    return metrics.stage(name)
+
+
+def count(metrics, name, value=1):
+    """
+    Add value to a counter, or do nothing when metrics is None
+    """
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+def render(metrics):
+    """
+    Context manager around a whole render, or a no-op when metrics is None
+    """
+    if metrics is None:
+        return _DISABLED
+    return metrics.render()
+
+
+class RenderMetrics:
+    """
+    Accumulates stage timings and counters over one or more renders
+
+    Parameters:
+    - callback: optional function called with the report dict (see report)
+      after every finished render
+    - trace_memory: if True, tracemalloc runs during renders and the peak
+      of traced memory is reported (slows the render down noticeably).
+      If the caller already runs tracemalloc, its peak is left alone and
+      the peak is reported relative to the memory traced at the start of
+      the render (an upper bound if the caller's peak was higher)
+    """
+
+    def __init__(self, callback=None, trace_memory=False):
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all recorded timings and counters
+        """
+        self.renders = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.stages = {}  # имя -> [wall, cpu, calls]
+        self.counters = {}
+        self.peak_memory = None
+        self._stack = []  # [wall of children, cpu of children] открытых этапов
+        self._depth = 0
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a pipeline stage; nested stages are subtracted from the outer one
+        """
+        children = [0.0, 0.0]
+        self._stack.append(children)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += wall - children[0]
+            totals[1] += cpu - children[1]
+            totals[2] += 1
+
+    def add(self, name, value=1):
+        """
+        Add value to a counter (notes, bars, bytes_written, ...)
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def render(self):
+        """
+        Mark a whole render; nested calls (a generator calling another
+        one) count as one render
+        """
+        self._depth += 1
+        if self._depth > 1:
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+            return
+
+        if self.trace_memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+                memory_start = 0
+            else:
+                # Чужой tracemalloc: его пик не сбрасываем, считаем от текущего
+                # объема (пик вызывающего кода до рендера может завысить оценку)
+                memory_start = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            self.wall += time.perf_counter() - wall_start
+            self.cpu += time.process_time() - cpu_start
+            self.renders += 1
+            self._depth -= 1
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1] - memory_start, 0)
+                self.peak_memory = max(self.peak_memory or 0, peak)
+                if self._started_tracing:
+                    tracemalloc.stop()
+            if self.callback is not None:
+                self.callback(self.report())
+
+    def report(self):
+        """
+        Recorded metrics as a JSON-serializable dict
+
+        Keys: renders, wall_s, cpu_s, stages (name -> wall_s, cpu_s,
+        calls), counters and peak_memory_bytes (None without trace_memory).
+        """
+        return {
+            "renders": self.renders,
+            "wall_s": self.wall,
+            "cpu_s": self.cpu,
+            "stages": {name: {"wall_s": wall, "cpu_s": cpu, "calls": calls}
+                       for name, (wall, cpu, calls) in self.stages.items()},
+            "counters": dict(self.counters),
+            "peak_memory_bytes": self.peak_memory,
+        }
+
+    def format(self):
+        """
+        Recorded metrics as a human-readable table
+        """
+        lines = [f"{'stage':<10} {'wall ms':>10} {'cpu ms':>10} {'share':>6} {'calls':>7}"]
+        for name, (wall, cpu, calls) in self.stages.items():
+            share = wall / self.wall if self.wall else 0.0
+            lines.append(f"{name:<10} {wall * 1000:>10.2f} {cpu * 1000:>10.2f} {share:>6.1%} {calls:>7}")
+        lines.append(f"{'total':<10} {self.wall * 1000:>10.2f} {self.cpu * 1000:>10.2f} "
+                     f"{'':>6} {self.renders:>7}")
+        for name, value in self.counters.items():
+            lines.append(f"{name}: {value}")
+        if self.peak_memory is not None:
+            lines.append(f"peak memory: {self.peak_memory / 1e6:.2f} MB")
+        return "\n".join(lines)
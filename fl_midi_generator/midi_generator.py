@@ -1,5 +1,12 @@
+import bisect
+import io
 import random
-from midiutil.MidiFile import MIDIFile
+
+# midiutil и numpy загружаются при первом рендере, а не при импорте
+from fl_midi_generator.cache import cache_key
+from fl_midi_generator.metrics import count, render, stage
+from fl_midi_generator.midi_writer import TICKS_PER_QUARTER, write_midi, write_midi_stream
+from fl_midi_generator.note_buffer import NoteBuffer
 
 # Обновленная версия генератора MIDI:
 # 1. Ударные инструменты не накладываются друг на друга (кроме бочки)
@@ -8,33 +15,102 @@ from midiutil.MidiFile import MIDIFile
 # 4. Все ударные (кроме баса) используют одну и ту же ноту
 # 5. Улучшенная генерация мелодии для большей музыкальности
 
-def generate_hiphop_beat(output_file="hiphop_beat.mid", 
-                          duration=4,
-                          tempo=90,
-                          scale=None,
-                          components=None):  # None = все компоненты, ["kick", "snare", "hihat", "bass", "melody"] для выбора
+# Различные типы хип-хоп направлений и их тональности
+hiphop_styles = {
+    'Trap': [0, 3, 5, 7, 10],  # C минорная пентатоника
+    'Boom Bap': [0, 3, 5, 7, 10],  # C минорная пентатоника
+    'Lo-Fi': [0, 2, 3, 5, 7, 8, 10],  # C минорная
+    'Drill': [0, 2, 3, 7, 8]  # C минорная с фригийским оттенком
+}
+
+# Типичные темпы в хип-хопе от 75 до 105 BPM
+hiphop_tempo_ranges = {
+    'Downtempo': (75, 85),       # Медленный хип-хоп
+    'Classic': (86, 95),         # Классический хип-хоп
+    'Modern': (96, 105)          # Современный хип-хоп
+}
+
+# Функция для генерации случайного темпа в диапазоне хип-хопа
+def random_hiphop_tempo(rng=random):
+    # Выбираем случайную категорию темпа
+    tempo_name = rng.choice(list(hiphop_tempo_ranges.keys()))
+    min_tempo, max_tempo = hiphop_tempo_ranges[tempo_name]
+    
+    # Генерируем случайное значение темпа в выбранном диапазоне
+    tempo_value = rng.randint(min_tempo, max_tempo)
+    
+    return tempo_value, tempo_name
+
+def write_output(output_file, notes, num_tracks, tempo, message, metrics=None):
     """
-    Generate a hip-hop style beat with drums and bass
+    Write generated notes to the requested destination
     
     Parameters:
-    - output_file: path to save the MIDI file
-    - duration: length in measures
-    - tempo: beats per minute (typical hip-hop: 85-100 BPM)
-    - scale: scale for the bass notes
-    - components: list of components to generate 
-      ["kick", "snare", "hihat", "bass", "melody"] or None for all
+    - output_file: one of
+      - a path: the file is written with midiutil, returns message
+      - None: returns the MIDI file as bytes
+      - a writable buffer (bytearray, memoryview): the MIDI file is
+        serialized into it, returns the number of bytes written
+      - a binary file-like object (socket file, archive member): the MIDI
+        bytes are written to it, returns message
+    - notes: NoteBuffer or list of (track, channel, pitch, start, length, velocity),
+      times in ticks
+    - num_tracks: number of note tracks
+    - tempo: beats per minute
+    - message: result message for file destinations
+    - metrics: optional RenderMetrics (see metrics.py)
     """
-    # Default to C minor pentatonic scale if none specified (common in hip-hop)
-    if scale is None:
-        scale = [0, 3, 5, 7, 10]  # C minor pentatonic
+    if isinstance(output_file, (bytearray, memoryview)):
+        size = write_midi(notes, num_tracks, tempo, buffer=output_file, metrics=metrics)
+        count(metrics, "bytes_written", size)
+        return size
+    
+    if output_file is None or hasattr(output_file, "write"):
+        data = write_midi(notes, num_tracks, tempo, metrics=metrics)
+    else:
+        # Путь к файлу - кодируем через midiutil, как и раньше
+        from midiutil.MidiFile import MIDIFile
         
+        with stage(metrics, "serialize"):
+            midi = MIDIFile(num_tracks, eventtime_is_ticks=True)
+            midi.addTempo(0, 0, tempo)
+            for track, channel, pitch, start, length, velocity in notes:
+                midi.addNote(track, channel, pitch, start, length, velocity)
+            midi_out = io.BytesIO()
+            midi.writeFile(midi_out)
+            data = midi_out.getvalue()
+    
+    count(metrics, "bytes_written", len(data))
+    if output_file is None:
+        return data
+    return write_bytes_output(output_file, data, message, metrics)
+
+# Время в тиках
+STEP_TICKS = TICKS_PER_QUARTER // 4  # шестнадцатая
+TICKS_PER_BAR = 4 * TICKS_PER_QUARTER  # такт 4/4
+
+HIPHOP_COMPONENTS = ["kick", "snare", "hihat", "bass", "melody"]
+HIPHOP_LOOP_BARS = 4  # длинные биты повторяют 4-тактовый луп
+BASS_OCTAVE = 36  # C2
+MELODY_CHANNEL = 0
+BASS_CHANNEL = 1
+
+# Длительности нот мелодии: 1/16, 1/8, 1/4, 1/2
+MELODY_DURATIONS = [STEP_TICKS, 2 * STEP_TICKS, TICKS_PER_QUARTER, 2 * TICKS_PER_QUARTER]
+EVEN_RHYTHM_DURATIONS = [2 * STEP_TICKS, TICKS_PER_QUARTER]  # ровный ритм: восьмые или четверти
+REST_CHANCE = 0.15
+MAX_LEAP = 7  # максимальный скачок мелодии (чистая квинта)
+
+def _normalize_components(components):
     # Default to all components if not specified
     if components is None:
-        components = ["kick", "snare", "hihat", "bass", "melody"]
+        components = list(HIPHOP_COMPONENTS)
     
     # Ensure components is a list
     if isinstance(components, str):
         components = [components]
+    else:
+        components = list(components)  # не изменяем список вызывающего кода
     
     # Convert legacy component names
     if "drums" in components:
@@ -46,50 +122,362 @@ def generate_hiphop_beat(output_file="hiphop_beat.mid",
         if "hihat" not in components:
             components.append("hihat")
     
-    # Determine how many tracks we need
-    # Each component gets its own track
-    tracks_needed = len(components)
+    return components
+
+def _melody_bar(scale, base_octave, octave_range, note_length, previous, rng=random):
+    """
+    Generate one bar of melody (see melody_engine), without a cadence
     
-    # Create MIDI file with the required number of tracks
-    midi = MIDIFile(tracks_needed)
+    Returns (notes, last pitch); notes are (start, length, pitch, velocity)
+    with start relative to the bar. note_length = None means random durations.
+    """
+    from fl_midi_generator.melody_engine import melody_rules
     
-    # Set tempo
-    track = 0
-    time = 0
-    midi.addTempo(track, time, tempo)
+    rules = melody_rules(scale, base_octave, octave_range, note_length)
+    bars, previous = rules.phrase(1, previous, cadence=False, rng=rng)
+    return bars[0], previous
+
+def _second_voice(notes, scale_pitches, octave_offset):
+    # Второй голос: терция вниз по гамме на сильных долях
+    voice = []
+    for start, length, pitch, velocity in notes:
+        if start % TICKS_PER_QUARTER:
+            continue
+        index = bisect.bisect_left(scale_pitches, pitch)
+        if index < 2:
+            continue
+        second = scale_pitches[index - 2] + octave_offset
+        if 0 <= second <= 127:
+            voice.append((start, length, second, max(1, velocity - 15)))
+    return voice
+
+def iter_random_midi_bars(duration=8,
+                          scale=None,
+                          even_rhythm=False,
+                          repeat_every=0,
+                          base_octave=84,
+                          octave_range=1,
+                          generate_second_voice=False,
+                          second_voice_octave_offset=0,
+                          rng=random):
+    """
+    Generate a random melody bar by bar
+    
+    Parameters are the same as for generate_random_midi, rng is the source
+    of randomness (random.Random instance or the random module). Yields one list of
+    notes per bar, notes are (track, channel, pitch, start, length, velocity)
+    with absolute times in ticks. Only the bars needed for repetition are
+    kept, so memory does not grow with duration.
+    """
+    from fl_midi_generator.melody_engine import PHRASE_BARS, melody_rules
+    
+    # Default to C major scale if none specified
+    if scale is None:
+        scale = [0, 2, 4, 5, 7, 9, 11]  # C major scale intervals
+    
+    note_length = rng.choice(EVEN_RHYTHM_DURATIONS) if even_rhythm else None
+    scale_classes = {interval % 12 for interval in scale}
+    scale_pitches = [p for p in range(128) if (p - base_octave) % 12 in scale_classes]
+    
+    # Мелодия строится фразами по правилам melody_engine: фраза - это
+    # повторяемый фрагмент или PHRASE_BARS тактов, и заканчивается каденцией
+    rules = melody_rules(scale, base_octave, octave_range, note_length)
+    phrase_bars = repeat_every if repeat_every > 0 else PHRASE_BARS
+    pattern = []  # такты, которые повторяются при repeat_every
+    phrase = []
+    previous = None
+    for bar in range(duration):
+        if repeat_every > 0 and bar >= repeat_every:
+            melody, voice = pattern[bar % repeat_every]
+        else:
+            if not phrase:
+                cyclic = 0 < repeat_every < duration
+                phrase, previous = rules.phrase(min(phrase_bars, duration - bar), previous, cyclic, rng=rng)
+                phrase.reverse()
+            melody = phrase.pop()
+            voice = _second_voice(melody, scale_pitches, second_voice_octave_offset) if generate_second_voice else []
+            if repeat_every > 0:
+                pattern.append((melody, voice))
+        
+        bar_start = bar * TICKS_PER_BAR
+        notes = [(0, MELODY_CHANNEL, pitch, bar_start + start, length, velocity)
+                 for start, length, pitch, velocity in melody]
+        notes.extend((1, MELODY_CHANNEL, pitch, bar_start + start, length, velocity)
+                     for start, length, pitch, velocity in voice)
+        yield notes
+
+def _bass_bar(kick_steps, scale, rng=random):
+    # Бас играет вместе с бочкой: в основном тоника, иногда другие ступени
+    notes = []
+    for i, step in enumerate(kick_steps):
+        next_step = kick_steps[i + 1] if i + 1 < len(kick_steps) else 16
+        length = min(next_step - step, 8) * STEP_TICKS
+        degree = scale[0] if rng.random() < 0.6 else rng.choice(scale)
+        notes.append((step * STEP_TICKS, length, BASS_OCTAVE + degree, rng.randint(95, 110)))
+    return notes
+
+def iter_hiphop_beat_bars(duration=4, scale=None, components=None, rng=random, drums=None):
+    """
+    Generate a hip-hop beat bar by bar
+    
+    Parameters are the same as for generate_hiphop_beat, rng is the source
+    of randomness (random.Random instance or the random module). Yields one list of
+    notes per bar, notes are (track, channel, pitch, start, length, velocity)
+    with absolute times in ticks; each component gets its own track in the
+    order of components.
+    
+    A loop of up to HIPHOP_LOOP_BARS bars is generated once and repeated,
+    so longer beats use constant memory.
+    """
+    import numpy as np
+    from fl_midi_generator.drum_matrix import (
+        DRUM_COMPONENTS, generate_drum_matrix, matrix_to_notes, resolve_overlaps,
+    )
+    from fl_midi_generator.melody_engine import melody_rules
+    
+    # Default to C minor pentatonic scale if none specified (common in hip-hop)
+    if scale is None:
+        scale = [0, 3, 5, 7, 10]  # C minor pentatonic
+    components = _normalize_components(components)
     
     # Track mapping - we need to know which track index to use for each component
     track_map = {}
     for i, component in enumerate(components):
         track_map[component] = i
     
-    # MIDI drum notes - все ударные на одной ноте
-    DRUM_NOTE = 36  # Используем только одну ноту для всех ударных
+    loop_bars = max(1, min(duration, HIPHOP_LOOP_BARS))
+    
+    # Drums: (components x sixteenth steps) velocity matrix, the non-overlap
+    # rule (only kick may overlap) is applied to the whole matrix at once.
+    # Матрица строится для всех ударных, чтобы бас следовал за бочкой
+    # даже если сама бочка не выбрана.
+    drum_rng = np.random.default_rng(rng.getrandbits(64))
+    if drums is None:
+        drum_matrix = generate_drum_matrix(loop_bars, DRUM_COMPONENTS, drum_rng)
+    elif isinstance(drums, str):
+        if drums != "masks":
+            raise ValueError(f"unknown drums {drums!r}, expected 'masks' or a velocity matrix")
+        # Битовые маски: призрачные удары, роллы хай-хэта и сбивки на сетке 32-х
+        from fl_midi_generator.drum_masks import generate_drum_masks, masks_to_matrix
+        masks = generate_drum_masks(1, loop_bars, drum_rng)
+        drum_matrix = masks_to_matrix(masks, rng=drum_rng)[0]
+    else:
+        # Готовый луп ударных (например, из midi_reader): повторяется или
+        # обрезается до длины лупа, правило наложений применяется и к нему
+        drum_matrix = np.asarray(drums, dtype=np.uint8)
+        steps = loop_bars * 16
+        drum_matrix = np.tile(drum_matrix, (1, -(-steps // drum_matrix.shape[1])))[:, :steps]
+        hits = resolve_overlaps(drum_matrix > 0, list(DRUM_COMPONENTS))
+        drum_matrix = np.where(hits, drum_matrix, 0).astype(np.uint8)
+    drum_rows = [i for i, name in enumerate(DRUM_COMPONENTS) if name in track_map]
+    drum_tracks = [track_map[DRUM_COMPONENTS[i]] for i in drum_rows]
+    steps_per_bar = drum_matrix.shape[1] // loop_bars
+    ticks_per_step = TICKS_PER_BAR // steps_per_bar
+    # Бас следует за бочкой по шестнадцатым и на более мелкой сетке
+    kick = drum_matrix[DRUM_COMPONENTS.index("kick"), ::steps_per_bar // 16]
+    
+    # Бас и мелодия генерируются всегда, а в файл попадают только выбранные
+    # компоненты - так любой набор компонентов берется из одного и того же
+    # бита (одинаковый seed = одинаковый грув)
+    # Мелодия в 5-6 октавах (MIDI 84-107), восьмыми, фраза из 2 тактов
+    # повторяется, поэтому последняя нота ведет обратно к первой
+    melody_bars = min(loop_bars, 2)
+    rules = melody_rules(scale, 84, 1, 2 * STEP_TICKS)
+    melody_phrase, _ = rules.phrase(melody_bars, cyclic=duration > melody_bars, rng=rng)
+    
+    loop = []
+    for bar in range(loop_bars):
+        bar_steps = slice(bar * steps_per_bar, (bar + 1) * steps_per_bar)
+        notes = matrix_to_notes(drum_matrix[drum_rows, bar_steps], drum_tracks, ticks_per_step)
+        
+        kick_steps = [int(step) for step in np.nonzero(kick[bar * 16:(bar + 1) * 16])[0]]
+        bass = _bass_bar(kick_steps, scale, rng)
+        if "bass" in track_map:
+            notes.extend((track_map["bass"], BASS_CHANNEL, pitch, start, length, velocity)
+                         for start, length, pitch, velocity in bass)
+        
+        loop.append((notes, melody_phrase[bar % melody_bars]))
+    
+    melody_track = track_map.get("melody")
+    for bar in range(duration):
+        notes, melody = loop[bar % loop_bars]
+        bar_start = bar * TICKS_PER_BAR
+        bar_notes = [(track, channel, pitch, bar_start + start, length, velocity)
+                     for track, channel, pitch, start, length, velocity in notes]
+        if melody_track is not None:
+            bar_notes.extend((melody_track, MELODY_CHANNEL, pitch, bar_start + start, length, velocity)
+                             for start, length, pitch, velocity in melody)
+        yield bar_notes
+
+def _timed_bars(bars, metrics):
+    # Генерация ленивая: время тратится, когда следующий такт запрашивают
+    bars = iter(bars)
+    while True:
+        with stage(metrics, "generate"):
+            bar = next(bars, None)
+        if bar is None:
+            return
+        metrics.add("bars")
+        metrics.add("notes", len(bar))
+        yield bar
+
+def _write_bars(output_file, bars, num_tracks, tempo, message, stream, metrics=None):
+    if metrics is not None:
+        bars = _timed_bars(bars, metrics)
     
-    beats_per_measure = 4
-    total_beats = duration * beats_per_measure
+    # Потоковая запись (постоянная память) возможна только в файл
+    if stream and output_file is not None and not isinstance(output_file, (bytearray, memoryview)):
+        with stage(metrics, "serialize"):
+            size = write_midi_stream(output_file, bars, num_tracks, tempo, metrics=metrics)
+        count(metrics, "bytes_written", size)
+        return message
     
-    # Volume variations for more realistic feel
-    drum_volumes = {
-        "kick": 110,     # Громкость бочки
-        "snare": 90,     # Средняя громкость малого барабана
-        "clap": 85,      # Громкость хлопка
-        "closed_hh": 80, # Тихие хай-хэты
-        "open_hh": 85    # Немного громче открытый хай-хэт
-    }
+    notes = NoteBuffer()
+    with stage(metrics, "assemble"):
+        for bar in bars:
+            notes.extend(bar)
+    return write_output(output_file, notes, num_tracks, tempo, message, metrics)
+
+def write_bytes_output(output_file, data, message, metrics=None):
+    """
+    Write an already serialized MIDI file to the requested destination
     
-    # Create a grid to avoid overlapping drum hits (except kick which can overlap)
-    drum_grid = {}  # time -> drum type
+    Same destinations and return values as write_output.
+    """
+    if output_file is None:
+        return data
     
-    # Implement drum patterns and bass for hip hop style
-    # code removed for brevity
+    with stage(metrics, "write"):
+        if isinstance(output_file, (bytearray, memoryview)):
+            view = memoryview(output_file).cast("B")
+            if len(view) < len(data):
+                raise ValueError(f"buffer holds {len(view)} bytes, the MIDI file needs {len(data)}")
+            view[:len(data)] = data
+            return len(data)
+        
+        if hasattr(output_file, "write"):
+            output_file.write(data)
+            return message
+        
+        with open(output_file, "wb") as midi_out:
+            midi_out.write(data)
+    return message
+
+def generate_hiphop_beat(output_file="hiphop_beat.mid", 
+                          duration=4,
+                          tempo=90,
+                          scale=None,
+                          components=None,  # None = все компоненты, ["kick", "snare", "hihat", "bass", "melody"] для выбора
+                          stream=False,
+                          seed=None,
+                          metrics=None,
+                          drums=None):
+    """
+    Generate a hip-hop style beat with drums and bass
+    
+    Parameters:
+    - output_file: where to put the MIDI file (see write_output)
+    - duration: length in measures
+    - tempo: beats per minute (typical hip-hop: 85-100 BPM)
+    - scale: scale for the bass notes
+    - components: list of components to generate 
+      ["kick", "snare", "hihat", "bass", "melody"] or None for all
+    - stream: if True, the file is written bar by bar with constant memory
+      (only for paths and file-like objects)
+    - seed: if given, the beat is fully defined by the parameters and the
+      seed (the global random module is not used)
+    - metrics: optional RenderMetrics; records per-stage timings, note
+      counts and bytes written (see metrics.py)
+    - drums: optional (kick, snare, hihat) x sixteenth steps velocity
+      matrix to use as the drum loop instead of a generated one (e.g.
+      MidiData.drum_matrix of a user loop); bass follows its kick.
+      "masks" generates the drums with the bitmask engine (drum_masks.py):
+      ghost snares, 32nd hihat rolls and fills on a 32nd-note grid
+    """
+    components = _normalize_components(components)
+    rng = random.Random(seed) if seed is not None else random
+    
+    # Determine how many tracks we need
+    # Each component gets its own track
+    tracks_needed = len(components)
     
-    # Write MIDI file
-    with open(output_file, "wb") as output_file:
-        midi.writeFile(output_file)
+    bars = iter_hiphop_beat_bars(duration, scale, components, rng, drums)
     
     generated_components = ", ".join(components)
-    return f"Hip-hop beat created with components: {generated_components}"
+    with render(metrics):
+        return _write_bars(output_file, bars, tracks_needed, tempo,
+                           f"Hip-hop beat created with components: {generated_components}",
+                           stream, metrics)
+
+def render_hiphop_stems(stems,
+                        duration=4,
+                        tempo=90,
+                        scale=None,
+                        seed=None):
+    """
+    Generate one hip-hop beat and split it into stems
+    
+    Parameters:
+    - stems: list of component lists, one MIDI file per entry,
+      e.g. [["kick"], ["snare"], ["bass"]] or [["kick", "snare", "hihat"]]
+    - duration, tempo, scale, seed: same as for generate_hiphop_beat
+    
+    The beat is generated once with all components, so every stem comes
+    from the same groove. Returns a list of MIDI files (bytes), one per stem.
+    """
+    stems = [_normalize_components(components) for components in stems]
+    all_components = list(HIPHOP_COMPONENTS)
+    for components in stems:
+        for component in components:
+            if component not in all_components:
+                all_components.append(component)
+    
+    rng = random.Random(seed) if seed is not None else random
+    notes = NoteBuffer()
+    for bar in iter_hiphop_beat_bars(duration, scale, all_components, rng):
+        notes.extend(bar)
+    
+    return [write_midi(notes.select_tracks([all_components.index(c) for c in components]),
+                       len(components), tempo)
+            for components in stems]
+
+def generate_hiphop_stems(stems,
+                          duration=4,
+                          tempo=90,
+                          scale=None,
+                          seed=None,
+                          multitrack_file=None):
+    """
+    Generate one hip-hop beat and write it as separate stem files
+    
+    Parameters:
+    - stems: dict output path -> list of components for that file,
+      e.g. {"hiphop_kick.mid": ["kick"], "hiphop_bass.mid": ["bass"]}
+    - duration, tempo, scale, seed: same as for generate_hiphop_beat
+    - multitrack_file: optional path of one more file with all stem
+      components, each on its own track
+    
+    All stems are serialized in memory first and then written in one pass.
+    Returns a list of result messages, one per written file.
+    """
+    stems = dict(stems)
+    if multitrack_file is not None:
+        combined = []
+        for components in stems.values():
+            for component in _normalize_components(components):
+                if component not in combined:
+                    combined.append(component)
+        stems[multitrack_file] = combined
+    
+    rendered = render_hiphop_stems(list(stems.values()), duration, tempo, scale, seed)
+    
+    messages = []
+    for (output_file, components), data in zip(stems.items(), rendered):
+        with open(output_file, "wb") as midi_out:
+            midi_out.write(data)
+        messages.append(f"Hip-hop stem {output_file} created with components: "
+                        f"{', '.join(_normalize_components(components))}")
+    return messages
 
 def generate_random_midi(output_file="random_melody.mid", 
                         tracks=1, 
@@ -103,12 +491,16 @@ def generate_random_midi(output_file="random_melody.mid",
                         generate_second_voice=False,  # Generate a second voice/melody
                         second_voice_octave_offset=0,  # Offset for the second voice (e.g., -12 = one octave lower)
                         hiphop_style=False,  # Generate with hip-hop rhythm style
-                        hiphop_components=None):  # If hiphop_style is True, specify which components
+                        hiphop_components=None,  # If hiphop_style is True, specify which components
+                        stream=False,  # Write bar by bar with constant memory
+                        seed=None,  # Seed for reproducible output
+                        cache=None,  # PatternCache for seeded results
+                        metrics=None):  # RenderMetrics for per-stage profiling
     """
     Generate a random MIDI file
     
     Parameters:
-    - output_file: path to save the MIDI file
+    - output_file: where to put the MIDI file (see write_output)
     - tracks: number of tracks to create
     - duration: length of the melody in measures
     - tempo: beats per minute
@@ -121,35 +513,67 @@ def generate_random_midi(output_file="random_melody.mid",
     - second_voice_octave_offset: pitch offset for the second voice (e.g., -12 = one octave lower)
     - hiphop_style: if True, uses hip-hop style rhythm patterns
     - hiphop_components: if hiphop_style is True, specify which components to generate
+    - stream: if True, the file is written bar by bar with constant memory
+      (only for paths and file-like objects)
+    - seed: if given, the result is fully defined by the parameters and the
+      seed (the global random module is not used)
+    - cache: optional PatternCache; seeded results are looked up by a hash
+      of all parameters and a hit skips both generation and MIDI writing
+      (unseeded calls are random and never cached)
+    - metrics: optional RenderMetrics; records per-stage timings, note
+      counts and bytes written (see metrics.py)
     """
+    with render(metrics):
+        return _generate_random_midi(output_file, tracks, duration, tempo, scale, even_rhythm,
+                                     repeat_every, base_octave, octave_range, generate_second_voice,
+                                     second_voice_octave_offset, hiphop_style, hiphop_components,
+                                     stream, seed, cache, metrics)
+
+def _generate_random_midi(output_file, tracks, duration, tempo, scale, even_rhythm, repeat_every,
+                          base_octave, octave_range, generate_second_voice,
+                          second_voice_octave_offset, hiphop_style, hiphop_components,
+                          stream, seed, cache, metrics):
+    if cache is not None and seed is not None:
+        if hiphop_style:
+            message = f"Hip-hop beat created with components: {', '.join(_normalize_components(hiphop_components))}"
+            params = {"hiphop_style": True, "duration": duration, "tempo": tempo, "scale": scale,
+                      "components": _normalize_components(hiphop_components), "seed": seed}
+        else:
+            message = f"MIDI file created: {output_file}"
+            params = {"tracks": tracks, "duration": duration, "tempo": tempo, "scale": scale,
+                      "even_rhythm": even_rhythm, "repeat_every": repeat_every,
+                      "base_octave": base_octave, "octave_range": octave_range,
+                      "generate_second_voice": generate_second_voice,
+                      "second_voice_octave_offset": second_voice_octave_offset, "seed": seed}
+        key = cache_key(params)
+        with stage(metrics, "cache"):
+            data = cache.get(key)
+        if data is None:
+            data = generate_random_midi(None, tracks, duration, tempo, scale, even_rhythm, repeat_every,
+                                        base_octave, octave_range, generate_second_voice,
+                                        second_voice_octave_offset, hiphop_style, hiphop_components,
+                                        seed=seed, metrics=metrics)
+            with stage(metrics, "cache"):
+                cache.put(key, data)
+        else:
+            count(metrics, "bytes_written", len(data))
+        return write_bytes_output(output_file, data, message, metrics)
+    
     # If hip-hop style is requested, redirect to the specialized function
     if hiphop_style:
-        return generate_hiphop_beat(output_file, duration, tempo, scale, hiphop_components)
-    
-    # Default to C major scale if none specified
-    if scale is None:
-        scale = [0, 2, 4, 5, 7, 9, 11]  # C major scale intervals
+        return generate_hiphop_beat(output_file, duration, tempo, scale, hiphop_components, stream, seed,
+                                    metrics)
     
     # If we're generating a second voice, ensure we have at least 2 tracks
     if generate_second_voice and tracks < 2:
         tracks = 2
     
-    # Create MIDI file with specified number of tracks
-    midi = MIDIFile(tracks)
-    
-    # Set tempo
-    main_track = 0
-    time = 0
-    midi.addTempo(main_track, time, tempo)
-    
-    # MIDI generation code removed for brevity
-    # Implements various melody generation strategies
-    
-    # Write MIDI file
-    with open(output_file, "wb") as output_file:
-        midi.writeFile(output_file)
+    rng = random.Random(seed) if seed is not None else random
+    bars = iter_random_midi_bars(duration, scale, even_rhythm, repeat_every, base_octave,
+                                 octave_range, generate_second_voice, second_voice_octave_offset, rng)
     
-    return f"MIDI file created: {file_path}"
+    return _write_bars(output_file, bars, tracks, tempo, f"MIDI file created: {output_file}", stream,
+                       metrics)
 
 if __name__ == "__main__":
     # Generate random melody in C major
@@ -0,0 +1,487 @@
+"""
+Fast Standard MIDI File reader.
+
+Files are memory-mapped (or taken from bytes) and decoded straight into
+NumPy arrays, without a Python object per event. Channel events with
+two data bytes (notes, controllers, pitch bend) make up almost all of a
+file, and they are decoded vectorized, a block of events at a time:
+
+- every such event has exactly three bytes below 0x80 (the last byte of
+  the delta-time and the two data bytes), so once the first event of a
+  block is known, the k-th event is the k-th triple of those bytes;
+- the bytes in between are delta-time continuation bytes and optional
+  status bytes, which give the delta-times and running status.
+
+A block stops at the first event that does not fit this shape (meta,
+sysex, program change, running status of such an event). That one event
+is decoded sequentially, then vectorized decoding goes on. Blocks grow
+while no such event shows up, so the rare meta events cost little.
+
+Note on / off pairs become a NoteBuffer (the same notes the generators
+produce), and the loop parameters can be extracted from it:
+
+    midi = read_midi("loop.mid")
+    midi.tempo, midi.scale(), midi.drum_matrix()
+    generate_hiphop_beat("more.mid", duration=8, **midi.beat_params())
+"""
+
+import mmap
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import DRUM_CHANNEL, DRUM_COMPONENTS, STEPS_PER_BAR
+from fl_midi_generator.midi_generator import hiphop_styles
+from fl_midi_generator.note_buffer import NoteBuffer
+
+DEFAULT_TEMPO = 120.0
+FIRST_BLOCK = 64  # событий в первом векторизованном блоке
+MAX_BLOCK = 1 << 16
+
+# Ударные General MIDI -> компоненты генератора
+GM_DRUMS = {
+    35: "kick", 36: "kick",
+    37: "snare", 38: "snare", 39: "snare", 40: "snare",  # рим, малый, хлопок
+    42: "hihat", 44: "hihat", 46: "hihat",
+}
+
+# Гаммы для определения тональности: пресеты стилей плюс мажор и минор
+KEY_SCALES = {
+    "Major": [0, 2, 4, 5, 7, 9, 11],
+    "Minor": [0, 2, 3, 5, 7, 8, 10],
+    "Minor Pentatonic": [0, 3, 5, 7, 10],
+    "Phrygian Minor": [0, 2, 3, 7, 8],
+}
+
+_CHANNEL_STATUS = np.zeros(256, dtype=bool)  # статус с двумя байтами данных
+_CHANNEL_STATUS[0x80:0xC0] = True
+_CHANNEL_STATUS[0xE0:0xF0] = True
+
+
+def _two_data_bytes(status):
+    return status is not None and (0x80 <= status < 0xC0 or 0xE0 <= status < 0xF0)
+
+
+class _TrackEvents:
+    # Колонки событий одной дорожки: блоками массивов и по одному событию
+    def __init__(self):
+        self.blocks = []  # (delta, status, data1, data2)
+        self.single = []
+        self.metas = []  # (номер события, тип, данные)
+        self.count = 0
+
+    def flush_single(self):
+        if self.single:
+            self.blocks.append(tuple(np.array(column, dtype=dtype) for column, dtype
+                                     in zip(zip(*self.single), ("i8", "u1", "u1", "u1"))))
+            self.single = []
+
+    def add(self, delta, status, data1, data2):
+        self.single.append((delta, status, data1, data2))
+        self.count += 1
+
+    def add_block(self, block):
+        self.flush_single()
+        self.blocks.append(block)
+        self.count += len(block[0])
+
+    def columns(self):
+        self.flush_single()
+        if not self.blocks:
+            return tuple(np.zeros(0, dtype=dtype) for dtype in ("i8", "u1", "u1", "u1"))
+        return tuple(np.concatenate(column) for column in zip(*self.blocks))
+
+
+def _read_vlq(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _decode_one(data, pos, running, events):
+    # Одно событие последовательно; возвращает (позиция, running status)
+    delta, pos = _read_vlq(data, pos)
+    status = data[pos]
+    if status >= 0x80:
+        pos += 1
+    elif running is None:
+        raise ValueError(f"data byte 0x{status:02x} without running status at offset {pos}")
+    else:
+        status = running
+    if status == 0xFF:
+        kind = data[pos]
+        length, pos = _read_vlq(data, pos + 1)
+        events.metas.append((events.count, kind, bytes(data[pos:pos + length])))
+        events.add(delta, 0xFF, kind, 0)
+        return pos + length, running
+    if status in (0xF0, 0xF7):
+        length, pos = _read_vlq(data, pos)
+        events.add(delta, status, 0, 0)
+        return pos + length, running
+    if 0xC0 <= status < 0xE0:
+        events.add(delta, status, data[pos], 0)
+        return pos + 1, status
+    events.add(delta, status, data[pos], data[pos + 1])
+    return pos + 2, status
+
+
+def _decode_block(track, low, pos, k, count, running):
+    # count событий с двумя байтами данных начиная с pos; возвращает число
+    # подходящих событий (до первого другого) и их колонки
+    t = low[k:k + 3 * count:3]
+    a = low[k + 1:k + 3 * count:3]
+    b = low[k + 2:k + 3 * count:3]
+    previous_end = np.empty_like(b)
+    previous_end[0] = pos - 1
+    previous_end[1:] = b[:-1]
+    continuation = t - previous_end - 1
+    gap = a - t - 1
+    has_status = gap == 1
+    status = track[np.minimum(t + 1, len(track) - 1)]
+    valid = (continuation <= 3) & (gap <= 1) & (b - a == 1) & (~has_status | _CHANNEL_STATUS[status])
+    if not has_status[0] and not _two_data_bytes(running):
+        valid[0] = False
+    bad = np.flatnonzero(~valid)
+    good = int(bad[0]) if len(bad) else count
+    if good == 0:
+        return 0, None
+    t, a, b = t[:good], a[:good], b[:good]
+    continuation, has_status, status = continuation[:good], has_status[:good], status[:good]
+
+    delta = track[t].astype(np.int64)
+    for shift in range(1, 4):
+        present = continuation >= shift
+        if present.any():
+            byte = track[np.where(present, t - shift, t)].astype(np.int64) & 0x7F
+            delta |= np.where(present, byte << (7 * shift), 0)
+    # Running status: последний явный статус до события включительно
+    last = np.where(has_status, np.arange(good), -1)
+    np.maximum.accumulate(last, out=last)
+    statuses = np.where(last >= 0, status[np.maximum(last, 0)], running if running is not None else 0)
+    return good, (delta, statuses.astype(np.uint8), track[a], track[b])
+
+
+def _decode_track(track):
+    events = _TrackEvents()
+    raw = memoryview(track)  # побайтовый доступ без numpy-скаляров
+    low = np.flatnonzero(track < 0x80)
+    pos, k, running = 0, 0, None
+    block = FIRST_BLOCK
+    end = len(track)
+    while pos < end:
+        count = min(block, (len(low) - k) // 3)
+        good = 0
+        if count > 0:
+            good, columns = _decode_block(track, low, pos, k, count, running)
+            if good:
+                events.add_block(columns)
+                running = int(columns[1][-1])
+                pos = int(low[k + 3 * good - 1]) + 1
+                k += 3 * good
+        if good == count and count == block:
+            block = min(block * 2, MAX_BLOCK)
+            continue
+        if pos >= end:
+            break
+        block = FIRST_BLOCK
+        pos, running = _decode_one(raw, pos, running, events)
+        if events.metas and events.metas[-1][1] == 0x2F:
+            break  # End of Track
+        k = int(np.searchsorted(low, pos))
+    return events
+
+
+class MidiData:
+    """
+    Decoded MIDI file
+
+    Attributes:
+    - notes: NoteBuffer (track, channel, pitch, start, length, velocity)
+    - ticks_per_quarter: time division of the file
+    - num_tracks: number of tracks (including a tempo track)
+    - tempos: list of (tick, beats per minute)
+    - time_signature: (numerator, denominator) or None
+    - length: tick of the last event
+    - format: SMF format (0 = one track, 1 = parallel tracks)
+    """
+
+    def __init__(self, notes, ticks_per_quarter, num_tracks, tempos, time_signature, length, format=1):
+        self.notes = notes
+        self.format = format
+        self.ticks_per_quarter = ticks_per_quarter
+        self.num_tracks = num_tracks
+        self.tempos = tempos
+        self.time_signature = time_signature
+        self.length = length
+
+    def __repr__(self):
+        return (f"MidiData({len(self.notes)} notes, {self.num_tracks} tracks, "
+                f"{self.tempo:g} BPM, {self.ticks_per_quarter} ticks per quarter)")
+
+    @property
+    def tempo(self):
+        """
+        Initial tempo in beats per minute (DEFAULT_TEMPO if the file has none)
+        """
+        return self.tempos[0][1] if self.tempos else DEFAULT_TEMPO
+
+    @property
+    def bars(self):
+        """
+        Length in whole 4/4 bars (at least 1)
+        """
+        ticks_per_bar = 4 * self.ticks_per_quarter
+        return max(1, -(-self.length // ticks_per_bar))
+
+    def _pitched(self):
+        cols = self.notes.columns()
+        return cols, cols["channel"] != DRUM_CHANNEL
+
+    def key(self, scales=None):
+        """
+        Most likely (root, scale name) of the pitched notes
+
+        Parameters:
+        - scales: dict name -> C-rooted intervals to choose from
+          (default: KEY_SCALES plus the hip-hop style presets)
+
+        Every candidate is scored by the note time (duration-weighted
+        pitch class histogram) inside the scale minus outside, with a
+        bonus for time on the root. Returns None if there are no pitched
+        notes.
+        """
+        if scales is None:
+            scales = dict(KEY_SCALES)
+            scales.update(hiphop_styles)
+        cols, pitched = self._pitched()
+        if not pitched.any():
+            return None
+        histogram = np.bincount(cols["pitch"][pitched] % 12, weights=cols["length"][pitched], minlength=12)
+        best = None
+        for name, intervals in scales.items():
+            member = np.zeros(12, dtype=bool)
+            member[[interval % 12 for interval in intervals]] = True
+            for root in range(12):
+                rotated = np.roll(member, root)
+                score = histogram[rotated].sum() - histogram[~rotated].sum() + 0.5 * histogram[root]
+                # При равенстве побеждает гамма с меньшим числом ступеней
+                candidate = (score, -len(intervals))
+                if best is None or candidate > best[0]:
+                    best = (candidate, root, name)
+        return best[1], best[2]
+
+    def scale(self, scales=None):
+        """
+        Detected scale as intervals from C with the root first, e.g. D minor
+        pentatonic = [2, 5, 7, 9, 12], usable as scale= of the generators
+        (None if there are no pitched notes)
+        """
+        key = self.key(scales)
+        if key is None:
+            return None
+        root, name = key
+        intervals = (scales or {**KEY_SCALES, **hiphop_styles})[name]
+        return [root + interval for interval in intervals]
+
+    def track_components(self, components):
+        """
+        Dict track number -> component name for a component per note track
+        (as given to generate_hiphop_beat); a leading format 1 tempo track
+        without notes is not counted
+        """
+        tracks = self.notes.columns()["track"]
+        first = 1 if self.format == 1 and not (tracks == 0).any() else 0
+        return dict(enumerate(components, first))
+
+    def drum_matrix(self, components=None, bars=None, drum_map=GM_DRUMS):
+        """
+        Drum grid as a (len(DRUM_COMPONENTS) x bars * 16) velocity matrix
+
+        Parameters:
+        - components: component name per note track, as given to
+          generate_hiphop_beat (for files from this generator, whose drums
+          all use one note on separate tracks, see track_components);
+          None = map the pitches of the drum channel with drum_map
+        - bars: grid length in bars (default: the length of the file)
+        - drum_map: MIDI pitch -> drum component for components=None
+
+        Hits are quantized to the nearest sixteenth; the louder of two hits
+        on the same step wins.
+        """
+        bars = bars or self.bars
+        steps = bars * STEPS_PER_BAR
+        matrix = np.zeros((len(DRUM_COMPONENTS), steps), dtype=np.uint8)
+        cols = self.notes.columns()
+        rows = np.full(len(self.notes), -1, dtype=np.int64)
+        if components is not None:
+            for track, name in self.track_components(components).items():
+                if name in DRUM_COMPONENTS:
+                    rows[cols["track"] == track] = DRUM_COMPONENTS.index(name)
+        else:
+            drum = cols["channel"] == DRUM_CHANNEL
+            lookup = np.full(128, -1, dtype=np.int64)
+            for pitch, name in drum_map.items():
+                lookup[pitch] = DRUM_COMPONENTS.index(name)
+            rows[drum] = lookup[cols["pitch"][drum]]
+        step_ticks = self.ticks_per_quarter / 4
+        steps_of = np.rint(cols["start"] / step_ticks).astype(np.int64)
+        use = (rows >= 0) & (steps_of < steps)
+        np.maximum.at(matrix, (rows[use], steps_of[use]), cols["velocity"][use])
+        return matrix
+
+    def beat_params(self, components=None, bars=None):
+        """
+        Keyword arguments for generate_hiphop_beat that continue this loop:
+        its tempo, scale and drum grid (see drum_matrix)
+        """
+        params = {"tempo": round(self.tempo, 3), "drums": self.drum_matrix(components, bars)}
+        scale = self.scale()
+        if scale is not None:
+            params["scale"] = scale
+        return params
+
+    def melody_params(self):
+        """
+        Keyword arguments for generate_random_midi: tempo and scale
+        """
+        params = {"tempo": round(self.tempo, 3)}
+        scale = self.scale()
+        if scale is not None:
+            params["scale"] = scale
+        return params
+
+
+def parse_midi(data):
+    """
+    Decode a MIDI file from a bytes-like object (bytes, mmap, memoryview)
+
+    Returns a MidiData; raises ValueError for data that is not a Standard
+    MIDI File or uses SMPTE time division.
+    """
+    view = np.frombuffer(data, dtype=np.uint8)
+    if len(view) < 14 or bytes(view[:4]) != b"MThd":
+        raise ValueError("not a Standard MIDI File (no MThd header)")
+    header_length, file_format, num_tracks, division = struct.unpack(">IHHH", bytes(view[4:14]))
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+
+    pos = 8 + header_length
+    columns = {name: [] for name in ("track", "channel", "pitch", "start", "length", "velocity")}
+    tempos = []
+    time_signature = None
+    length = 0
+    track_index = 0
+    while pos + 8 <= len(view) and track_index < num_tracks:
+        chunk_type = bytes(view[pos:pos + 4])
+        chunk_length = struct.unpack(">I", bytes(view[pos + 4:pos + 8]))[0]
+        pos += 8
+        if chunk_type != b"MTrk":
+            pos += chunk_length  # неизвестные чанки пропускаются
+            continue
+        events = _decode_track(view[pos:pos + chunk_length])
+        pos += chunk_length
+        delta, status, data1, data2 = events.columns()
+        ticks = np.cumsum(delta)
+        if len(ticks):
+            length = max(length, int(ticks[-1]))
+        for index, kind, payload in events.metas:
+            if kind == 0x51 and len(payload) == 3:
+                tempos.append((int(ticks[index]), 60000000 / int.from_bytes(payload, "big")))
+            elif kind == 0x58 and len(payload) >= 2 and time_signature is None:
+                time_signature = (payload[0], 2 ** payload[1])
+        _pair_notes(columns, track_index, ticks, status, data1, data2, int(ticks[-1]) if len(ticks) else 0)
+        track_index += 1
+
+    notes = NoteBuffer()
+    if columns["start"]:
+        notes.extend_columns(*(np.concatenate(columns[name]) for name in columns))
+    tempos.sort(key=lambda tempo: tempo[0])
+    return MidiData(notes, division, track_index, tempos, time_signature, length, file_format)
+
+
+def _pair_notes(columns, track, ticks, status, data1, data2, track_end):
+    # Нота длится до следующего события той же клавиши (note off или
+    # повторный note on), как при записи в midi_writer
+    kind = status & 0xF0
+    is_on = (kind == 0x90) & (data2 > 0)
+    index = np.flatnonzero(is_on | (kind == 0x80) | (kind == 0x90))
+    if not len(index):
+        return
+    # Ключ канал * 128 + нота помещается в uint16 - стабильная сортировка
+    # таких ключей в NumPy поразрядная
+    key = (status[index] & 0x0F).astype(np.uint16) * 128 + data1[index]
+    by_key = np.argsort(key, kind="stable")
+    order = index[by_key]
+    same_next = np.zeros(len(order), dtype=bool)
+    same_next[:-1] = key[by_key[1:]] == key[by_key[:-1]]
+    next_tick = np.full(len(order), track_end, dtype=np.int64)
+    next_tick[same_next] = ticks[order[1:][same_next[:-1]]]
+    # Конец каждой ноты - обратно в порядок событий файла
+    end_of = np.empty(len(ticks), dtype=np.int64)
+    end_of[order] = next_tick
+    starts = np.flatnonzero(is_on)
+    start_ticks = ticks[starts]
+    ends = end_of[starts]
+    keep = ends > start_ticks
+    if not keep.all():
+        starts, start_ticks, ends = starts[keep], start_ticks[keep], ends[keep]
+    columns["track"].append(np.full(len(starts), track, dtype=np.uint8))
+    columns["channel"].append(status[starts] & 0x0F)
+    columns["pitch"].append(data1[starts])
+    columns["start"].append(start_ticks)
+    columns["length"].append(ends - start_ticks)
+    columns["velocity"].append(data2[starts])
+
+
+def read_midi(source):
+    """
+    Read a MIDI file from a path (memory-mapped), a binary file object or bytes
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return parse_midi(source)
+    if hasattr(source, "read"):
+        return parse_midi(source.read())
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{source} is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return parse_midi(mapped)
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # массивы нот уже скопированы; карту закроет сборщик
+
+
+def iter_midi_archive(path):
+    """
+    Yield (name, MidiData) for every .mid/.midi file in a directory tree or
+    a .zip archive; files that fail to parse are skipped
+    """
+    def is_midi(name):
+        return name.lower().endswith((".mid", ".midi"))
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if is_midi(name):
+                    try:
+                        yield name, parse_midi(archive.read(name))
+                    except (ValueError, IndexError):
+                        continue
+        return
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if is_midi(name):
+                full = os.path.join(root, name)
+                try:
+                    yield full, read_midi(full)
+                except (ValueError, IndexError):
+                    continue
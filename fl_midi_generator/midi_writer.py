@@ -0,0 +1,360 @@
+"""
+In-memory Standard MIDI File writer.
+
+Serializes notes (a NoteBuffer or a list of note tuples) straight into a
+preallocated buffer and returns the bytes, so a MIDI file can be sent over
+a socket or stored in an archive without a temporary file. Sorting and
+encoding run over whole NumPy columns. Uses running status (note-off is written as a
+note-on with velocity 0) and variable-length delta-times, which makes the
+output noticeably smaller than the midiutil one.
+
+A note is a tuple (track, channel, pitch, start, length, velocity) with
+start and length in ticks - the same argument order as MIDIFile.addNote.
+
+write_midi_stream writes very long renders from a stream of bars with flat
+memory use.
+"""
+
+import heapq
+import shutil
+import struct
+import tempfile
+
+from fl_midi_generator.metrics import stage
+from fl_midi_generator.note_buffer import NoteBuffer
+
+TICKS_PER_QUARTER = 960  # same resolution as midiutil.MIDIFile by default
+
+# Worst case per note event: 4 bytes of delta-time + 3 bytes of event
+_MAX_EVENT_SIZE = 7
+_MAX_DELTA = 0x0FFFFFFF  # largest value a 4-byte variable-length quantity holds
+_TRACK_OVERHEAD = 8 + 4  # chunk header + end of track meta event
+_TEMPO_TRACK_SIZE = 8 + 7 + 4  # chunk header + set tempo + end of track
+
+
+def tempo_to_microseconds(tempo):
+    # Микросекунд на четвертную ноту
+    return int(60000000 / tempo)  # как в midiutil
+
+
+def max_midi_size(notes, num_tracks):
+    """
+    Upper bound of the serialized size for the given notes, in bytes
+    """
+    return 14 + _TEMPO_TRACK_SIZE + num_tracks * _TRACK_OVERHEAD + 2 * len(notes) * _MAX_EVENT_SIZE
+
+
+def _header_and_tempo(num_tracks, tempo, ticks_per_quarter):
+    # Header: format 1, tempo track + note tracks
+    header = struct.pack(">4sIHHH", b"MThd", 6, 1, num_tracks + 1, ticks_per_quarter)
+    tempo_track = (b"MTrk" + struct.pack(">I", 11)
+                   + b"\x00\xff\x51\x03" + tempo_to_microseconds(tempo).to_bytes(3, "big")
+                   + b"\x00\xff\x2f\x00")
+    return header + tempo_track
+
+
+def _note_events(cols, num_tracks):
+    """
+    Turn note columns into sorted event columns
+
+    A note is cut where the same pitch starts again on the same track and
+    channel (as midiutil does), notes that end up empty are dropped. Events
+    are sorted by (track, tick, note off before note on, channel, pitch).
+    """
+    import numpy as np
+
+    track = cols["track"].astype(np.int64)
+    if len(track) and track.max() >= num_tracks:
+        raise ValueError(f"note on track {int(track.max())}, but the file has {num_tracks} tracks")
+    channel = cols["channel"].astype(np.int64)
+    pitch = cols["pitch"].astype(np.int64)
+    start = cols["start"]
+    end = start + cols["length"]
+
+    # Обрезаем ноту там, где та же нота начинается снова
+    order = np.lexsort((start, pitch, channel, track))
+    key = (track << 11 | channel << 7 | pitch)[order]
+    same_next = key[:-1] == key[1:]
+    sorted_end = end[order]
+    sorted_end[:-1][same_next] = np.minimum(sorted_end[:-1][same_next], start[order][1:][same_next])
+    end = np.empty_like(end)
+    end[order] = sorted_end
+    keep = end > start
+
+    n = int(keep.sum())
+    tick = np.concatenate((end[keep], start[keep]))
+    is_on = np.concatenate((np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.int64)))
+    ev_track = np.concatenate((track[keep], track[keep]))
+    ev_channel = np.concatenate((channel[keep], channel[keep]))
+    ev_pitch = np.concatenate((pitch[keep], pitch[keep]))
+    # note off = note on с нулевой громкостью (позволяет running status)
+    ev_velocity = np.concatenate((np.zeros(n, dtype=np.int64), cols["velocity"][keep].astype(np.int64)))
+
+    order = np.lexsort((ev_pitch, ev_channel, is_on, tick, ev_track))
+    return ev_track[order], tick[order], ev_channel[order], ev_pitch[order], ev_velocity[order]
+
+
+def _serialize(cols, num_tracks, tempo, ticks_per_quarter, buffer, metrics=None):
+    with stage(metrics, "sort"):
+        track, tick, channel, pitch, velocity = _note_events(cols, num_tracks)
+    with stage(metrics, "serialize"):
+        return _encode(track, tick, channel, pitch, velocity, num_tracks, tempo, ticks_per_quarter, buffer)
+
+
+def _encode(track, tick, channel, pitch, velocity, num_tracks, tempo, ticks_per_quarter, buffer):
+    # Все события кодируются разом: сначала размеры, потом позиции, потом байты
+    import numpy as np
+
+    count = len(tick)
+
+    first_in_track = np.ones(count, dtype=bool)
+    first_in_track[1:] = track[1:] != track[:-1]
+    previous_tick = np.zeros(count, dtype=np.int64)
+    previous_tick[1:] = tick[:-1]
+    previous_tick[first_in_track] = 0
+    delta = tick - previous_tick
+    if count and delta.max() > _MAX_DELTA:
+        raise ValueError(f"delta-time {int(delta.max())} does not fit into a MIDI file")
+
+    status = 0x90 | channel
+    need_status = first_in_track.copy()
+    need_status[1:] |= status[1:] != status[:-1]
+
+    delta_size = 1 + (delta >= 0x80) + (delta >= 0x4000) + (delta >= 0x200000)
+    event_size = delta_size + need_status + 2
+
+    # Размер каждого трека: события + end of track
+    track_body = np.bincount(track, weights=event_size, minlength=num_tracks).astype(np.int64) + 4
+    chunk_start = np.zeros(num_tracks, dtype=np.int64)
+    chunk_start[1:] = np.cumsum(track_body + 8)[:-1]
+
+    fixed = _header_and_tempo(num_tracks, tempo, ticks_per_quarter)
+    body_start = len(fixed) + chunk_start + 8
+    total = len(fixed) + int((track_body + 8).sum())
+
+    if buffer is None:
+        out = np.empty(total, dtype=np.uint8)
+    else:
+        view = memoryview(buffer).cast("B")
+        if view.readonly:
+            raise TypeError("buffer is read-only")
+        if len(view) < total:
+            raise ValueError(f"buffer holds {len(view)} bytes, the MIDI file needs {total}")
+        out = np.frombuffer(view, dtype=np.uint8, count=total)
+
+    # Позиция события = начало трека + сумма размеров предыдущих событий трека
+    cumulative = np.cumsum(event_size) - event_size
+    track_first = np.zeros(num_tracks, dtype=np.int64)
+    track_first[track[first_in_track]] = cumulative[first_in_track]
+    pos = body_start[track] + cumulative - track_first[track]
+
+    # Variable-length delta-time, старшие группы с битом продолжения
+    for shift, min_size in ((21, 4), (14, 3), (7, 2)):
+        mask = delta_size >= min_size
+        out[pos[mask] + delta_size[mask] - min_size] = 0x80 | ((delta[mask] >> shift) & 0x7F)
+    pos = pos + delta_size
+    out[pos - 1] = delta & 0x7F
+
+    out[pos[need_status]] = status[need_status]
+    pos = pos + need_status
+    out[pos] = pitch
+    out[pos + 1] = velocity
+
+    out[:len(fixed)] = np.frombuffer(fixed, dtype=np.uint8)
+    for t in range(num_tracks):
+        chunk = len(fixed) + int(chunk_start[t])
+        out[chunk:chunk + 8] = np.frombuffer(b"MTrk" + struct.pack(">I", int(track_body[t])), dtype=np.uint8)
+        end = chunk + 8 + int(track_body[t])
+        out[end - 4:end] = (0x00, 0xFF, 0x2F, 0x00)
+
+    if buffer is None:
+        return out.tobytes()
+    return total
+
+
+def write_midi(notes, num_tracks, tempo, buffer=None, ticks_per_quarter=TICKS_PER_QUARTER,
+               metrics=None):
+    """
+    Serialize notes into a format 1 MIDI file
+
+    Parameters:
+    - notes: NoteBuffer or iterable of (track, channel, pitch, start,
+      length, velocity) tuples, times in ticks
+    - num_tracks: number of note tracks (a tempo track is added in front,
+      like midiutil does)
+    - tempo: beats per minute
+    - buffer: optional writable buffer (bytearray, memoryview, ...) to
+      serialize into; max_midi_size(notes, num_tracks) bytes are always enough
+    - ticks_per_quarter: time resolution of the file
+    - metrics: optional RenderMetrics, records the sort and serialize stages
+
+    Sorting and encoding run over whole NumPy columns. Returns the MIDI file
+    as bytes, or the number of bytes written when a buffer was given.
+    """
+    notes = NoteBuffer.from_notes(notes)
+    return _serialize(notes.columns(), num_tracks, tempo, ticks_per_quarter, buffer, metrics)
+
+
+def _vlq(value):
+    # Variable-length quantity для delta-time
+    if value < 0x80:
+        return bytes((value,))
+    if value > _MAX_DELTA:
+        raise ValueError(f"delta-time {value} does not fit into a MIDI file")
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+class _TrackSpool:
+    """
+    One track chunk being written incrementally
+
+    Events are encoded as they arrive and spooled to a temporary file (kept
+    in memory while small). Only the note-offs of still sounding notes are
+    kept in memory, so memory does not grow with the length of the track.
+    """
+
+    def __init__(self, spool_size):
+        self.data = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self.pending_offs = []  # heap of (tick, channel << 7 | pitch, note id)
+        self.sounding = {}  # (channel << 7 | pitch) -> id of the sounding note
+        self.note_id = 0
+        self.last_tick = 0
+        self.running_status = -1
+
+    def _event(self, out, tick, key, velocity):
+        out += _vlq(tick - self.last_tick)
+        self.last_tick = tick
+        status = 0x90 | (key >> 7)
+        if status != self.running_status:
+            out.append(status)
+            self.running_status = status
+        out.append(key & 0x7F)
+        out.append(velocity)
+
+    def _flush_offs(self, out, before):
+        # Note-offs strictly before tick `before`, in (tick, channel, pitch) order
+        pending = self.pending_offs
+        sounding = self.sounding
+        while pending and pending[0][0] < before:
+            tick, key, note_id = heapq.heappop(pending)
+            # Нота, обрезанная повторной той же нотой, уже закрыта
+            if sounding.get(key) == note_id:
+                del sounding[key]
+                self._event(out, tick, key, 0)
+
+    def _add_tick(self, out, tick, group):
+        # group: {key: (length, velocity)} of notes starting at this tick
+        self._flush_offs(out, tick)
+
+        # Все note off в этом тике (закончившиеся и обрезанные повторной
+        # нотой) идут раньше note on, в порядке (channel, pitch)
+        pending = self.pending_offs
+        sounding = self.sounding
+        offs = {key for key in group if key in sounding}
+        while pending and pending[0][0] == tick:
+            _, key, note_id = heapq.heappop(pending)
+            if sounding.get(key) == note_id:
+                offs.add(key)
+        for key in sorted(offs):
+            del sounding[key]
+            self._event(out, tick, key, 0)
+
+        for key in sorted(group):
+            length, velocity = group[key]
+            self.note_id += 1
+            sounding[key] = self.note_id
+            self._event(out, tick, key, velocity)
+            heapq.heappush(pending, (tick + length, key, self.note_id))
+
+    def add_notes(self, notes):
+        # notes: (channel, pitch, start, length, velocity), sorted by start
+        out = bytearray()
+        group_tick = None
+        group = {}
+        for channel, pitch, start, length, velocity in notes:
+            if start < self.last_tick:
+                raise ValueError("streamed notes must not start before notes of earlier bars")
+            if start != group_tick:
+                if group:
+                    self._add_tick(out, group_tick, group)
+                group_tick = start
+                group = {}
+            # Одинаковые ноты в одном тике: остается последняя
+            group.pop((channel << 7) | pitch, None)
+            if length > 0:
+                group[(channel << 7) | pitch] = (length, velocity)
+        if group:
+            self._add_tick(out, group_tick, group)
+        self.data.write(out)
+
+    def finish(self):
+        out = bytearray()
+        self._flush_offs(out, float("inf"))
+        out += b"\x00\xff\x2f\x00"
+        self.data.write(out)
+        return self.data.tell()
+
+
+def write_midi_stream(output_file, bars, num_tracks, tempo,
+                      ticks_per_quarter=TICKS_PER_QUARTER, spool_size=1 << 20, metrics=None):
+    """
+    Write a MIDI file from a stream of bars without keeping all notes in memory
+
+    Parameters:
+    - output_file: path or binary file-like object
+    - bars: iterable of note lists, one list per bar (see iter_random_midi_bars);
+      notes are (track, channel, pitch, start, length, velocity) with
+      absolute start times in ticks, a bar must not start before the
+      previous one
+    - num_tracks: number of note tracks
+    - tempo: beats per minute
+    - ticks_per_quarter: time resolution of the file
+    - spool_size: per track, encoded events are kept in memory up to this
+      many bytes and spooled to a temporary file after that
+    - metrics: optional RenderMetrics, records copying the spools to the
+      output as the write stage
+
+    Track chunks are encoded bar by bar into per-track spools and copied to
+    the output at the end. Returns the number of bytes written.
+    """
+    spools = [_TrackSpool(spool_size) for _ in range(num_tracks)]
+    try:
+        for bar in bars:
+            by_track = [[] for _ in range(num_tracks)]
+            for track, channel, pitch, start, length, velocity in bar:
+                if not 0 <= track < num_tracks:
+                    raise ValueError(f"note on track {track}, but the file has {num_tracks} tracks")
+                by_track[track].append((channel, pitch, start, length, velocity))
+            for spool, track_notes in zip(spools, by_track):
+                if track_notes:
+                    track_notes.sort(key=lambda note: (note[2], note[0], note[1]))
+                    spool.add_notes(track_notes)
+
+        sizes = [spool.finish() for spool in spools]
+
+        fixed = _header_and_tempo(num_tracks, tempo, ticks_per_quarter)
+
+        with stage(metrics, "write"):
+            if hasattr(output_file, "write"):
+                out = output_file
+            else:
+                out = open(output_file, "wb")
+            try:
+                out.write(fixed)
+                for spool, size in zip(spools, sizes):
+                    out.write(b"MTrk" + struct.pack(">I", size))
+                    spool.data.seek(0)
+                    shutil.copyfileobj(spool.data, out)
+            finally:
+                if out is not output_file:
+                    out.close()
+    finally:
+        for spool in spools:
+            spool.data.close()
+
+    return len(fixed) + sum(8 + size for size in sizes)
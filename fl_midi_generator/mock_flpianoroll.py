@@ -0,0 +1,93 @@
+"""
+Headless stand-in for FL Studio's flpianoroll module.
+
+Implements the part of the piano roll scripting API used by
+fl_studio_midi_generator.py and records every call, so the FL Studio
+script can be run, tested and benchmarked on any machine:
+
+    from fl_midi_generator import mock_flpianoroll
+    score = mock_flpianoroll.install(ppq=96, add_note_delay=20e-6)
+    import fl_studio_midi_generator
+    fl_studio_midi_generator.generate_fl_studio_pattern("Test")
+    print(len(score.notes), score.add_note_calls)
+
+add_note_delay makes every addNote call busy-wait for that many seconds,
+as a rough model of the cost of a note insertion inside FL Studio.
+"""
+
+import sys
+import time
+
+
+class Score:
+    """
+    Recording piano roll score
+
+    Parameters:
+    - ppq: value returned by PPQ() (FL Studio default: 96)
+    - add_note_delay: seconds every addNote call takes
+    """
+
+    def __init__(self, ppq=96, add_note_delay=0.0):
+        self.ppq = ppq
+        self.add_note_delay = add_note_delay
+        self.active_channel = 0
+        self.clear()
+
+    def clear(self):
+        """
+        Forget all patterns, notes and call counters
+        """
+        self.patterns = []
+        self.selected = None
+        self.notes = []  # (pattern, time, length, note, velocity, channel)
+        self.add_note_calls = 0
+
+    def PPQ(self):
+        return self.ppq
+
+    def createPattern(self, name):
+        self.patterns.append(name)
+        return len(self.patterns) - 1
+
+    def selectPattern(self, pattern):
+        if not 0 <= pattern < len(self.patterns):
+            raise ValueError(f"no pattern {pattern}")
+        self.selected = pattern
+
+    def getActiveChannel(self):
+        return self.active_channel
+
+    def addNote(self, time=0, length=0, note=60, velocity=100, channel=0):
+        if self.selected is None:
+            raise RuntimeError("no pattern selected")
+        if self.add_note_delay:
+            # Активное ожидание: sleep слишком груб для микросекунд
+            until = _perf_counter() + self.add_note_delay
+            while _perf_counter() < until:
+                pass
+        self.add_note_calls += 1
+        self.notes.append((self.selected, time, length, note, velocity, channel))
+
+
+_perf_counter = time.perf_counter
+
+score = Score()
+
+
+def install(ppq=96, add_note_delay=0.0):
+    """
+    Register this module as flpianoroll with a fresh score and return the score
+    """
+    global score
+    score = Score(ppq, add_note_delay)
+    sys.modules["flpianoroll"] = sys.modules[__name__]
+    return score
+
+
+def uninstall():
+    """
+    Remove the mock from sys.modules (only if it is installed)
+    """
+    if sys.modules.get("flpianoroll") is sys.modules[__name__]:
+        del sys.modules["flpianoroll"]
@@ -0,0 +1,145 @@
+"""
+Compact array-backed note store.
+
+Notes are kept as a struct of arrays: one typed `array` column per field
+instead of a Python object (or tuple) per note. Appending is cheap, and
+sorting and serialization work on whole columns at once through zero-copy
+NumPy views (see midi_writer.write_midi).
+"""
+
+from array import array
+
+# Поля ноты и их типы: (имя, код типа array, тип numpy).
+# numpy импортируется в методах - только когда нужны операции над колонками
+NOTE_FIELDS = (
+    ("track", "B", "u1"),
+    ("channel", "B", "u1"),
+    ("pitch", "B", "u1"),
+    ("start", "q", "i8"),  # тики
+    ("length", "q", "i8"),  # тики
+    ("velocity", "B", "u1"),
+)
+
+
+class NoteBuffer:
+    """
+    Struct-of-arrays note store
+
+    Notes have the same fields as the note tuples used everywhere else:
+    (track, channel, pitch, start, length, velocity), times in ticks.
+    Iterating yields those tuples, so a NoteBuffer can be used wherever a
+    list of notes is expected.
+    """
+
+    __slots__ = ("track", "channel", "pitch", "start", "length", "velocity")
+
+    def __init__(self, notes=None):
+        for name, typecode, _ in NOTE_FIELDS:
+            setattr(self, name, array(typecode))
+        if notes is not None:
+            self.extend(notes)
+
+    @classmethod
+    def from_notes(cls, notes):
+        """
+        Return notes as a NoteBuffer (a NoteBuffer is returned unchanged)
+        """
+        if isinstance(notes, cls):
+            return notes
+        return cls(notes)
+
+    def add(self, track, channel, pitch, start, length, velocity):
+        # Same argument order as MIDIFile.addNote
+        self.track.append(track)
+        self.channel.append(channel)
+        self.pitch.append(pitch)
+        self.start.append(start)
+        self.length.append(length)
+        self.velocity.append(velocity)
+
+    def extend(self, notes):
+        """
+        Append note tuples (or another NoteBuffer)
+        """
+        if isinstance(notes, NoteBuffer):
+            for name, _, _ in NOTE_FIELDS:
+                getattr(self, name).extend(getattr(notes, name))
+            return
+        if not isinstance(notes, (list, tuple)):
+            notes = list(notes)
+        if not notes:
+            return
+        # Транспонируем кортежи в колонки одним проходом
+        for (name, typecode, _), values in zip(NOTE_FIELDS, zip(*notes)):
+            getattr(self, name).extend(values)
+
+    def extend_columns(self, track, channel, pitch, start, length, velocity):
+        """
+        Append many notes given as columns (arrays, sequences or scalars)
+
+        Scalars are repeated for every note; all columns are broadcast to
+        the same length.
+        """
+        import numpy as np
+
+        columns = np.broadcast_arrays(*(np.asarray(c) for c in (track, channel, pitch, start, length, velocity)))
+        for (name, _, dtype), values in zip(NOTE_FIELDS, columns):
+            getattr(self, name).frombytes(memoryview(np.ascontiguousarray(values, dtype=dtype)).cast("B"))
+
+    def columns(self):
+        """
+        Zero-copy NumPy views of the columns, as a dict keyed by field name
+
+        The columns cannot grow while views exist, drop them before
+        appending more notes.
+        """
+        import numpy as np
+
+        return {name: np.frombuffer(getattr(self, name), dtype=dtype)
+                for name, _, dtype in NOTE_FIELDS}
+
+    def sorted(self):
+        """
+        Return a new NoteBuffer sorted by (track, start, pitch)
+        """
+        import numpy as np
+
+        cols = self.columns()
+        order = np.lexsort((cols["pitch"], cols["start"], cols["track"]))
+        result = NoteBuffer()
+        result.extend_columns(*(cols[name][order] for name, _, _ in NOTE_FIELDS))
+        return result
+
+    def select_tracks(self, tracks):
+        """
+        Return a new NoteBuffer with only the given tracks
+
+        Parameters:
+        - tracks: track indexes to keep; in the result they are renumbered
+          0, 1, 2, ... in this order
+        """
+        import numpy as np
+
+        cols = self.columns()
+        new_track = np.full(256, 255, dtype=np.uint8)
+        new_track[list(tracks)] = np.arange(len(tracks), dtype=np.uint8)
+        mapped = new_track[cols["track"]]
+        keep = mapped != 255
+        result = NoteBuffer()
+        result.extend_columns(mapped[keep], *(cols[name][keep] for name, _, _ in NOTE_FIELDS[1:]))
+        return result
+
+    @property
+    def nbytes(self):
+        # Память, занятая колонками
+        return sum(getattr(self, name).itemsize * len(getattr(self, name))
+                   for name, _, _ in NOTE_FIELDS)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __iter__(self):
+        return zip(self.track, self.channel, self.pitch, self.start, self.length, self.velocity)
+
+    def __repr__(self):
+        return f"NoteBuffer({len(self)} notes)"
@@ -0,0 +1,290 @@
+"""
+Offline audio previews of generated beats.
+
+Renders notes into a mono WAV file without FL Studio, so a batch of beats
+can be auditioned (or curated) straight from disk. Drums are one-shot
+samples: a built-in set synthesized on first use (kick, snare, hihat), or
+WAV files from a directory (load_one_shots). Bass and melody are simple
+decaying oscillators.
+
+Nothing is mixed sample by sample in Python. Every hit of a one-shot
+becomes a row of sample indices (start + 0..len-1) with the one-shot
+scaled by the velocity, every note becomes the span of samples it sounds,
+and all of them are summed into the output with one np.bincount per
+block. A 4 bar beat renders a few hundred times faster than real time.
+
+    preview_hiphop_beat("beat.wav", duration=4, tempo=90, seed=7)
+    audio = render_midi(read_midi("loop.mid"))
+    write_wav("loop.wav", audio)
+"""
+
+import io
+import os
+import random
+import wave
+from functools import lru_cache
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import DRUM_CHANNEL, DRUM_COMPONENTS
+from fl_midi_generator.midi_generator import (
+    BASS_CHANNEL, TICKS_PER_BAR, TICKS_PER_QUARTER, _normalize_components, iter_hiphop_beat_bars,
+)
+from fl_midi_generator.midi_reader import GM_DRUMS
+from fl_midi_generator.note_buffer import NoteBuffer
+
+SAMPLE_RATE = 22050  # для прослушивания хватает, вдвое быстрее 44100
+PEAK = 0.89  # нормализация до -1 dBFS
+BLOCK_SAMPLES = 1 << 20  # индексов в одном bincount
+
+# Громкость голосов в миксе
+VOICE_GAINS = {"kick": 1.0, "snare": 0.8, "hihat": 0.3, "bass": 0.55, "melody": 0.25}
+
+# Осцилляторы: (уровень второй гармоники, затухание в 1/с)
+TONE_VOICES = {"bass": (0.5, 1.5), "melody": (0.3, 5.0)}
+ATTACK = 0.005  # секунды
+RELEASE = 0.03
+
+
+def _note_voice(channel, pitch):
+    # Голос ноты без указания компонентов: по каналу и номеру ноты
+    if channel == DRUM_CHANNEL:
+        return GM_DRUMS.get(pitch)
+    return "bass" if channel == BASS_CHANNEL else "melody"
+
+
+@lru_cache(maxsize=8)
+def _synth_one_shots(sample_rate):
+    rng = np.random.default_rng(0)  # один и тот же набор при каждом запуске
+
+    def seconds(length):
+        return np.arange(int(length * sample_rate)) / sample_rate
+
+    t = seconds(0.45)
+    sweep = 45 + 110 * np.exp(-t * 35)  # частота бочки падает до 45 Гц
+    kick = np.sin(2 * np.pi * np.cumsum(sweep) / sample_rate) * np.exp(-t * 7)
+
+    t = seconds(0.22)
+    snare = (0.7 * rng.standard_normal(len(t)) * np.exp(-t * 18)
+             + 0.5 * np.sin(2 * np.pi * 185 * t) * np.exp(-t * 25))
+
+    t = seconds(0.08)
+    noise = rng.standard_normal(len(t) + 1)
+    hihat = 0.6 * np.diff(noise) * np.exp(-t * 55)  # разность - простой фильтр высоких
+
+    shots = {"kick": kick, "snare": snare, "hihat": hihat}
+    return {name: (shot / np.abs(shot).max()).astype(np.float32) for name, shot in shots.items()}
+
+
+def read_wav(path):
+    """
+    Read a PCM WAV file (8/16/24/32 bit) as (mono float32 samples, sample rate)
+    """
+    with wave.open(path, "rb") as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        raw = np.frombuffer(f.readframes(f.getnframes()), dtype=np.uint8)
+    if width == 1:
+        samples = (raw.astype(np.float32) - 128) / 128
+    elif width == 3:
+        # 24 бита: дополняем до int32 младшим нулевым байтом
+        padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = raw.reshape(-1, 3)
+        samples = padded.view("<i4")[:, 0].astype(np.float32) / 2 ** 31
+    elif width in (2, 4):
+        samples = np.frombuffer(raw, dtype=f"<i{width}").astype(np.float32) / 2 ** (8 * width - 1)
+    else:
+        raise ValueError(f"{path}: unsupported sample width {width}")
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def load_one_shots(directory=None, sample_rate=SAMPLE_RATE):
+    """
+    One-shot samples for the drum components
+
+    Parameters:
+    - directory: folder with kick.wav, snare.wav and hihat.wav; missing
+      files (or directory=None) use the built-in synthesized one-shots
+    - sample_rate: rate to resample the files to
+
+    Returns a dict component -> float32 samples.
+    """
+    shots = dict(_synth_one_shots(sample_rate))
+    if directory is None:
+        return shots
+    for name in DRUM_COMPONENTS:
+        path = os.path.join(directory, f"{name}.wav")
+        if not os.path.exists(path):
+            continue
+        samples, rate = read_wav(path)
+        if rate != sample_rate:
+            positions = np.arange(int(len(samples) * sample_rate / rate)) * (rate / sample_rate)
+            samples = np.interp(positions, np.arange(len(samples)), samples)
+        shots[name] = samples.astype(np.float32)
+    return shots
+
+
+def _mix(out, index, weight):
+    # Сумма weight по индексам одним bincount в окне [первый, последний]
+    inside = index < len(out)
+    if not inside.all():
+        index, weight = index[inside], weight[inside]
+    if not len(index):
+        return
+    low = int(index.min())
+    out[low:low + int(index.max()) - low + 1] += np.bincount(index - low, weights=weight)
+
+
+def _place_one_shot(out, starts, gains, shot):
+    # Все удары одного сэмпла: строка индексов start + 0..len-1 на удар
+    offsets = np.arange(len(shot))
+    per_block = max(1, BLOCK_SAMPLES // len(shot))
+    for i in range(0, len(starts), per_block):
+        block = slice(i, i + per_block)
+        _mix(out, (starts[block, np.newaxis] + offsets).ravel(),
+             (gains[block, np.newaxis] * shot).ravel())
+
+
+def _place_tones(out, starts, lengths, pitches, gains, voice, sample_rate):
+    # Каждая нота звучит length сэмплов плюс затухание RELEASE
+    harmonic, decay = TONE_VOICES[voice]
+    attack = max(1, int(ATTACK * sample_rate))
+    release = max(1, int(RELEASE * sample_rate))
+    spans = lengths + release
+    frequencies = 440.0 * 2.0 ** ((pitches - 69) / 12)
+    ends = np.cumsum(spans)
+    first = 0
+    while first < len(starts):
+        last = max(first + 1, int(np.searchsorted(ends, ends[first] - spans[first] + BLOCK_SAMPLES)))
+        block = slice(first, last)
+        note = np.repeat(np.arange(last - first), spans[block])
+        t = np.arange(len(note)) - np.repeat(ends[block] - spans[block] - (ends[first] - spans[first]),
+                                             spans[block])
+        phase = (2 * np.pi / sample_rate) * frequencies[block][note] * t
+        envelope = (np.minimum(t / attack, 1.0) * np.exp(t * (-decay / sample_rate))
+                    * np.clip((spans[block][note] - t) / release, 0.0, 1.0))
+        signal = (np.sin(phase) + harmonic * np.sin(2 * phase)) * envelope * gains[block][note]
+        _mix(out, starts[block][note] + t, signal)
+        first = last
+
+
+def render_notes(notes, tempo, voices=None, ticks_per_quarter=TICKS_PER_QUARTER, sample_rate=SAMPLE_RATE,
+                 one_shots=None, length=None, normalize=True):
+    """
+    Render notes to mono audio
+
+    Parameters:
+    - notes: note tuples or a NoteBuffer (track, channel, pitch, start,
+      length, velocity), times in ticks
+    - tempo: beats per minute
+    - voices: dict track -> voice ("kick", "snare", "hihat", "bass",
+      "melody"); None = by channel: GM drum map on the drum channel, bass
+      on BASS_CHANNEL, melody otherwise. Notes without a voice are silent.
+    - ticks_per_quarter: time division of the note times
+    - sample_rate: output sample rate
+    - one_shots: dict drum component -> samples (default: load_one_shots())
+    - length: output length in ticks (default: until the last sound ends)
+    - normalize: scale the peak to PEAK (otherwise hard clip at +-1)
+
+    Returns a float32 array of samples in -1..1.
+    """
+    if one_shots is None:
+        one_shots = load_one_shots(sample_rate=sample_rate)
+    cols = NoteBuffer.from_notes(notes).columns()
+    samples_per_tick = sample_rate * 60.0 / (tempo * ticks_per_quarter)
+    starts = np.rint(cols["start"] * samples_per_tick).astype(np.int64)
+    lengths = np.maximum(np.rint(cols["length"] * samples_per_tick).astype(np.int64), 1)
+    gains = cols["velocity"] / 127.0
+
+    # Голос каждой ноты: номер в VOICE_GAINS, -1 = не звучит
+    names = list(VOICE_GAINS)
+    if voices is not None:
+        lookup = np.full(256, -1, dtype=np.int64)
+        for track, voice in voices.items():
+            if voice in VOICE_GAINS:
+                lookup[track] = names.index(voice)
+        voice_of = lookup[cols["track"]]
+    else:
+        lookup = np.array([[names.index(_note_voice(channel, pitch)) if _note_voice(channel, pitch) else -1
+                            for pitch in range(128)] for channel in range(16)], dtype=np.int64)
+        voice_of = lookup[cols["channel"] & 0x0F, cols["pitch"] & 0x7F]
+
+    if length is not None:
+        total = int(round(length * samples_per_tick))
+    elif len(starts):
+        tail = max([len(shot) for shot in one_shots.values()] + [int(RELEASE * sample_rate)])
+        total = int((starts + lengths).max()) + tail
+    else:
+        total = 0
+    out = np.zeros(total, dtype=np.float64)
+
+    for number, voice in enumerate(names):
+        mine = np.flatnonzero(voice_of == number)
+        if not len(mine):
+            continue
+        gain = gains[mine] * VOICE_GAINS[voice]
+        if voice in TONE_VOICES:
+            _place_tones(out, starts[mine], lengths[mine], cols["pitch"][mine].astype(np.float64), gain,
+                         voice, sample_rate)
+        elif voice in one_shots:
+            _place_one_shot(out, starts[mine], gain, one_shots[voice])
+
+    peak = np.abs(out).max() if total else 0.0
+    if normalize and peak > 0:
+        out *= PEAK / peak
+    return np.clip(out, -1.0, 1.0).astype(np.float32)
+
+
+def render_midi(midi, components=None, **options):
+    """
+    Render a MidiData (see midi_reader) at its initial tempo
+
+    Parameters:
+    - midi: MidiData
+    - components: component name per note track, as given to
+      generate_hiphop_beat (needed for files from this generator, whose
+      drums share one note); None = voices by channel
+    - options: sample_rate, one_shots, normalize (see render_notes)
+    """
+    voices = midi.track_components(components) if components is not None else None
+    return render_notes(midi.notes, midi.tempo, voices, midi.ticks_per_quarter, **options)
+
+
+def write_wav(output_file, audio, sample_rate=SAMPLE_RATE):
+    """
+    Write mono samples in -1..1 as a 16 bit WAV file
+
+    Parameters:
+    - output_file: path, binary file-like object, or None to return the
+      WAV file as bytes
+    - audio: float samples
+    - sample_rate: sample rate of the samples
+    """
+    pcm = np.rint(np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    target = io.BytesIO() if output_file is None else output_file
+    with wave.open(target, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    if output_file is None:
+        return target.getvalue()
+    return None
+
+
+def preview_hiphop_beat(output_file="hiphop_beat.wav", duration=4, tempo=90, scale=None, components=None,
+                        seed=None, drums=None, sample_rate=SAMPLE_RATE, one_shots=None):
+    """
+    Render the beat generate_hiphop_beat would write to a WAV preview
+
+    The same parameters and seed give the same beat as the MIDI file. The
+    preview is exactly duration bars long, so it loops cleanly. Returns
+    the WAV bytes if output_file is None, else None.
+    """
+    components = _normalize_components(components)
+    rng = random.Random(seed) if seed is not None else random
+    notes = NoteBuffer()
+    for bar in iter_hiphop_beat_bars(duration, scale, components, rng, drums):
+        notes.extend(bar)
+    audio = render_notes(notes, tempo, dict(enumerate(components)), sample_rate=sample_rate,
+                         one_shots=one_shots, length=duration * TICKS_PER_BAR)
+    return write_wav(output_file, audio, sample_rate)
@@ -0,0 +1,379 @@
+"""
+Real-time MIDI streaming: jam with the generator instead of writing files.
+
+A LivePlayer plays an endless (or finite) stream of bars. A background
+asyncio task generates bars a little ahead of the playhead, and a
+scheduler task sends every note on / note off at its time to a sink:
+
+- MemorySink: keeps the messages with their due and send times (tests);
+- UDPSink: raw MIDI bytes or OSC /midi messages over UDP;
+- MidoSink: a (virtual) MIDI port through mido, optional
+  (pip install mido python-rtmidi).
+
+Low jitter comes from three things:
+
+- the scheduler sleeps with asyncio until SPIN seconds before an event,
+  then busy-waits on time.perf_counter for the rest, so the coarse sleep
+  timer and event loop wake-up delays are absorbed;
+- generation runs in the same event loop, only while the scheduler
+  sleeps and only if the next event is at least GENERATE_SLACK away, so
+  it never competes with sending (no thread, no GIL hand-over);
+- the garbage collector is paused while playing and collected in the
+  same idle windows, and the interpreter's thread switch interval is
+  lowered, so other Python threads hand the GIL back quickly.
+
+Every send is measured against its due time; stats() reports the
+jitter percentiles.
+
+    player = LivePlayer(hiphop_bar_stream(seed=7), UDPSink("127.0.0.1", 9000), tempo=92)
+    asyncio.run(player.play(seconds=60))
+    print(player.stats())
+"""
+
+import asyncio
+import gc
+import heapq
+import random
+import socket
+import sys
+import time
+from array import array
+
+from fl_midi_generator.midi_generator import (
+    HIPHOP_LOOP_BARS, TICKS_PER_BAR, TICKS_PER_QUARTER, _normalize_components, iter_hiphop_beat_bars,
+)
+from fl_midi_generator.server import percentile
+
+LOOKAHEAD_BARS = 2  # такты, сгенерированные впереди позиции воспроизведения
+SPIN = 0.002  # последние 2 мс до события - активное ожидание
+GENERATE_SLACK = 0.010  # генерация только если до события не меньше 10 мс
+START_DELAY = 0.1  # запас перед первым событием
+SWITCH_INTERVAL = 0.0002  # другие потоки держат GIL не дольше 0.2 мс
+OFF, ON = 0, 1
+
+
+def hiphop_bar_stream(scale=None, components=None, seed=None, repeats=4):
+    """
+    Endless hip-hop bars: a new loop every HIPHOP_LOOP_BARS * repeats bars
+
+    Same bar format as iter_hiphop_beat_bars (absolute ticks, counting
+    from the first bar of the stream).
+    """
+    components = _normalize_components(components)
+    rng = random.Random(seed) if seed is not None else random
+    offset = 0
+    while True:
+        for bar in iter_hiphop_beat_bars(HIPHOP_LOOP_BARS * repeats, scale, components, rng):
+            yield [(track, channel, pitch, start + offset, length, velocity)
+                   for track, channel, pitch, start, length, velocity in bar]
+        offset += HIPHOP_LOOP_BARS * repeats * TICKS_PER_BAR
+
+
+class MemorySink:
+    """
+    Sink that records every message as (due time, send time, bytes),
+    times in seconds from the start of playback
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, messages, due, sent):
+        for message in messages:
+            self.messages.append((due, sent, message))
+
+    def close(self):
+        pass
+
+
+class UDPSink:
+    """
+    Sink that sends every message as a UDP datagram
+
+    Parameters:
+    - host, port: receiver address
+    - osc: send OSC messages "/midi" with one MIDI argument (type tag m)
+      instead of raw MIDI bytes
+    - address: OSC address pattern
+    """
+
+    def __init__(self, host="127.0.0.1", port=9000, osc=False, address="/midi"):
+        self.target = (host, port)
+        self.osc = osc
+        # Адрес OSC дополняется нулями до кратного 4, за ним тег типов ",m"
+        padded = address.encode("ascii") + b"\0"
+        self._osc_prefix = padded + b"\0" * (-len(padded) % 4) + b",m\0\0"
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def send(self, messages, due, sent):
+        for message in messages:
+            if self.osc:
+                # Аргумент MIDI в OSC: порт, статус, данные 1, данные 2
+                message = self._osc_prefix + b"\0" + message[:3].ljust(3, b"\0")
+            try:
+                self.socket.sendto(message, self.target)
+            except (BlockingIOError, ConnectionRefusedError):
+                pass  # живой поток: пропущенный пакет лучше задержки
+
+    def close(self):
+        self.socket.close()
+
+
+class MidoSink:
+    """
+    Sink that sends to a MIDI output port through mido
+
+    Parameters:
+    - name: output port name; with virtual=True the name of the new
+      virtual port (default "FL MIDI Generator")
+    - virtual: create a virtual port other programs (FL Studio, a DAW) can
+      connect to (not supported on Windows)
+
+    Needs mido and a backend: pip install mido python-rtmidi
+    """
+
+    def __init__(self, name=None, virtual=True):
+        try:
+            import mido
+
+            # Бэкенд (rtmidi) загружается только при открытии порта
+            if virtual:
+                self.port = mido.open_output(name or "FL MIDI Generator", virtual=True)
+            else:
+                self.port = mido.open_output(name)
+        except ImportError as e:
+            raise ImportError("MidoSink needs mido and a backend: pip install mido python-rtmidi") from e
+        self._message = mido.Message.from_bytes
+
+    def send(self, messages, due, sent):
+        for message in messages:
+            self.port.send(self._message(message))
+
+    def close(self):
+        self.port.close()
+
+
+class LivePlayer:
+    """
+    Plays bars of notes in real time into a sink
+
+    Parameters:
+    - bars: iterable of bars (lists of (track, channel, pitch, start,
+      length, velocity), absolute ticks), e.g. hiphop_bar_stream(),
+      iter_random_midi_bars() or Arrangement.iter_bars()
+    - sink: object with send(messages, due, sent) and close(); messages is
+      a list of MIDI messages (bytes) due at the same time
+    - tempo: beats per minute
+    - lookahead: bars generated ahead of the playhead
+    - ticks_per_quarter: time division of the bars
+
+    A note that starts while the same pitch still sounds ends first, like
+    in midi_writer.
+    """
+
+    def __init__(self, bars, sink, tempo=90, lookahead=LOOKAHEAD_BARS, ticks_per_quarter=TICKS_PER_QUARTER):
+        self.bars = iter(bars)
+        self.sink = sink
+        self.tempo = tempo
+        self.lookahead = lookahead
+        self.seconds_per_tick = 60.0 / (tempo * ticks_per_quarter)
+        self.ticks_per_bar = 4 * ticks_per_quarter
+        self._events = []  # куча (тик, OFF/ON, номер, канал << 7 | нота, громкость)
+        self._sequence = 0
+        self._sounding = {}  # канал << 7 | нота -> номер звучащей ноты
+        self._generated_bars = 0
+        self._exhausted = False
+        self._stopped = False
+        self._next_due = None
+        self.jitter = array("d")  # send - due, секунды
+
+    def _push_bar(self, bar):
+        for track, channel, pitch, start, length, velocity in bar:
+            if length <= 0:
+                continue
+            key = (channel << 7) | pitch
+            self._sequence += 1
+            heapq.heappush(self._events, (start, ON, self._sequence, key, velocity))
+            heapq.heappush(self._events, (start + length, OFF, self._sequence, key, 0))
+        self._generated_bars += 1
+
+    def _generate(self):
+        bar = next(self.bars, None)
+        if bar is None:
+            self._exhausted = True
+        else:
+            self._push_bar(bar)
+
+    def _pop_due(self):
+        # Все сообщения ближайшего тика (note off раньше note on)
+        tick = self._events[0][0]
+        messages = []
+        sounding = self._sounding
+        while self._events and self._events[0][0] == tick:
+            _, kind, note, key, velocity = heapq.heappop(self._events)
+            status, pitch = key >> 7, key & 0x7F
+            if kind == OFF:
+                # Нота, уже обрезанная повторной той же нотой, не закрывается
+                if sounding.get(key) == note:
+                    del sounding[key]
+                    messages.append(bytes((0x80 | status, pitch, 0)))
+            else:
+                if key in sounding:
+                    messages.append(bytes((0x80 | status, pitch, 0)))
+                sounding[key] = note
+                messages.append(bytes((0x90 | status, pitch, velocity)))
+        return tick, messages
+
+    def _playhead_bar(self, now):
+        return int((now - self._started) / (self.seconds_per_tick * self.ticks_per_bar))
+
+    async def _producer(self):
+        # Фоновая генерация: только пока планировщик спит и до события далеко
+        while not self._stopped and not self._exhausted:
+            now = time.perf_counter()
+            ahead = self._generated_bars - self._playhead_bar(now)
+            if ahead > self.lookahead:
+                await asyncio.sleep(self.seconds_per_tick * self.ticks_per_bar / 4)
+                continue
+            if self._next_due is not None and self._next_due - now < GENERATE_SLACK:
+                await asyncio.sleep(max(self._next_due - now, 0) + 0.001)
+                continue
+            self._generate()
+            gc.collect(0)
+            await asyncio.sleep(0)
+
+    async def play(self, seconds=None, bars=None):
+        """
+        Play until the bars run out, stop() is called, or a limit is reached
+
+        Parameters:
+        - seconds: stop after this much playing time
+        - bars: stop after this many bars
+        """
+        while self._generated_bars < self.lookahead and not self._exhausted:
+            self._generate()
+        self._started = time.perf_counter() + START_DELAY
+        end_tick = bars * self.ticks_per_bar if bars is not None else None
+        end_time = self._started + seconds if seconds is not None else None
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, SWITCH_INTERVAL))
+        producer = asyncio.create_task(self._producer())
+        try:
+            while not self._stopped:
+                if not self._events:
+                    if self._exhausted:
+                        break
+                    await asyncio.sleep(0.001)
+                    continue
+                tick = self._events[0][0]
+                if end_tick is not None and tick >= end_tick:
+                    break
+                due = self._started + tick * self.seconds_per_tick
+                if end_time is not None and due > end_time:
+                    break
+                self._next_due = due
+                wait = due - time.perf_counter()
+                if wait > SPIN:
+                    await asyncio.sleep(wait - SPIN)
+                while time.perf_counter() < due:
+                    pass
+                _, messages = self._pop_due()
+                sent = time.perf_counter()
+                if messages:
+                    self.sink.send(messages, due - self._started, sent - self._started)
+                    self.jitter.append(sent - due)
+        finally:
+            # И при отмене задачи (Ctrl+C): ни одна нота не должна зависнуть
+            self._send_all_off()
+            self._stopped = True
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+            sys.setswitchinterval(switch_interval)
+            if gc_enabled:
+                gc.enable()
+
+    def _send_all_off(self):
+        messages = [bytes((0x80 | (key >> 7), key & 0x7F, 0)) for key in sorted(self._sounding)]
+        self._sounding.clear()
+        if messages:
+            now = time.perf_counter() - self._started
+            self.sink.send(messages, now, now)
+
+    def stop(self):
+        """
+        Stop playing (sounding notes get a note off)
+        """
+        self._stopped = True
+
+    def stats(self):
+        """
+        Timing jitter of the sent events: dict with count and mean, p50,
+        p99 and max of |send time - due time| in milliseconds
+        """
+        values = sorted(abs(value) * 1000 for value in self.jitter)
+        return {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values) if values else 0.0,
+            "p50_ms": percentile(values, 0.50),
+            "p99_ms": percentile(values, 0.99),
+            "max_ms": values[-1] if values else 0.0,
+        }
+
+
+def play(bars, sink, tempo=90, seconds=None, player=None, **options):
+    """
+    Play bars into a sink, blocking until done; returns the jitter stats
+
+    Parameters:
+    - player: optional LivePlayer to use instead of a new one (its bars,
+      sink and tempo are used), e.g. to read its stats() after Ctrl+C
+    """
+    player = player or LivePlayer(bars, sink, tempo, **options)
+    try:
+        asyncio.run(player.play(seconds))
+    finally:
+        player.sink.close()
+    return player.stats()
+
+
+def _print_stats(stats):
+    print(f"{stats['count']} events, jitter p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, "
+          f"max {stats['max_ms']:.3f} ms")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m fl_midi_generator.realtime",
+                                     description="Stream generated hip-hop bars live")
+    parser.add_argument("--tempo", type=float, default=90)
+    parser.add_argument("--seconds", type=float, help="stop after this many seconds (default: run until Ctrl+C)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--udp", metavar="HOST:PORT", help="send raw MIDI over UDP")
+    parser.add_argument("--osc", metavar="HOST:PORT", help="send OSC /midi messages over UDP")
+    parser.add_argument("--port", metavar="NAME", help="MIDI output port (mido); default: a virtual port")
+    args = parser.parse_args(argv)
+
+    if args.udp or args.osc:
+        host, port = (args.udp or args.osc).rsplit(":", 1)
+        sink = UDPSink(host, int(port), osc=bool(args.osc))
+    else:
+        sink = MidoSink(args.port, virtual=args.port is None)
+    print(f"Streaming at {args.tempo:g} BPM, Ctrl+C to stop")
+    player = LivePlayer(hiphop_bar_stream(seed=args.seed), sink, args.tempo)
+    try:
+        play(None, None, seconds=args.seconds, player=player)
+    except KeyboardInterrupt:
+        pass
+    _print_stats(player.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
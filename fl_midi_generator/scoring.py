@@ -0,0 +1,265 @@
+"""
+Musicality scores for whole batches of generated patterns.
+
+Candidates are collected into a CandidateBatch: the notes of all of them
+in one set of columns, with the candidate number of every note. Every
+metric is then a handful of array operations over the whole batch
+(per-candidate sums are np.bincount over the candidate numbers), so
+scoring 1000 candidates costs about as much as scoring a few.
+
+Metrics (raw values, per candidate):
+
+- scale: share of the pitched note time inside the scale
+- density: pitched notes per bar
+- syncopation: mean off-beat weight of all onsets (0 = all on beats,
+  0.5 = eighth off-beats, 1 = sixteenth off-beats)
+- smoothness: mean absolute interval between consecutive melody notes
+  of the same track (a second voice is a voice of its own, not a leap)
+- repetition: onset overlap (Jaccard) of every bar with the previous one
+- alignment: share of bass onsets that land on a kick
+
+Each metric is mapped to 0..1 (1 = best, against the targets below) and
+the weighted mean of the mapped metrics is the score. A metric that does
+not apply to a candidate (no bass, no melody) is left out of its mean.
+
+    batch = CandidateBatch()
+    for midi in candidates:
+        batch.add_midi(midi, bars=4, scale=[0, 3, 5, 7, 10], components=HIPHOP_COMPONENTS)
+    scores = score_batch(batch)
+    best = top_k(scores["score"], 10, groups=styles)
+"""
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import DRUM_CHANNEL
+from fl_midi_generator.midi_generator import BASS_CHANNEL, TICKS_PER_QUARTER
+from fl_midi_generator.midi_reader import GM_DRUMS
+from fl_midi_generator.note_buffer import NoteBuffer
+
+# Роли нот
+MELODY, BASS, KICK, SNARE, HIHAT = range(5)
+ROLES = {"melody": MELODY, "bass": BASS, "kick": KICK, "snare": SNARE, "hihat": HIHAT}
+NO_ROLE = -1
+
+METRICS = ("scale", "density", "syncopation", "smoothness", "repetition", "alignment")
+WEIGHTS = {"scale": 2.0, "density": 1.0, "syncopation": 1.0, "smoothness": 1.0, "repetition": 1.0,
+           "alignment": 1.5}
+
+DENSITY_RANGE = (3.0, 10.0)  # нот мелодии и баса в такте без штрафа
+SYNCOPATION_TARGET = 0.3
+SMOOTH_INTERVAL = 2  # поступенное движение - лучший результат
+ROUGH_INTERVAL = 12  # средний скачок в октаву - худший
+REPETITION_TARGET = 0.6
+REPETITION_BARS = 16  # повторяемость считается по первым тактам
+
+
+class CandidateBatch:
+    """
+    Notes of many candidates in one set of columns
+
+    Parameters:
+    - ticks_per_quarter: time division of the candidates' notes
+    """
+
+    def __init__(self, ticks_per_quarter=TICKS_PER_QUARTER):
+        self.ticks_per_quarter = ticks_per_quarter
+        self._columns = []  # (candidate, role, track, pitch, start, length)
+        self._bars = []
+        self._scales = []
+
+    def __len__(self):
+        return len(self._bars)
+
+    def add(self, notes, bars, scale=None, roles=None):
+        """
+        Add a candidate
+
+        Parameters:
+        - notes: note tuples or a NoteBuffer
+        - bars: length of the candidate in bars
+        - scale: scale intervals (pitch classes), None = C major
+        - roles: dict track -> component ("kick", "snare", "hihat", "bass",
+          "melody"); None = by channel (GM drums on the drum channel, bass
+          on BASS_CHANNEL, melody otherwise)
+
+        Returns the candidate number.
+        """
+        cols = NoteBuffer.from_notes(notes).columns()
+        if roles is not None:
+            lookup = np.full(256, NO_ROLE, dtype=np.int8)
+            for track, name in roles.items():
+                lookup[track] = ROLES.get(name, NO_ROLE)
+            role = lookup[cols["track"]]
+        else:
+            role = np.where(cols["channel"] == BASS_CHANNEL, BASS, MELODY).astype(np.int8)
+            drum = cols["channel"] == DRUM_CHANNEL
+            drum_roles = np.full(128, NO_ROLE, dtype=np.int8)
+            for pitch, name in GM_DRUMS.items():
+                drum_roles[pitch] = ROLES[name]
+            role[drum] = drum_roles[cols["pitch"][drum]]
+        number = len(self._bars)
+        self._columns.append((np.full(len(role), number, dtype=np.int64), role, cols["track"], cols["pitch"],
+                              cols["start"], cols["length"]))
+        self._bars.append(max(int(bars), 1))
+        mask = np.zeros(12, dtype=bool)
+        mask[[interval % 12 for interval in (scale if scale is not None else [0, 2, 4, 5, 7, 9, 11])]] = True
+        self._scales.append(mask)
+        return number
+
+    def add_midi(self, midi, bars=None, scale=None, components=None):
+        """
+        Add a MidiData (see midi_reader); components as for
+        MidiData.drum_matrix, bars default to the length of the file
+        """
+        roles = midi.track_components(components) if components is not None else None
+        return self.add(midi.notes, bars or midi.bars, scale, roles)
+
+    def columns(self):
+        """
+        Dict of the concatenated note columns: candidate, role, track, pitch, start, length
+        """
+        names = ("candidate", "role", "track", "pitch", "start", "length")
+        if not self._columns:
+            return {name: np.zeros(0, dtype=np.int64) for name in names}
+        return {name: np.concatenate(column) for name, column in zip(names, zip(*self._columns))}
+
+
+def _per_candidate(candidate, count, weights=None):
+    return np.bincount(candidate, weights=weights, minlength=count).astype(np.float64)
+
+
+def _ratio(numerator, denominator):
+    # nan там, где метрика неприменима (знаменатель 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1e-12), np.nan)
+
+
+def batch_metrics(batch):
+    """
+    Raw metric values of every candidate: dict metric -> float array (len(batch),)
+    (nan where a metric does not apply)
+    """
+    count = len(batch)
+    cols = batch.columns()
+    candidate, role, pitch = cols["candidate"], cols["role"], cols["pitch"].astype(np.int64)
+    step_ticks = batch.ticks_per_quarter / 4
+    steps = np.rint(cols["start"] / step_ticks).astype(np.int64)
+    bars = np.asarray(batch._bars, dtype=np.float64)
+    scales = np.asarray(batch._scales, dtype=bool).reshape(count, 12)
+    pitched = (role == MELODY) | (role == BASS)
+    sounding = role != NO_ROLE
+
+    # Соответствие гамме: доля времени звучания внутри гаммы
+    length = cols["length"].astype(np.float64)
+    in_scale = scales[candidate, pitch % 12]
+    scale = _ratio(_per_candidate(candidate[pitched], count, (length * in_scale)[pitched]),
+                   _per_candidate(candidate[pitched], count, length[pitched]))
+
+    density = _per_candidate(candidate[pitched], count) / bars
+
+    # Синкопы: вес доли каждого начала ноты
+    offbeat = np.array([0.0, 1.0, 0.5, 1.0])[steps % 4]
+    syncopation = _ratio(_per_candidate(candidate[sounding], count, offbeat[sounding]),
+                         _per_candidate(candidate[sounding], count))
+
+    # Плавность: средний интервал между соседними нотами мелодии, каждый
+    # трек (второй голос) отдельно
+    melody = np.flatnonzero(role == MELODY)
+    track = cols["track"]
+    order = melody[np.lexsort((cols["start"][melody], track[melody], candidate[melody]))]
+    same = (candidate[order[1:]] == candidate[order[:-1]]) & (track[order[1:]] == track[order[:-1]])
+    intervals = np.abs(np.diff(pitch[order]))[same].astype(np.float64)
+    owners = candidate[order[1:]][same]
+    smoothness = _ratio(_per_candidate(owners, count, intervals), _per_candidate(owners, count))
+
+    # Повторяемость: пересечение начал нот соседних тактов / объединение
+    bar = steps // 16
+    early = sounding & (bar < REPETITION_BARS)
+    grid = np.zeros((count, REPETITION_BARS, len(ROLES) * 16), dtype=bool)
+    grid[candidate[early], bar[early], role[early] * 16 + steps[early] % 16] = True
+    shared = (grid[:, 1:] & grid[:, :-1]).sum(axis=(1, 2))
+    either = (grid[:, 1:] | grid[:, :-1]).sum(axis=(1, 2))
+    repetition = _ratio(shared, either)
+    repetition[bars < 2] = np.nan
+
+    # Бас и бочка: доля начал баса на шаге с бочкой
+    kick_keys = np.unique(candidate[role == KICK] * (1 << 32) + steps[role == KICK])
+    bass = role == BASS
+    on_kick = np.isin(candidate[bass] * (1 << 32) + steps[bass], kick_keys)
+    alignment = _ratio(_per_candidate(candidate[bass], count, on_kick),
+                       _per_candidate(candidate[bass], count))
+    no_kick = _per_candidate(candidate[role == KICK], count) == 0
+    alignment[no_kick] = np.nan
+
+    return {"scale": scale, "density": density, "syncopation": syncopation, "smoothness": smoothness,
+            "repetition": repetition, "alignment": alignment}
+
+
+def metric_scores(metrics):
+    """
+    Map raw metrics (see batch_metrics) to 0..1, 1 = best
+    """
+    low, high = DENSITY_RANGE
+    density = metrics["density"]
+    with np.errstate(divide="ignore"):
+        outside = np.maximum(np.maximum(np.log(low / density), np.log(density / high)), 0)
+    return {
+        "scale": metrics["scale"],
+        "density": np.where(density > 0, np.exp(-2 * outside ** 2), 0.0),
+        "syncopation": np.clip(1 - np.abs(metrics["syncopation"] - SYNCOPATION_TARGET)
+                               / max(SYNCOPATION_TARGET, 1 - SYNCOPATION_TARGET), 0, 1),
+        "smoothness": np.clip(1 - (metrics["smoothness"] - SMOOTH_INTERVAL) / (ROUGH_INTERVAL - SMOOTH_INTERVAL),
+                              0, 1),
+        "repetition": np.clip(1 - np.abs(metrics["repetition"] - REPETITION_TARGET)
+                              / max(REPETITION_TARGET, 1 - REPETITION_TARGET), 0, 1),
+        "alignment": metrics["alignment"],
+    }
+
+
+def score_batch(batch, weights=None):
+    """
+    Score every candidate of a batch
+
+    Parameters:
+    - batch: CandidateBatch
+    - weights: dict metric -> weight (default WEIGHTS; 0 ignores a metric)
+
+    Returns a dict with the raw metrics (see batch_metrics) and "score",
+    the weighted mean of the mapped metrics that apply, in 0..1.
+    """
+    weights = WEIGHTS if weights is None else weights
+    metrics = batch_metrics(batch)
+    mapped = metric_scores(metrics)
+    total = np.zeros(len(batch))
+    weight_sum = np.zeros(len(batch))
+    for name, values in mapped.items():
+        weight = weights.get(name, 0.0)
+        if weight:
+            applies = ~np.isnan(values)
+            total += np.where(applies, values * weight, 0.0)
+            weight_sum += applies * weight
+    metrics["score"] = _ratio(total, weight_sum)
+    metrics["score"][np.isnan(metrics["score"])] = 0.0
+    return metrics
+
+
+def top_k(scores, k, groups=None):
+    """
+    Indices of the k best scores (highest first), per group if groups are given
+
+    Parameters:
+    - scores: array of scores
+    - k: number to keep (per group)
+    - groups: optional sequence of group labels (e.g. the style of every
+      candidate); the result is ordered by group, then by score
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if groups is None:
+        order = np.argsort(-scores, kind="stable")
+        return order[:k]
+    _, labels = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+    order = np.lexsort((-scores, labels))
+    ranked = labels[order]
+    first = np.flatnonzero(np.r_[True, ranked[1:] != ranked[:-1]])
+    rank = np.arange(len(order)) - np.repeat(first, np.diff(np.r_[first, len(order)]))
+    return order[rank < k]
@@ -0,0 +1,98 @@
+"""
+Counter-based seeding for reproducible beat catalogs.
+
+A catalog is defined by one catalog seed; pattern number N of the catalog
+is defined by (catalog seed, N) alone. Style, tempo and the generator seed
+of every pattern are drawn from a random.Random seeded with a SplitMix64
+mix of the pair, so any process can render pattern #1,000,000 directly,
+without generating patterns 0..999,999, and a catalog rendered by any
+number of workers in any order is identical.
+
+    params = catalog_pattern(7, 1000000)
+    # {"index": 1000000, "style": "Drill", "scale": [...], "tempo": 97,
+    #  "tempo_name": "Modern", "seed": ...}
+    render_catalog_pattern(7, 1000000, "beat_1000000.mid", duration=4)
+"""
+
+import random
+
+from fl_midi_generator.midi_generator import generate_hiphop_beat, hiphop_styles, random_hiphop_tempo
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+def _mix64(value):
+    # Финализатор SplitMix64: биективное перемешивание 64-битного числа
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & _MASK64
+    return value ^ (value >> 31)
+
+
+def pattern_seed(catalog_seed, index):
+    """
+    64-bit seed of pattern number index in the catalog catalog_seed
+
+    Parameters:
+    - catalog_seed: non-negative integer identifying the catalog
+    - index: non-negative pattern number
+
+    O(1) for any index; different indices of one catalog give unrelated seeds.
+    """
+    if catalog_seed < 0 or index < 0:
+        raise ValueError("catalog_seed and index must be non-negative")
+    # Ключ каталога перемешивается отдельно, чтобы соседние каталоги не
+    # давали сдвинутые копии одной и той же последовательности
+    key = _mix64(catalog_seed & _MASK64) ^ (catalog_seed >> 64)
+    return _mix64((key + (index + 1) * _GOLDEN_GAMMA) & _MASK64)
+
+
+def pattern_rng(catalog_seed, index):
+    """
+    Independent random.Random for pattern number index of the catalog
+    """
+    return random.Random(pattern_seed(catalog_seed, index))
+
+
+def catalog_pattern(catalog_seed, index, styles=None):
+    """
+    Parameters of pattern number index in the catalog catalog_seed
+
+    Parameters:
+    - catalog_seed, index: see pattern_seed
+    - styles: optional list of style names to choose from (default: all
+      hiphop_styles)
+
+    Returns a dict with index, style, scale, tempo, tempo_name and seed
+    (the seed for generate_hiphop_beat).
+    """
+    rng = pattern_rng(catalog_seed, index)
+    style = rng.choice(list(styles or hiphop_styles))
+    if style not in hiphop_styles:
+        raise ValueError(f"unknown style {style!r}, expected one of {sorted(hiphop_styles)}")
+    tempo, tempo_name = random_hiphop_tempo(rng)
+    return {
+        "index": index,
+        "style": style,
+        "scale": list(hiphop_styles[style]),
+        "tempo": tempo,
+        "tempo_name": tempo_name,
+        "seed": rng.getrandbits(64),
+    }
+
+
+def render_catalog_pattern(catalog_seed, index, output_file=None, duration=4, components=None,
+                           styles=None, **kwargs):
+    """
+    Render pattern number index of the catalog catalog_seed
+
+    Parameters:
+    - catalog_seed, index, styles: see catalog_pattern
+    - output_file, duration, components: same as for generate_hiphop_beat
+    - kwargs: passed to generate_hiphop_beat (stream, metrics)
+
+    Returns what generate_hiphop_beat returns (bytes for output_file=None).
+    """
+    pattern = catalog_pattern(catalog_seed, index, styles)
+    return generate_hiphop_beat(output_file, duration, pattern["tempo"], pattern["scale"], components,
+                                seed=pattern["seed"], **kwargs)
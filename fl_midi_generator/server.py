@@ -0,0 +1,283 @@
+"""
+Persistent local generation server.
+
+Keeps the generators imported and warm in a pool of worker processes and
+answers JSON generation requests with MIDI bytes, so a beat costs a few
+milliseconds instead of a fresh Python start.
+
+    python -m fl_midi_generator.server --port 8765 --workers 4
+    python -m fl_midi_generator.server --unix /tmp/fl_midi_generator.sock
+
+Endpoints:
+- POST /render  JSON generation request -> audio/midi body
+- GET /metrics  request count, errors and p50/p90/p99 latency (JSON)
+- GET /health   "ok"
+
+A generation request has the same fields as a batch job spec (see
+batch.job_to_kwargs) without "output", e.g.
+
+    {"style": "Trap", "tempo": 92, "duration": 4, "seed": 7}
+"""
+
+import argparse
+import json
+import math
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fl_midi_generator.batch import job_to_kwargs
+from fl_midi_generator.midi_generator import HIPHOP_COMPONENTS, generate_random_midi
+from fl_midi_generator.midi_writer import tempo_to_microseconds
+
+# Параметры, которые клиент может передать. Список явный: новые параметры
+# generate_random_midi (output_file, stream, cache, metrics - их сервер
+# задает сам) не попадают в API без решения
+ALLOWED_PARAMS = frozenset({
+    "style", "components", "catalog_seed", "index",
+    "tracks", "duration", "tempo", "scale", "even_rhythm", "repeat_every", "base_octave", "octave_range",
+    "generate_second_voice", "second_voice_octave_offset", "hiphop_style", "hiphop_components", "seed",
+})
+
+KNOWN_COMPONENTS = frozenset(HIPHOP_COMPONENTS) | {"drums"}
+MIN_TEMPO = 60000000 / ((1 << 24) - 1)  # самый медленный темп, который влезает в 3 байта
+
+LATENCY_WINDOW = 10000  # число последних запросов для перцентилей
+
+
+def _render(kwargs):
+    # Выполняется в рабочем процессе
+    return generate_random_midi(None, **kwargs)
+
+
+def _warm_up():
+    # Первый рендер в каждом рабочем процессе: импорты и кэши уже прогреты,
+    # когда придет настоящий запрос
+    generate_random_midi(None, duration=1, hiphop_style=True, seed=0)
+
+
+def request_to_kwargs(request):
+    """
+    Validate a JSON generation request and convert it to generate_random_midi kwargs
+
+    Raises ValueError for unknown or forbidden fields and for values the
+    generator cannot render (tempo, duration, component names).
+    """
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+    unknown = set(request) - ALLOWED_PARAMS
+    if unknown:
+        raise ValueError(f"unsupported request fields: {sorted(unknown)}")
+    kwargs = job_to_kwargs(dict(request, output=None))
+    del kwargs["output_file"]
+    _check_values(kwargs)
+    return kwargs
+
+
+def _check_values(kwargs):
+    # Значения проверяются до рабочего процесса: ошибка клиента - 400, а не 500
+    tempo = kwargs.get("tempo")
+    if tempo is not None:
+        # Темп хранится в MIDI как микросекунды на четверть, 3 байта
+        if (isinstance(tempo, bool) or not isinstance(tempo, (int, float)) or not tempo > 0
+                or not 1 <= tempo_to_microseconds(tempo) < 1 << 24):
+            raise ValueError(f"tempo must be a number of BPM from {MIN_TEMPO:.2f} to 60000000, got {tempo!r}")
+    duration = kwargs.get("duration")
+    if duration is not None and (isinstance(duration, bool) or not isinstance(duration, int) or duration < 1):
+        raise ValueError(f"duration must be a positive number of bars, got {duration!r}")
+    components = kwargs.get("hiphop_components")
+    if components is not None:
+        names = [components] if isinstance(components, str) else components
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError("components must be a list of component names")
+        unknown = sorted(set(names) - KNOWN_COMPONENTS)
+        if unknown:
+            raise ValueError(f"unknown components {unknown}, expected some of {sorted(KNOWN_COMPONENTS)}")
+
+
+def percentile(sorted_values, fraction):
+    # Перцентиль по уже отсортированному списку (ближайший ранг)
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class GenerationService:
+    """
+    Renders requests in a warm worker pool and records latency metrics
+
+    Parameters:
+    - workers: number of worker processes (None = number of CPU cores,
+      0 = render in the calling thread, without a pool)
+    """
+
+    def __init__(self, workers=None):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.executor = None
+        if self.workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up)
+            # Запускаем все процессы сразу, а не при первых запросах
+            for future in [self.executor.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+        else:
+            _warm_up()
+        self.started = time.time()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def render(self, request):
+        """
+        Render a generation request (dict) and return the MIDI bytes
+        """
+        started = time.perf_counter()
+        try:
+            kwargs = request_to_kwargs(request)
+            if self.executor is None:
+                data = _render(kwargs)
+            else:
+                data = self.executor.submit(_render, kwargs).result()
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(elapsed)
+        return data
+
+    def metrics(self):
+        """
+        Request counters and latency percentiles in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            requests, errors = self.requests, self.errors
+        return {
+            "requests": requests,
+            "errors": errors,
+            "workers": self.workers,
+            "uptime_s": round(time.time() - self.started, 1),
+            "latency_window": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: клиент не платит за новое соединение
+    server_version = "FLMidiGenerator/1.0"
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/health":
+            self._send(200, b"ok", "text/plain")
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            data = self.server.service.render(request)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send(200, data, "audio/midi")
+
+    def address_string(self):
+        # У Unix-сокета нет адреса клиента
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None, quiet=True):
+    """
+    Create an HTTP server for the service (localhost TCP or a Unix socket)
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = UnixHTTPServer(unix_socket, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        server.daemon_threads = True
+        server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fl_midi_generator.server",
+        description="Serve MIDI generation requests from a warm worker pool")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: number of CPU cores, 0 = no pool)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    service = GenerationService(args.workers)
+    server = make_server(service, args.host, args.port, args.unix, quiet=not args.verbose)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Serving MIDI generation on {where} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
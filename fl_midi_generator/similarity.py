@@ -0,0 +1,274 @@
+"""
+Similarity search over drum patterns ("more beats like this one").
+
+Every pattern is reduced to its kick, snare and hihat hit grids, tiled to
+four bars and bit-packed into one uint64 per drum (bit N = sixteenth step
+N), the same grids the beat corpus stores. The index keeps them in
+one contiguous array per drum together with the hit counts, so a query
+over a million patterns is a handful of vectorized operations per drum:
+
+    hamming = popcount(a ^ b)
+    jaccard = 1 - |a & b| / (|a| + |b| - |a & b|)
+
+and argpartition picks the k nearest without sorting everything.
+
+    index = DrumIndex.from_corpus(Corpus("beats.corpus"))
+    ids, distances = index.query_id(123456, k=10)
+    index.add_beat(duration=4, seed=99)       # incremental insert
+
+Distances are averaged over the drums (optionally weighted) and lie in
+0..1. density_weight and syncopation_weight add the difference of the hit
+density (hits per step) and of the syncopation (share of hits on the
+"e" and "a" sixteenths) of every drum to the distance.
+"""
+
+import numpy as np
+
+from fl_midi_generator.drum_matrix import DRUM_COMPONENTS, STEPS_PER_BAR
+
+GRID_STEPS = 64  # шагов в uint64-сетке
+METRICS = ("hamming", "jaccard")
+OFFBEAT_MASK = np.uint64(sum(1 << step for step in range(1, GRID_STEPS, 2)))
+
+# Таблица популяции бит для байта, если в NumPy нет bitwise_count (< 2.0)
+_BYTE_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """
+    Number of set bits of every element of a uint64 array, as uint8
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    counts = _BYTE_POPCOUNT[values.reshape(-1).view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+    return counts.reshape(values.shape)
+
+
+def tile_grids(grids, loop_bars):
+    """
+    Repeat loop grids to GRID_STEPS steps
+
+    Parameters:
+    - grids: (patterns x drums) uint64 grids with the loop in the low bits
+    - loop_bars: loop length in bars per pattern (1..4), scalar or array
+    """
+    grids = np.asarray(grids, dtype=np.uint64)
+    steps = np.broadcast_to(np.asarray(loop_bars, dtype=np.uint64) * STEPS_PER_BAR, grids.shape[:1])
+    steps = steps.reshape(-1, *([1] * (grids.ndim - 1)))
+    tiled = grids.copy()
+    # Луп из 1, 2 или 3 тактов сдвигаем на длину лупа, пока сетка не заполнится
+    for repeat in range(1, GRID_STEPS // STEPS_PER_BAR):
+        shift = steps * np.uint64(repeat)
+        fits = shift < GRID_STEPS
+        tiled |= np.where(fits, grids << np.where(fits, shift, np.uint64(0)), np.uint64(0))
+    return tiled
+
+
+def matrix_grids(matrices):
+    """
+    Bit-packed grids of drum matrices
+
+    Parameters:
+    - matrices: (components x steps) velocity matrix or a batch of them
+      (patterns x components x steps), rows in DRUM_COMPONENTS order, as
+      made by drum_matrix.generate_drum_patterns
+
+    Patterns shorter than GRID_STEPS are repeated, longer ones cut.
+    Returns (patterns x components) uint64.
+    """
+    matrices = np.asarray(matrices)
+    if matrices.ndim == 2:
+        matrices = matrices[np.newaxis]
+    steps = matrices.shape[2]
+    if steps < GRID_STEPS:
+        matrices = np.tile(matrices, (1, 1, -(-GRID_STEPS // steps)))
+    hits = matrices[:, :, :GRID_STEPS] != 0
+    return np.packbits(hits, axis=2, bitorder="little").view("<u8")[:, :, 0].astype(np.uint64)
+
+
+class DrumIndex:
+    """
+    Growable index of bit-packed drum grids with top-k nearest queries
+
+    Parameters:
+    - capacity: initial number of patterns to reserve room for
+
+    Patterns get ids in insertion order (0, 1, 2, ...); an index built with
+    from_corpus uses the corpus indices. Inserting is amortized O(1): the
+    arrays grow by doubling.
+    """
+
+    def __init__(self, capacity=1024):
+        capacity = max(int(capacity), 1)
+        drums = len(DRUM_COMPONENTS)
+        # Строка на барабан: запрос идет по непрерывным колонкам
+        self._grids = np.zeros((drums, capacity), dtype=np.uint64)
+        self._counts = np.zeros((drums, capacity), dtype=np.uint8)
+        self._syncopation = np.zeros((drums, capacity), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def grids(self):
+        """
+        (patterns x drums) uint64 grids, a view of the index
+        """
+        return self._grids[:, :self._size].T
+
+    def _reserve(self, size):
+        capacity = self._grids.shape[1]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ("_grids", "_counts", "_syncopation"):
+            old = getattr(self, name)
+            new = np.zeros((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :self._size] = old[:, :self._size]
+            setattr(self, name, new)
+
+    def add_grids(self, grids):
+        """
+        Insert tiled (patterns x drums) uint64 grids, returns their ids
+        """
+        grids = np.asarray(grids, dtype=np.uint64).reshape(-1, len(DRUM_COMPONENTS))
+        start, end = self._size, self._size + len(grids)
+        self._reserve(end)
+        counts = popcount(grids)
+        self._grids[:, start:end] = grids.T
+        self._counts[:, start:end] = counts.T
+        self._syncopation[:, start:end] = (popcount(grids & OFFBEAT_MASK) / np.maximum(counts, 1)).T
+        self._size = end
+        return np.arange(start, end)
+
+    def add_matrices(self, matrices):
+        """
+        Insert drum matrices (see matrix_grids), returns their ids
+        """
+        return self.add_grids(matrix_grids(matrices))
+
+    def add_records(self, records):
+        """
+        Insert corpus records (corpus.RECORD_DTYPE), returns their ids
+        """
+        records = np.atleast_1d(records)
+        return self.add_grids(tile_grids(records["drums"], records["loop_bars"]))
+
+    def add_beat(self, duration=4, tempo=90, scale=None, components=None, seed=None, style=None):
+        """
+        Generate a beat as generate_hiphop_beat does and insert its drums,
+        returns its id
+        """
+        from fl_midi_generator.corpus import pack_beat
+
+        record, _ = pack_beat(duration, tempo, scale, components, seed, style)
+        return int(self.add_records(record)[0])
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Index all beats of a corpus.Corpus; ids are the corpus indices
+        """
+        index = cls(len(corpus))
+        # Колонки записей читаются прямо из mmap, ноты не разбираются
+        index.add_records(corpus.records)
+        return index
+
+    def distances(self, grid, metric="hamming", weights=None, density_weight=0.0,
+                  syncopation_weight=0.0):
+        """
+        Distance from one tiled grid to every pattern of the index
+
+        Parameters:
+        - grid: uint64 grid per drum (see matrix_grids, tile_grids)
+        - metric: "hamming" (differing steps / GRID_STEPS) or "jaccard"
+        - weights: weight per drum (DRUM_COMPONENTS order), default equal
+        - density_weight, syncopation_weight: weight of the density and
+          syncopation difference added to the distance
+
+        Returns a float32 array of len(index) distances in 0..1 (plus the
+        feature terms).
+        """
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r}, expected one of {METRICS}")
+        grid = np.asarray(grid, dtype=np.uint64).reshape(len(DRUM_COMPONENTS))
+        weights = np.ones(len(DRUM_COMPONENTS), dtype=np.float32) if weights is None \
+            else np.asarray(weights, dtype=np.float32)
+        weights = weights / weights.sum()
+
+        size = self._size
+        query_counts = popcount(grid)
+        result = np.zeros(size, dtype=np.float32)
+        for drum, weight in enumerate(weights):
+            if not weight:
+                continue
+            grids = self._grids[drum, :size]
+            counts = self._counts[drum, :size]
+            if metric == "hamming":
+                result += popcount(grids ^ grid[drum]) * np.float32(weight / GRID_STEPS)
+            else:
+                common = popcount(grids & grid[drum])
+                union = (counts + query_counts[drum] - common).astype(np.float32)
+                # Две пустые дорожки совпадают полностью
+                result += np.float32(weight) * np.where(union > 0, 1 - common / np.maximum(union, 1), 0)
+            if density_weight:
+                difference = np.abs(counts.astype(np.int16) - int(query_counts[drum]))
+                result += difference * np.float32(density_weight * weight / GRID_STEPS)
+            if syncopation_weight:
+                syncopation = popcount(grid[drum] & OFFBEAT_MASK) / np.float32(max(int(query_counts[drum]), 1))
+                result += np.float32(syncopation_weight * weight) * np.abs(self._syncopation[drum, :size] - syncopation)
+        return result
+
+    def query(self, grid, k=10, mask=None, exclude=None, **options):
+        """
+        The k patterns nearest to a grid
+
+        Parameters:
+        - grid: uint64 grid per drum
+        - k: number of results
+        - mask: optional boolean array over the index; only patterns where
+          it is true are returned (e.g. corpus.records["style"] == 3)
+        - exclude: optional id to leave out (the query pattern itself)
+        - options: metric, weights, density_weight, syncopation_weight,
+          see distances
+
+        Returns (ids, distances), nearest first.
+        """
+        distances = self.distances(grid, **options)
+        candidates = None
+        if mask is not None:
+            candidates = np.flatnonzero(np.asarray(mask)[:self._size])
+            distances = distances[candidates]
+        if exclude is not None:
+            keep = np.ones(len(distances), dtype=bool)
+            position = exclude if candidates is None else np.searchsorted(candidates, exclude)
+            if position < len(distances) and (candidates is None or candidates[position] == exclude):
+                keep[position] = False
+            if not keep.all():
+                candidates = np.flatnonzero(keep) if candidates is None else candidates[keep]
+                distances = distances[keep]
+        k = min(k, len(distances))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        nearest = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        # Отобранные k сортируем по расстоянию, при равенстве - по id
+        nearest = nearest[np.lexsort((nearest, distances[nearest]))]
+        ids = nearest if candidates is None else candidates[nearest]
+        return ids, distances[nearest]
+
+    def query_id(self, pattern_id, k=10, **options):
+        """
+        The k patterns nearest to a pattern of the index, without itself
+        """
+        if not 0 <= pattern_id < len(self):
+            raise IndexError(f"pattern id {pattern_id} out of range (0..{len(self) - 1})")
+        return self.query(self._grids[:, pattern_id], k, exclude=pattern_id, **options)
+
+    def query_matrix(self, matrix, k=10, **options):
+        """
+        The k patterns nearest to a drum matrix (components x steps)
+        """
+        return self.query(matrix_grids(matrix)[0], k, **options)
@@ -0,0 +1,196 @@
+"""
+Re-keying and re-scaling of generated notes through pitch lookup tables.
+
+All style presets are C-rooted. Instead of generating a beat again for
+every key, a generated pattern is moved to another root (and optionally
+snapped to another scale) by one table lookup per note:
+
+    keys = render_hiphop_keys(duration=4, tempo=90, style="Trap", seed=7)
+    for root, data in keys.items():
+        with open(f"trap_{NOTE_NAMES[root]}.mid", "wb") as f:
+            f.write(data)
+
+A table maps each of the 128 MIDI pitches to its pitch in the new key:
+- re-scaling snaps the pitch class to the nearest one of the target scale
+  (ties go down), so scale degrees that exist in both scales stay put;
+- the root shift goes the short way round (-5..+6 semitones), so the
+  register moves as little as possible;
+- a pitch that leaves its register (e.g. the 84-107 melody range) is
+  folded back by octaves.
+
+Tables are built once per (root, scale, source scale, register) and cached.
+Drum channels are never remapped.
+"""
+
+import random
+from functools import lru_cache
+
+from fl_midi_generator.drum_matrix import DRUM_CHANNEL
+from fl_midi_generator.midi_generator import (
+    BASS_CHANNEL, MELODY_CHANNEL, _normalize_components, hiphop_styles,
+    iter_hiphop_beat_bars,
+)
+from fl_midi_generator.midi_writer import write_midi
+from fl_midi_generator.note_buffer import NOTE_FIELDS, NoteBuffer
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FULL_REGISTER = (0, 127)
+MELODY_REGISTER = (84, 107)  # мелодия хип-хоп бита: 5-6 октавы
+BASS_REGISTER = (24, 59)
+MIDI_CHANNELS = 16
+
+
+def root_shift(root):
+    """
+    Semitone shift from C to root, the short way round (-5..+6)
+    """
+    root %= 12
+    return root if root <= 6 else root - 12
+
+
+def _snap(pitch_class, scale):
+    # Ближайшая ступень гаммы по кругу; при равенстве - вниз
+    best = None
+    for degree in scale:
+        up = (degree - pitch_class) % 12
+        down = (pitch_class - degree) % 12
+        move = -down if down <= up else up
+        if best is None or abs(move) < abs(best) or (abs(move) == abs(best) and move < best):
+            best = move
+    return best
+
+
+@lru_cache(maxsize=None)
+def _pitch_table(root, scale, source_scale, low, high):
+    shift = root_shift(root)
+    snaps = None
+    if scale is not None and scale != source_scale:
+        snaps = [_snap(pitch_class, scale) for pitch_class in range(12)]
+    table = bytearray(128)
+    for pitch in range(128):
+        mapped = pitch + shift
+        if snaps is not None:
+            mapped += snaps[pitch % 12]
+        if high - low >= 11:
+            while mapped > high:
+                mapped -= 12
+            while mapped < low:
+                mapped += 12
+        table[pitch] = min(max(mapped, 0), 127)
+    return bytes(table)
+
+
+def _scale_key(scale):
+    return None if scale is None else tuple(sorted({degree % 12 for degree in scale}))
+
+
+def pitch_table(root, scale=None, source_scale=None, register=FULL_REGISTER):
+    """
+    128-byte lookup table: source pitch -> pitch in the new key
+
+    Parameters:
+    - root: new root, 0 = C ... 11 = B (the source is C-rooted)
+    - scale: target scale as C-rooted degrees (None = keep the scale)
+    - source_scale: scale the notes were generated in
+    - register: (lowest, highest) pitch; pitches outside are folded back
+      by octaves
+    """
+    low, high = register
+    return _pitch_table(root % 12, _scale_key(scale), _scale_key(source_scale), low, high)
+
+
+def style_table(root, style, source_style=None, register=FULL_REGISTER):
+    """
+    Pitch table that moves notes of source_style into style at the given root
+    """
+    source = hiphop_styles[source_style or style]
+    return pitch_table(root, hiphop_styles[style], source, register)
+
+
+def channel_tables(root, scale=None, source_scale=None, registers=None, keep_channels=(DRUM_CHANNEL,)):
+    """
+    (16 x 128) uint8 lookup: [channel, pitch] -> new pitch
+
+    Parameters:
+    - root, scale, source_scale: see pitch_table
+    - registers: dict channel -> (lowest, highest) for channels with their
+      own register (others use the full MIDI range)
+    - keep_channels: channels that are not remapped (drums)
+    """
+    import numpy as np
+
+    registers = registers or {}
+    rows = []
+    for channel in range(MIDI_CHANNELS):
+        if channel in keep_channels:
+            rows.append(bytes(range(128)))
+        else:
+            rows.append(pitch_table(root, scale, source_scale, registers.get(channel, FULL_REGISTER)))
+    return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(MIDI_CHANNELS, 128)
+
+
+def transpose_notes(notes, root, scale=None, source_scale=None, registers=None,
+                    keep_channels=(DRUM_CHANNEL,)):
+    """
+    Return a new NoteBuffer moved to another key (and scale)
+
+    Parameters:
+    - notes: NoteBuffer or list of note tuples
+    - root, scale, source_scale: see pitch_table
+    - registers, keep_channels: see channel_tables
+
+    One table lookup per note; times, tracks and velocities are unchanged.
+    """
+    notes = NoteBuffer.from_notes(notes)
+    cols = notes.columns()
+    lut = channel_tables(root, scale, source_scale, registers, keep_channels)
+    result = NoteBuffer()
+    result.extend_columns(*(lut[cols["channel"], cols["pitch"]] if name == "pitch" else cols[name]
+                            for name, _, _ in NOTE_FIELDS))
+    return result
+
+
+def render_keys(notes, num_tracks, tempo, roots=range(12), scale=None, source_scale=None,
+                registers=None, keep_channels=(DRUM_CHANNEL,)):
+    """
+    Serialize one set of notes in several keys
+
+    Parameters:
+    - notes: NoteBuffer or list of note tuples (C-rooted)
+    - num_tracks, tempo: see midi_writer.write_midi
+    - roots: roots to render, 0 = C ... 11 = B
+    - scale, source_scale, registers, keep_channels: see transpose_notes
+
+    Returns a dict root -> MIDI file bytes.
+    """
+    notes = NoteBuffer.from_notes(notes)
+    return {root: write_midi(transpose_notes(notes, root, scale, source_scale, registers, keep_channels),
+                             num_tracks, tempo)
+            for root in roots}
+
+
+def render_hiphop_keys(duration=4, tempo=90, style="Trap", components=None, seed=None,
+                       roots=range(12), target_style=None):
+    """
+    Generate one hip-hop beat and render it in several keys
+
+    Parameters:
+    - duration, tempo, components, seed: same as for generate_hiphop_beat
+    - style: style preset the beat is generated in (its C-rooted scale)
+    - roots: roots to render, 0 = C ... 11 = B
+    - target_style: optional other style preset whose scale the bass and
+      melody are snapped to
+
+    The beat is generated once; every key is a table remap of the pitch
+    column plus serialization. Drums stay unchanged, the melody stays in
+    its 84-107 register. Returns a dict root -> MIDI file bytes.
+    """
+    components = _normalize_components(components)
+    scale = hiphop_styles[style]
+    rng = random.Random(seed) if seed is not None else random
+    notes = NoteBuffer()
+    for bar in iter_hiphop_beat_bars(duration, scale, components, rng):
+        notes.extend(bar)
+    target_scale = hiphop_styles[target_style] if target_style else None
+    registers = {MELODY_CHANNEL: MELODY_REGISTER, BASS_CHANNEL: BASS_REGISTER}
+    return render_keys(notes, len(components), tempo, roots, target_scale, scale, registers)
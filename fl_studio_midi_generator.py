@@ -1,67 +1,170 @@
 import flpianoroll
 import random
+import threading
+from array import array
+from collections import deque
 
-def generate_fl_studio_pattern(pattern_name="Generated Pattern"):
+# Define C major scale (you can change to other scales)
+SCALE = [0, 2, 4, 5, 7, 9, 11]  # C major
+BASE_NOTE = 60  # C4
+PATTERN_BARS = 2
+REST_CHANCE = 0.2  # 20% chance for rest
+POOL_SIZE = 8  # сколько паттернов держать готовыми
+
+# Каждая нота паттерна - 4 числа подряд в плоском массиве
+NOTE_FIELDS = 4  # time, length, note, velocity
+
+def pattern_notes(ppq, bars=PATTERN_BARS, scale=SCALE, base_note=BASE_NOTE, rng=random):
+    """
+    Roll a random pattern up front, without touching the piano roll
+
+    Parameters:
+    - ppq: pulses per quarter note of the project
+    - bars: pattern length in bars (4/4)
+    - scale: list of notes in the scale
+    - base_note: lowest MIDI note
+    - rng: random number generator (random module or random.Random)
+
+    Returns a flat array("i") with time, length, note, velocity per note.
+    """
+    notes = array("i")
+    # Random note duration (1/16 to 1/2 note)
+    durations = [ppq // 4, ppq // 2, ppq, ppq * 2]  # 1/16, 1/8, 1/4, 1/2 notes
+    total_ticks = ppq * 4 * bars
+
+    current_tick = 0
+    while current_tick < total_ticks:
+        duration = rng.choice(durations)
+
+        if rng.random() > REST_CHANCE:
+            # Select random note from scale
+            note = base_note + rng.choice(scale) + rng.randint(0, 2) * 12
+            notes.extend((current_tick, duration, note, rng.randint(80, 110)))
+
+        # Move forward in time
+        current_tick += duration
+
+    return notes
+
+class PatternPool:
+    """
+    Patterns pre-generated by a background thread
+
+    Parameters:
+    - ppq: pulses per quarter note the patterns are generated for
+    - size: number of patterns kept ready
+    - seed: optional seed, the pool then yields a reproducible sequence
+    - bars, scale, base_note: see pattern_notes
+
+    take() returns a ready pattern at once; if the pool is empty, the
+    pattern is generated in the calling thread instead of waiting.
+    """
+
+    def __init__(self, ppq, size=POOL_SIZE, seed=None, bars=PATTERN_BARS, scale=SCALE, base_note=BASE_NOTE):
+        self.ppq = ppq
+        self.size = size
+        self.bars = bars
+        self.scale = scale
+        self.base_note = base_note
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._patterns = deque()
+        self._changed = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._fill, name="PatternPool", daemon=True)
+        self._thread.start()
+
+    def _generate(self):
+        with self._rng_lock:
+            return pattern_notes(self.ppq, self.bars, self.scale, self.base_note, self._rng)
+
+    def _fill(self):
+        while True:
+            with self._changed:
+                while len(self._patterns) >= self.size and not self._closed:
+                    self._changed.wait()
+                if self._closed:
+                    return
+            notes = self._generate()
+            with self._changed:
+                self._patterns.append(notes)
+                self._changed.notify_all()
+
+    def take(self):
+        """
+        Next pattern as a flat note array (see pattern_notes)
+        """
+        with self._changed:
+            if self._patterns:
+                notes = self._patterns.popleft()
+                self._changed.notify_all()
+                return notes
+        return self._generate()
+
+    def wait_full(self, timeout=None):
+        """
+        Block until the pool holds size patterns (e.g. before a benchmark)
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self._patterns) >= self.size, timeout)
+
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+
+def insert_notes(notes, channel):
+    """
+    Add a precomputed flat note array to the selected pattern in one pass
+
+    No random numbers are drawn here: the loop only unpacks the array and
+    calls addNote, so the scripting thread is busy as short as possible.
+    """
+    add_note = flpianoroll.score.addNote
+    for i in range(0, len(notes), NOTE_FIELDS):
+        add_note(time=notes[i], length=notes[i + 1], note=notes[i + 2],
+                 velocity=notes[i + 3], channel=channel)
+    return len(notes) // NOTE_FIELDS
+
+def generate_fl_studio_pattern(pattern_name="Generated Pattern", pool=None, bars=PATTERN_BARS):
     """
     Generate a random MIDI pattern directly in FL Studio
-    
+
+    Parameters:
+    - pattern_name: name of the new pattern
+    - pool: optional PatternPool; a pre-generated pattern is taken from it
+      when it matches the project PPQ and the length
+    - bars: pattern length in bars
+
     Note: This script must be run from within FL Studio using its Python scripting interface
     """
     try:
         # Create a new pattern
         pattern = flpianoroll.score.createPattern(pattern_name)
-        
+
         # Select the pattern for editing
         flpianoroll.score.selectPattern(pattern)
-        
+
         # Get active channel
         channel_index = flpianoroll.score.getActiveChannel()
-        
-        # Define C major scale (you can change to other scales)
-        scale = [0, 2, 4, 5, 7, 9, 11]  # C major
-        
-        # Generate random notes (2 bars)
-        base_note = 60  # C4
-        
+
         # Get current PPQ (pulses per quarter note) from FL Studio
         ppq = flpianoroll.score.PPQ()
-        
-        # Loop for 2 bars (assuming 4/4 time signature = 8 beats)
-        total_ticks = ppq * 8
-        
-        current_tick = 0
-        while current_tick < total_ticks:
-            # Random note duration (1/16 to 1/2 note)
-            durations = [ppq/4, ppq/2, ppq, ppq*2]  # 1/16, 1/8, 1/4, 1/2 notes
-            duration = random.choice(durations)
-            
-            # 20% chance for rest
-            if random.random() > 0.2:
-                # Select random note from scale
-                note_offset = random.choice(scale)
-                octave_offset = random.randint(0, 2) * 12
-                note = base_note + note_offset + octave_offset
-                
-                # Random velocity
-                velocity = random.randint(80, 110)
-                
-                # Add note to pattern
-                flpianoroll.score.addNote(
-                    time=current_tick,
-                    length=duration,
-                    note=note,
-                    velocity=velocity,
-                    channel=channel_index
-                )
-            
-            # Move forward in time
-            current_tick += duration
-        
+
+        # Ноты готовы заранее - в FL передается уже готовый массив
+        if pool is not None and pool.ppq == ppq and pool.bars == bars:
+            notes = pool.take()
+        else:
+            notes = pattern_notes(ppq, bars)
+
+        insert_notes(notes, channel_index)
+
         return "Pattern successfully generated in FL Studio!"
-        
+
     except Exception as e:
         return f"Error: {str(e)}"
 
 # When run directly in FL Studio, this will execute
 if __name__ == "__main__":
-    print(generate_fl_studio_pattern("Random Melody"))
\ No newline at end of file
+    print(generate_fl_studio_pattern("Random Melody"))